@@ -0,0 +1,189 @@
+"""Booking analytics served from incrementally maintained rollups.
+
+Every flush that creates, edits or deletes a Booking adjusts the matching
+BookingRollup rows on the same connection, so the rollups commit or roll
+back together with the booking itself. The analytics page then reads only
+the rollup table. `flask analytics rebuild-rollups` recomputes it from the
+Booking table in place, one chunk of cars at a time.
+"""
+from collections import defaultdict
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, event, extract, func, inspect, select
+
+from app import app, db
+from availability import as_datetime
+from db_upsert import upsert
+from models import Booking, BookingRollup, Car
+
+ROLLUP_FIELDS = ('car_id', 'start_date', 'end_date', 'total_cost')
+# Cars per transaction when rebuilding
+CAR_CHUNK = 500
+
+
+def _rollup_key_and_values(car_id, start_date, end_date, total_cost):
+    start_date, end_date = as_datetime(start_date), as_datetime(end_date)
+    return (car_id, start_date.date()), (1, (end_date - start_date).days, total_cost or 0.0)
+
+
+def _previous_values(obj):
+    # Committed values of a booking being edited or deleted in this flush
+    state = inspect(obj)
+    values = []
+    for name in ROLLUP_FIELDS:
+        history = state.attrs[name].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(obj, name))
+    return values
+
+
+def _changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in ROLLUP_FIELDS)
+
+
+def apply_rollup_deltas(connection, deltas):
+    """Add {(car_id, day): [bookings, booked_days, revenue]} onto the rollup table."""
+    rows = [
+        {'car_id': car_id, 'day': day, 'bookings': b, 'booked_days': d, 'revenue': r}
+        for (car_id, day), (b, d, r) in deltas.items()
+        if b or d or r
+    ]
+    upsert(
+        connection, BookingRollup.__table__, rows, ['car_id', 'day'],
+        lambda t, ex: {
+            'bookings': t.bookings + ex.bookings,
+            'booked_days': t.booked_days + ex.booked_days,
+            'revenue': t.revenue + ex.revenue,
+        },
+    )
+
+
+def _accumulate(deltas, sign, values):
+    key, (bookings, days, revenue) = _rollup_key_and_values(*values)
+    delta = deltas[key]
+    delta[0] += sign * bookings
+    delta[1] += sign * days
+    delta[2] += sign * revenue
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_rollups(session, flush_context):
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            _accumulate(deltas, 1, [getattr(obj, name) for name in ROLLUP_FIELDS])
+    for obj in session.dirty:
+        if isinstance(obj, Booking) and _changed(obj):
+            _accumulate(deltas, -1, _previous_values(obj))
+            _accumulate(deltas, 1, [getattr(obj, name) for name in ROLLUP_FIELDS])
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            _accumulate(deltas, -1, _previous_values(obj))
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+def bookings_per_month():
+    year = extract('year', BookingRollup.day).label('year')
+    month = extract('month', BookingRollup.day).label('month')
+    rows = db.session.query(
+        year, month, func.sum(BookingRollup.bookings).label('bookings_count')
+    ).group_by(year, month).order_by(year, month).all()
+    return [
+        {'month': f'{int(row.year):04d}-{int(row.month):02d}', 'bookings_count': int(row.bookings_count)}
+        for row in rows
+        if row.bookings_count
+    ]
+
+
+def popular_cars(limit=5):
+    totals = db.session.query(
+        BookingRollup.car_id,
+        func.sum(BookingRollup.bookings).label('booking_count'),
+        func.sum(BookingRollup.revenue).label('revenue'),
+    ).group_by(BookingRollup.car_id).subquery()
+    return db.session.query(
+        Car.make, Car.model, totals.c.booking_count, totals.c.revenue
+    ).join(totals, totals.c.car_id == Car.id).filter(
+        totals.c.booking_count > 0
+    ).order_by(totals.c.booking_count.desc()).limit(limit).all()
+
+
+def _lock_rollups(connection, car_ids):
+    # On SQLite this takes the database write lock before the chunk's bookings
+    # are read, so no booking flush can commit between the read and the write;
+    # on PostgreSQL it locks the chunk's rollup rows, which listeners wait on
+    table = BookingRollup.__table__
+    connection.execute(
+        table.update().where(table.c.car_id.in_(car_ids)).values(bookings=table.c.bookings)
+    )
+
+
+def rebuild_rollups(chunk_size=CAR_CHUNK, echo=None):
+    """Recompute all rollups from Booking, one chunk of cars per transaction.
+
+    Each chunk's totals replace its rows and its stale rows are deleted in
+    the same transaction, so the analytics page sees every car's old or new
+    figures while the rebuild runs, and bookings written meanwhile are
+    counted exactly once.
+    """
+    car_ids = sorted(
+        set(db.session.execute(select(Booking.car_id).distinct()).scalars())
+        | set(db.session.execute(select(BookingRollup.car_id).distinct()).scalars())
+    )
+    db.session.commit()
+    table = BookingRollup.__table__
+    done, scanned = 0, 0
+    for i in range(0, len(car_ids), chunk_size):
+        chunk = car_ids[i:i + chunk_size]
+        connection = db.session.connection()
+        _lock_rollups(connection, chunk)
+        totals = defaultdict(lambda: [0, 0, 0.0])
+        bookings = connection.execute(
+            select(Booking.car_id, Booking.start_date, Booking.end_date, Booking.total_cost)
+            .where(Booking.car_id.in_(chunk))
+        ).all()
+        for row in bookings:
+            _accumulate(totals, 1, row)
+        rows = [
+            {'car_id': car_id, 'day': day, 'bookings': b, 'booked_days': d, 'revenue': r}
+            for (car_id, day), (b, d, r) in totals.items()
+        ]
+        upsert(
+            connection, table, rows, ['car_id', 'day'],
+            lambda t, ex: {'bookings': ex.bookings, 'booked_days': ex.booked_days, 'revenue': ex.revenue},
+        )
+        existing = connection.execute(select(table.c.car_id, table.c.day).where(table.c.car_id.in_(chunk)))
+        stale = [{'c': car_id, 'd': day} for car_id, day in existing if (car_id, day) not in totals]
+        if stale:
+            connection.execute(
+                table.delete().where(and_(table.c.car_id == bindparam('c'), table.c.day == bindparam('d'))),
+                stale,
+            )
+        db.session.commit()
+        done += len(chunk)
+        scanned += len(bookings)
+        if echo:
+            echo(f'{done} of {len(car_ids)} cars ({scanned} bookings) rolled up')
+    return scanned
+
+
+analytics_cli = AppGroup('analytics', help='Booking analytics maintenance.')
+
+
+@analytics_cli.command('rebuild-rollups')
+@click.option('--chunk-size', default=CAR_CHUNK, show_default=True, help='Cars per transaction.')
+def rebuild_rollups_command(chunk_size):
+    """Backfill the booking rollup table from all bookings."""
+    db.create_all()
+    total = rebuild_rollups(chunk_size=chunk_size, echo=click.echo)
+    click.echo(f'Rebuilt rollups from {total} bookings.')
+
+
+app.cli.add_command(analytics_cli)
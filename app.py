@@ -1,5 +1,4 @@
 from flask import Flask, render_template, redirect, url_for, flash, request
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
@@ -7,6 +6,11 @@ import os
 from dotenv import load_dotenv
 import logging
 from logging_setup import setup_logging
+from sql_instrumentation import init_sql_instrumentation
+from db_config import RoutingSQLAlchemy, configure_database
+from metrics import init_metrics
+from profiler import init_profiler
+from assets import init_assets
 
 # Load environment variables
 load_dotenv()
@@ -14,7 +18,7 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__)
 
-setup_logging()  # Set up logging configuration here
+setup_logging()  # Queue-based JSON logging (see logging_setup.py)
 
 @app.route('/error')
 def error_route():
@@ -22,18 +26,65 @@ def error_route():
         # Intentionally causing an error to demonstrate error logging
         result = 1 / 0  # Division by zero error
     except Exception as e:
-        app.logger.error(f"Error occurred: {e}", exc_info=True)
+        # Arguments are formatted lazily; the traceback lands in the "exc" field
+        app.logger.error("Error occurred: %s", e, exc_info=True)
         return "An error occurred!", 500
 
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'default-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///travora.db'
+# DATABASE_URL, pool sizing, SQLite pragmas and read replica (see db_config.py)
+configure_database(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB uploads
 app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
 app.config['ALLOWED_IMAGE_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+# Processes encoding image derivatives; 0 encodes inline during the upload
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+# In-memory per-car booking interval index; only safe with a single process
+app.config['AVAILABILITY_INDEX'] = os.environ.get('AVAILABILITY_INDEX', '').lower() in ('1', 'true', 'yes')
+
+# Rendered-page cache for anonymous catalog views (see page_cache.py)
+app.config['PAGE_CACHE_ENABLED'] = os.environ.get('PAGE_CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 60))
+app.config['PAGE_CACHE_SIZE'] = int(os.environ.get('PAGE_CACHE_SIZE', 512))
+# Catalog facet counts, also dropped on every catalog change (see facets.py)
+app.config['FACET_CACHE_TTL'] = int(os.environ.get('FACET_CACHE_TTL', 60))
+app.config['FACET_CACHE_SIZE'] = int(os.environ.get('FACET_CACHE_SIZE', 256))
+
+# Flask-Login user snapshots cached per process (see user_cache.py)
+app.config['USER_CACHE_ENABLED'] = os.environ.get('USER_CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 30))
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 4096))
+
+# Largest number of quotes one /api/quotes request may ask for: partners send
+# one of QUOTE_API_KEYS (comma-separated) as a bearer token, anyone else gets
+# QUOTE_ANONYMOUS_MAX_ITEMS
+app.config['QUOTE_API_KEYS'] = [k for k in os.environ.get('QUOTE_API_KEYS', '').split(',') if k.strip()]
+app.config['QUOTE_MAX_ITEMS'] = int(os.environ.get('QUOTE_MAX_ITEMS', 50000))
+app.config['QUOTE_ANONYMOUS_MAX_ITEMS'] = int(os.environ.get('QUOTE_ANONYMOUS_MAX_ITEMS', 20))
+
+# Rows per query of the streaming admin exports (see admin_exports.py)
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+# Requests slower than this are written to the slow-query log
+app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 500))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG', 'slow_queries.log')
+
+# Prometheus /metrics; METRICS_DIR aggregates several worker processes (see metrics.py)
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR') or None
+app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') or None
+
+# cProfile of single requests: ?_profile=1 (admins), X-Profile-Token or sampling (see profiler.py)
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 50))
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
 
 # Initialize database
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
+init_sql_instrumentation(app)
+init_metrics(app)
+init_profiler(app)
+init_assets(app)  # fingerprinted static URLs once `flask assets build` ran
 
 # Initialize login manager
 login_manager = LoginManager()
@@ -42,6 +93,8 @@ login_manager.login_view = 'login'
 
 # Import routes after app initialization to avoid circular imports
 from routes import *
+import fleet_cli  # registers the `flask fleet` commands
+import db_upgrade  # registers `flask db-upgrade` for existing databases
 
 if __name__ == '__main__':
     with app.app_context():
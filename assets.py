@@ -0,0 +1,164 @@
+"""Fingerprinted static assets with precompressed variants.
+
+``flask assets build`` copies every file of the static folder (except
+uploads) to static/dist under a content-hashed name, e.g.
+css/main.css -> dist/css/main.3f2a9c1b4d5e.css, next to .gz and, when the
+optional ``brotli`` package is installed, .br variants of text formats. The
+mapping goes to static/dist/manifest.json.
+
+When the manifest exists, ``url_for('static', filename='css/main.css')``
+returns the fingerprinted URL. The static view then serves the smallest
+variant the browser accepts and marks fingerprinted files (and the
+content-addressed uploads) immutable for a year, so repeat visits fetch
+nothing. Without a manifest, static files are served as before.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+import click
+from flask import request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # optional; only .gz variants are built without it
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+SKIPPED_DIRS = {'uploads', DIST_DIR}
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.svg', '.json', '.map', '.txt', '.html', '.xml', '.ico'}
+# Preferred order when the browser accepts several encodings
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Uploaded blobs and their derivatives are named after the file's SHA-256
+_CONTENT_ADDRESSED = re.compile(r'(^|/)[0-9a-f]{64}[.-][^/]*$')
+
+assets_cli = AppGroup('assets', help='Static asset build.')
+
+
+def fingerprint(path, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{digest}{ext}'
+
+
+def _source_files(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d not in SKIPPED_DIRS]
+        for name in files:
+            full_path = os.path.join(root, name)
+            yield os.path.relpath(full_path, static_folder).replace(os.sep, '/'), full_path
+
+
+def _write_variant(path, data):
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def build(static_folder, echo=None):
+    """Fingerprint and precompress the static folder; return the manifest."""
+    dist = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    for relative, full_path in sorted(_source_files(static_folder)):
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        hashed = fingerprint(relative, data)
+        target = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Same name means same content, so existing outputs are left alone
+        _write_variant(target, data)
+        if os.path.splitext(relative)[1].lower() in COMPRESSIBLE:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                _write_variant(target + '.gz', compressed)
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    _write_variant(target + '.br', compressed)
+        manifest[relative] = f'{DIST_DIR}/{hashed}'
+        if echo:
+            echo(f'{relative} -> {manifest[relative]}')
+
+    tmp_path = os.path.join(dist, MANIFEST_NAME + '.tmp')
+    os.makedirs(dist, exist_ok=True)
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(dist, MANIFEST_NAME))
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _is_immutable(filename, fingerprinted):
+    return filename in fingerprinted or (
+        filename.startswith('uploads/') and _CONTENT_ADDRESSED.search(filename) is not None
+    )
+
+
+def _mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def init_assets(app):
+    """Serve fingerprinted URLs from the manifest and register `flask assets`."""
+    app.config.setdefault('ASSETS_MANIFEST_ENABLED', True)
+    manifest = load_manifest(app.static_folder) if app.config['ASSETS_MANIFEST_ENABLED'] else {}
+    fingerprinted = set(manifest.values())
+
+    @app.url_defaults
+    def _fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.get(values['filename'], values['filename'])
+
+    def static(filename):
+        if not _is_immutable(filename, fingerprinted):
+            return app.send_static_file(filename)
+        response = None
+        if filename in fingerprinted:
+            for encoding, suffix in ENCODINGS:
+                if request.accept_encodings[encoding] and os.path.isfile(
+                        os.path.join(app.static_folder, filename + suffix)):
+                    # Content type of the original file, not of the .br/.gz
+                    response = send_from_directory(
+                        app.static_folder, filename + suffix, mimetype=_mimetype(filename), max_age=IMMUTABLE_MAX_AGE,
+                    )
+                    response.headers['Content-Encoding'] = encoding
+                    break
+            response = response or send_from_directory(app.static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+            response.vary.add('Accept-Encoding')
+        else:
+            response = send_from_directory(app.static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+    app.cli.add_command(assets_cli)
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Delete earlier builds first (breaks pages still linking them).')
+def build_command(clean):
+    """Fingerprint and precompress static files into static/dist."""
+    from flask import current_app
+
+    if clean:
+        shutil.rmtree(os.path.join(current_app.static_folder, DIST_DIR), ignore_errors=True)
+    manifest = build(current_app.static_folder, echo=click.echo)
+    click.echo(f'{len(manifest)} assets in the manifest'
+               + ('' if brotli is not None else ' (install brotli for .br variants)') + '.')
+    click.echo('Restart the app to serve the new manifest.')
@@ -0,0 +1,194 @@
+import threading
+from bisect import bisect_right
+from datetime import date, datetime
+
+from sqlalchemy import and_, event, exists
+
+from app import app, db
+from models import Booking, Car
+
+
+def as_datetime(value):
+    # Booking columns are DateTime but the booking forms hand us plain dates
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def overlap_clause(start_date, end_date, car_id=None, exclude_booking_id=None):
+    """SQL criteria matching bookings that overlap the inclusive [start, end] range."""
+    # SQLite compares the stored text, so a bare date must be bound as a datetime
+    start_date, end_date = as_datetime(start_date), as_datetime(end_date)
+    criteria = [Booking.end_date >= start_date, Booking.start_date <= end_date]
+    if car_id is not None:
+        criteria.insert(0, Booking.car_id == car_id)
+    if exclude_booking_id is not None:
+        criteria.append(Booking.id != exclude_booking_id)
+    return and_(*criteria)
+
+
+def has_conflict_in_db(car_id, start_date, end_date, exclude_booking_id=None):
+    # EXISTS lets the (car_id, start_date, end_date) index stop at the first hit
+    # instead of loading every overlapping row
+    clause = overlap_clause(start_date, end_date, car_id=car_id, exclude_booking_id=exclude_booking_id)
+    return db.session.query(exists().where(clause)).scalar()
+
+
+def free_cars_clause(start_date, end_date):
+    """Criteria for Car queries keeping only cars with no booking in the range.
+
+    Compiles to a single correlated NOT EXISTS (an anti-join), so filtering the
+    whole catalog costs one statement regardless of how many cars match.
+    """
+    return ~exists().where(and_(
+        Booking.car_id == Car.id,
+        overlap_clause(start_date, end_date),
+    ))
+
+
+class CarIntervals:
+    """Bookings of a single car kept sorted by start date."""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        # max_ends[i] is the latest end among intervals 0..i, so legacy
+        # overlapping rows cannot hide behind a shorter neighbour
+        self.max_ends = []
+
+    def _rebuild_max_from(self, index):
+        del self.max_ends[index:]
+        running = self.max_ends[-1] if self.max_ends else None
+        for end in self.ends[index:]:
+            running = end if running is None or end > running else running
+            self.max_ends.append(running)
+
+    def add(self, booking_id, start_date, end_date):
+        start_date, end_date = as_datetime(start_date), as_datetime(end_date)
+        index = bisect_right(self.starts, start_date)
+        self.starts.insert(index, start_date)
+        self.ends.insert(index, end_date)
+        self.ids.insert(index, booking_id)
+        self._rebuild_max_from(index)
+
+    def remove(self, booking_id):
+        try:
+            index = self.ids.index(booking_id)
+        except ValueError:
+            return
+        del self.starts[index]
+        del self.ends[index]
+        del self.ids[index]
+        self._rebuild_max_from(index)
+
+    def overlaps(self, start_date, end_date, exclude_booking_id=None):
+        start_date, end_date = as_datetime(start_date), as_datetime(end_date)
+        # Only intervals starting on or before `end_date` can overlap
+        index = bisect_right(self.starts, end_date) - 1
+        while index >= 0 and self.max_ends[index] >= start_date:
+            if self.ends[index] >= start_date and self.ids[index] != exclude_booking_id:
+                return True
+            index -= 1
+        return False
+
+
+class AvailabilityIndex:
+    """Per-process, per-car sorted interval index over committed bookings.
+
+    Cars are loaded lazily on first lookup with a single query and then kept
+    current from session commits, so repeated checks never hit the database.
+    Changes committed by other processes are not seen; only enable this for
+    single-process deployments (AVAILABILITY_INDEX = True).
+    """
+
+    def __init__(self):
+        self._cars = {}
+        self._car_of_booking = {}
+        self._lock = threading.RLock()
+
+    def _load(self, car_id):
+        intervals = CarIntervals()
+        rows = db.session.query(Booking.id, Booking.start_date, Booking.end_date).filter(
+            Booking.car_id == car_id
+        ).order_by(Booking.start_date).all()
+        for booking_id, start_date, end_date in rows:
+            intervals.add(booking_id, start_date, end_date)
+        return intervals, [row[0] for row in rows]
+
+    def intervals_for(self, car_id):
+        with self._lock:
+            intervals = self._cars.get(car_id)
+        if intervals is None:
+            loaded, booking_ids = self._load(car_id)
+            with self._lock:
+                intervals = self._cars.get(car_id)
+                if intervals is None:
+                    intervals = self._cars[car_id] = loaded
+                    for booking_id in booking_ids:
+                        self._car_of_booking[booking_id] = car_id
+        return intervals
+
+    def has_conflict(self, car_id, start_date, end_date, exclude_booking_id=None):
+        intervals = self.intervals_for(car_id)
+        with self._lock:
+            return intervals.overlaps(start_date, end_date, exclude_booking_id)
+
+    def apply(self, changes):
+        with self._lock:
+            for op, booking_id, car_id, start_date, end_date in changes:
+                previous_car_id = self._car_of_booking.pop(booking_id, None)
+                if previous_car_id in self._cars:
+                    self._cars[previous_car_id].remove(booking_id)
+                # Cars that were never looked up are loaded fresh on demand
+                if op == 'upsert' and car_id in self._cars:
+                    self._cars[car_id].add(booking_id, start_date, end_date)
+                    self._car_of_booking[booking_id] = car_id
+
+    def clear(self):
+        with self._lock:
+            self._cars.clear()
+            self._car_of_booking.clear()
+
+
+availability_index = AvailabilityIndex()
+
+
+def index_enabled():
+    return bool(app.config.get('AVAILABILITY_INDEX'))
+
+
+def has_conflict(car_id, start_date, end_date, exclude_booking_id=None):
+    """Return True if any booking for `car_id` overlaps [start_date, end_date]."""
+    if index_enabled():
+        return availability_index.has_conflict(car_id, start_date, end_date, exclude_booking_id)
+    return has_conflict_in_db(car_id, start_date, end_date, exclude_booking_id)
+
+
+# Keep the in-memory index in step with committed bookings. Changes are
+# collected per flush and only applied once the transaction commits.
+@event.listens_for(db.session, 'after_flush')
+def _collect_booking_changes(session, flush_context):
+    if not index_enabled():
+        return
+    changes = session.info.setdefault('availability_changes', [])
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Booking):
+            changes.append(('upsert', obj.id, obj.car_id, obj.start_date, obj.end_date))
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            changes.append(('delete', obj.id, obj.car_id, None, None))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_booking_changes(session):
+    changes = session.info.pop('availability_changes', None)
+    if changes:
+        availability_index.apply(changes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_booking_changes(session):
+    session.info.pop('availability_changes', None)
@@ -0,0 +1,24 @@
+"""Synthetic data generation and per-route latency benchmarks.
+
+    python -m benchmarks.datagen --db bench.db --scale small
+    python -m benchmarks.run --db bench.db --output baseline.json
+    python -m benchmarks.run --db bench.db --compare baseline.json
+"""
+import os
+
+
+def configure(db_path):
+    """Point the app at a benchmark database before its engine is first used.
+
+    Returns the configured Flask app. CSRF is disabled so forms can be posted
+    from the test client.
+    """
+    from app import app
+
+    db_path = os.path.abspath(db_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    # Worker threads write concurrently; wait for SQLite's lock instead of failing
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = 30000
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['IMAGE_WORKERS'] = 0
+    return app
@@ -0,0 +1,193 @@
+"""Generate a scaled synthetic dataset for benchmarking.
+
+Rows are written with chunked Core inserts, so even the large scale takes
+seconds. Booking dates follow a rough rental pattern: per car, bookings are
+laid out back to back with exponential gaps over the past year and next
+quarter, mostly short rentals with a long tail, each booked some days ahead
+of its start. Every booking gets a payment, every user a wallet.
+
+    python -m benchmarks.datagen --db bench.db --scale medium
+    python -m benchmarks.datagen --db bench.db --users 5000 --cars 800
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import configure
+
+SCALES = {
+    'small': {'users': 200, 'cars': 100, 'images_per_car': 3, 'bookings_per_car': 20},
+    'medium': {'users': 2000, 'cars': 1000, 'images_per_car': 4, 'bookings_per_car': 30},
+    'large': {'users': 20000, 'cars': 10000, 'images_per_car': 5, 'bookings_per_car': 40},
+}
+
+PASSWORD = 'benchmark'
+ADMIN_EMAIL = 'admin@bench.test'
+MODELS = {
+    'Toyota': ['Corolla', 'Camry', 'RAV4', 'Yaris'],
+    'Honda': ['Civic', 'Accord', 'CR-V', 'Fit'],
+    'Ford': ['Focus', 'Escape', 'Explorer', 'Fiesta'],
+    'BMW': ['3 Series', '5 Series', 'X3', 'X5'],
+    'Kia': ['Rio', 'Sportage', 'Sorento', 'Picanto'],
+}
+CATEGORY_RATES = {'economy': (30, 60), 'sedan': (45, 110), 'suv': (60, 160)}
+INSERT_CHUNK = 5000
+PAST_DAYS = 365
+FUTURE_DAYS = 90
+
+
+def user_email(n):
+    return f'user{n}@bench.test'
+
+
+def _chunked_insert(table, rows):
+    from app import db
+
+    for i in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(table.insert(), rows[i:i + INSERT_CHUNK])
+    db.session.commit()
+
+
+def _next_id(model):
+    from app import db
+    from sqlalchemy import func
+
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _booking_windows(rng, now, count):
+    """Yield up to `count` non-overlapping (start, end, created_at) for one car."""
+    day = now - timedelta(days=PAST_DAYS)
+    horizon = now + timedelta(days=FUTURE_DAYS)
+    mean_gap = (PAST_DAYS + FUTURE_DAYS) / max(count, 1) / 2
+    for _ in range(count):
+        start = day + timedelta(days=int(rng.expovariate(1 / max(mean_gap, 0.5))))
+        # Mostly 1-4 day rentals, occasionally a few weeks
+        length = min(1 + int(rng.expovariate(1 / 3)), 28)
+        end = start + timedelta(days=length)
+        if end > horizon:
+            return
+        lead = timedelta(days=int(rng.expovariate(1 / 14)), hours=rng.randrange(24))
+        yield start, end, min(start - lead, now)
+        # Inclusive overlap rule: the next rental starts after this one's end day
+        day = end + timedelta(days=1)
+
+
+def generate(users, cars, images_per_car, bookings_per_car, seed=42, echo=print):
+    """Append a synthetic dataset to the configured database; returns row counts."""
+    from werkzeug.security import generate_password_hash
+
+    import analytics
+    import occupancy
+    from app import db
+    from models import Booking, Car, CarImage, Payment, User, Wallet
+
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    db.create_all()
+    # One hash for everybody: hashing per user would dominate the run time
+    password = generate_password_hash(PASSWORD)
+    counts = {}
+
+    first_user = _next_id(User)
+    user_rows = [{
+        'id': first_user + i, 'name': f'Bench User {i}', 'email': user_email(first_user + i),
+        'phone': f'555{first_user + i:07d}', 'password': password, 'is_admin': False,
+    } for i in range(users)]
+    if not User.query.filter_by(email=ADMIN_EMAIL).first():
+        user_rows.append({
+            'id': first_user + users, 'name': 'Bench Admin', 'email': ADMIN_EMAIL,
+            'phone': '5550000000', 'password': password, 'is_admin': True,
+        })
+    _chunked_insert(User.__table__, user_rows)
+    _chunked_insert(Wallet.__table__, [
+        {'user_id': row['id'], 'balance': float(rng.randrange(500, 5000)), 'updated_at': now}
+        for row in user_rows
+    ])
+    counts['users'] = len(user_rows)
+    user_ids = [row['id'] for row in user_rows if not row['is_admin']]
+    echo(f'{len(user_rows)} users and wallets')
+
+    first_car = _next_id(Car)
+    car_rows, image_rows = [], []
+    for i in range(cars):
+        make = rng.choice(list(MODELS))
+        category = rng.choice(list(CATEGORY_RATES))
+        low, high = CATEGORY_RATES[category]
+        car_id = first_car + i
+        car_rows.append({
+            'id': car_id, 'make': make, 'model': rng.choice(MODELS[make]),
+            'year': rng.randint(2012, now.year), 'category': category,
+            'daily_rate': float(rng.randrange(low, high)),
+            'description': f'Synthetic {category} for benchmarking.', 'image_url': None,
+            'is_available': rng.random() > 0.05,
+        })
+        for n in range(images_per_car):
+            image_rows.append({
+                'car_id': car_id, 'file_path': f'static/uploads/bench/{car_id}-{n}.jpg',
+                'is_primary': n == 0, 'created_at': now,
+            })
+    _chunked_insert(Car.__table__, car_rows)
+    _chunked_insert(CarImage.__table__, image_rows)
+    counts['cars'], counts['images'] = len(car_rows), len(image_rows)
+    echo(f'{len(car_rows)} cars with {len(image_rows)} images')
+
+    booking_id = _next_id(Booking)
+    booking_rows, payment_rows = [], []
+    for car in car_rows:
+        for start, end, created_at in _booking_windows(rng, now, bookings_per_car):
+            user_id = rng.choice(user_ids)
+            total = (end - start).days * car['daily_rate']
+            booking_rows.append({
+                'id': booking_id, 'user_id': user_id, 'car_id': car['id'],
+                'start_date': start, 'end_date': end, 'total_cost': total, 'created_at': created_at,
+            })
+            payment_rows.append({
+                'booking_id': booking_id, 'user_id': user_id, 'amount': total,
+                'method': 'TEST_WALLET' if rng.random() < 0.7 else 'TEST_CARD',
+                'status': 'succeeded', 'created_at': created_at,
+            })
+            booking_id += 1
+        if len(booking_rows) >= INSERT_CHUNK:
+            _chunked_insert(Booking.__table__, booking_rows)
+            _chunked_insert(Payment.__table__, payment_rows)
+            counts['bookings'] = counts.get('bookings', 0) + len(booking_rows)
+            booking_rows, payment_rows = [], []
+    _chunked_insert(Booking.__table__, booking_rows)
+    _chunked_insert(Payment.__table__, payment_rows)
+    counts['bookings'] = counts.get('bookings', 0) + len(booking_rows)
+    counts['payments'] = counts['bookings']
+    echo(f"{counts['bookings']} bookings and payments")
+
+    # Core inserts bypass the flush listeners that maintain the rollups and bitmaps
+    analytics.rebuild_rollups()
+    occupancy.rebuild()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic benchmark dataset.')
+    parser.add_argument('--db', default='bench.db', help='SQLite database file to fill')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--users', type=int, help='override the scale\'s user count')
+    parser.add_argument('--cars', type=int, help='override the scale\'s car count')
+    parser.add_argument('--images-per-car', type=int)
+    parser.add_argument('--bookings-per-car', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+
+    app = configure(args.db)
+    started = time.perf_counter()
+    with app.app_context():
+        counts = generate(seed=args.seed, **sizes)
+    print(f'Generated {counts} in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
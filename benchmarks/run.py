@@ -0,0 +1,291 @@
+"""Drive every route through the Flask test client and record latency.
+
+Each scenario (see scenarios.py) runs on `--concurrency` worker threads,
+each with its own logged-in clients and scratch rows. Per scenario the
+report has p50/p95/p99/mean latency, throughput, error counts and the SQL
+statements per request, read from the Server-Timing header that
+sql_instrumentation.py adds. Results can be saved as a JSON baseline and
+later runs compared against it:
+
+    python -m benchmarks.run --db bench.db --generate --output baseline.json
+    python -m benchmarks.run --db bench.db --compare baseline.json
+
+Compare mode exits with status 1 when any route regressed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from uuid import uuid4
+
+from benchmarks import configure
+from benchmarks.datagen import ADMIN_EMAIL, PASSWORD, SCALES, generate
+from benchmarks.scenarios import SCENARIOS, SKIPPED_ENDPOINTS
+
+SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+class Worker:
+    """One benchmark thread: its clients, RNG and the rows it may modify."""
+
+    def __init__(self, app, index, user_id, user_email, car_ids, seed):
+        self.app = app
+        self.index = index
+        self.rng = random.Random(seed + index)
+        self.user_id = user_id
+        self.user_email = user_email
+        self.password = PASSWORD
+        self.car_ids = car_ids
+        self.anon = app.test_client()
+        self.user = self.login(user_email)
+        self.admin = self.login(ADMIN_EMAIL)
+        # Rows owned by this worker, so concurrent edits never touch the same row
+        self.booking_id = self.create_booking()
+        self.car_id = self.create_car()
+        self.scratch_user_id = self.create_user()
+
+    def login(self, email):
+        client = self.app.test_client()
+        response = client.post('/login', data={'email': email, 'password': self.password})
+        if response.status_code != 302:
+            raise RuntimeError(f'Could not log in as {email} (status {response.status_code})')
+        return client
+
+    def random_car(self):
+        return self.rng.choice(self.car_ids)
+
+    def _insert(self, obj):
+        from app import db
+
+        with self.app.app_context():
+            db.session.add(obj)
+            db.session.commit()
+            return obj.id
+
+    def create_booking(self):
+        from models import Booking
+
+        # Far enough out that it never meets the generated bookings
+        start = datetime.combine(date.today(), datetime.min.time()) + timedelta(days=self.rng.randint(400, 4000))
+        return self._insert(Booking(
+            user_id=self.user_id, car_id=self.random_car(), start_date=start,
+            end_date=start + timedelta(days=2), total_cost=100.0,
+        ))
+
+    def create_car(self):
+        from models import Car
+
+        return self._insert(Car(make='Bench', model='Scratch', year=2022, category='sedan', daily_rate=50.0))
+
+    def create_user(self):
+        from models import User
+
+        return self._insert(User(
+            name='Scratch User', email=f'scratch-{uuid4().hex}@bench.test',
+            phone='5559876543', password='!',
+        ))
+
+    def client_for(self, role):
+        if role == 'fresh':
+            return self.app.test_client()
+        if role == 'fresh_user':
+            return self.login(self.user_email)
+        return {'anon': self.anon, 'user': self.user, 'admin': self.admin}[role]
+
+    def build(self, scenario):
+        """Do the untimed setup for one request; returns (client, path, data)."""
+        prepared = scenario.prepare(self) if scenario.prepare else {}
+        data = scenario.data(self, prepared) if scenario.data else None
+        return self.client_for(scenario.role), scenario.path(self, prepared), data
+
+    def send(self, scenario, job):
+        client, path, data = job
+        started = time.perf_counter()
+        body = {'json': data} if scenario.as_json else {'data': data}
+        response = client.open(path, method=scenario.method, **body)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        match = SERVER_TIMING.search(response.headers.get('Server-Timing', ''))
+        response.close()
+        db_ms, statements = (float(match.group(1)), int(match.group(2))) if match else (0.0, 0)
+        return elapsed_ms, response.status_code, statements, db_ms
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run_scenario(scenario, workers, requests, warmup):
+    per_worker = [requests // len(workers) + (1 if i < requests % len(workers) else 0)
+                  for i in range(len(workers))]
+    barrier = threading.Barrier(len(workers) + 1)
+
+    def work(worker, count):
+        for _ in range(warmup):
+            worker.send(scenario, worker.build(scenario))
+        jobs = [worker.build(scenario) for _ in range(count)]
+        barrier.wait()
+        return [worker.send(scenario, job) for job in jobs]
+
+    with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+        futures = [executor.submit(work, w, n) for w, n in zip(workers, per_worker)]
+        barrier.wait()
+        started = time.perf_counter()
+        samples = [sample for future in futures for sample in future.result()]
+        wall = time.perf_counter() - started
+
+    latencies = sorted(s[0] for s in samples)
+    statuses = {}
+    for _, status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    statements = [s[2] for s in samples]
+    return {
+        'endpoint': scenario.endpoint,
+        'method': scenario.method,
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s[1] >= 400),
+        'statuses': statuses,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        'throughput_rps': round(len(samples) / wall, 1) if wall else 0.0,
+        'sql_mean': round(sum(statements) / len(statements), 2) if statements else 0.0,
+        'sql_max': max(statements, default=0),
+        'db_ms_mean': round(sum(s[3] for s in samples) / len(samples), 2) if samples else 0.0,
+    }
+
+
+def compare(baseline, current, threshold=0.25, min_ms=2.0):
+    """Return human-readable regressions of `current` against `baseline`.
+
+    Latency must grow by more than `threshold` (relative) and `min_ms`
+    (absolute) to count, which keeps sub-millisecond noise out; any increase
+    in the maximum statement count or in errors is a regression.
+    """
+    regressions = []
+    for name, cur in current['routes'].items():
+        base = baseline.get('routes', {}).get(name)
+        if base is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if cur[key] > base[key] * (1 + threshold) and cur[key] - base[key] > min_ms:
+                regressions.append(f'{name}: {key} {base[key]} -> {cur[key]}')
+        if cur['throughput_rps'] * (1 + threshold) < base['throughput_rps']:
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {cur['throughput_rps']} req/s")
+        if cur['sql_max'] > base['sql_max']:
+            regressions.append(f"{name}: SQL statements {base['sql_max']} -> {cur['sql_max']}")
+        if cur['errors'] > base['errors']:
+            regressions.append(f"{name}: errors {base['errors']} -> {cur['errors']}")
+    return regressions
+
+
+def _print_table(results, baseline=None):
+    header = f"{'route':28} {'req':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'sql':>5}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results['routes'].items():
+        line = (f"{name:28} {r['requests']:>5} {r['errors']:>4} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+                f"{r['p99_ms']:>8} {r['throughput_rps']:>8} {r['sql_max']:>5}")
+        base = (baseline or {}).get('routes', {}).get(name)
+        if base and base['p95_ms']:
+            line += f"  p95 {100.0 * (r['p95_ms'] - base['p95_ms']) / base['p95_ms']:+.0f}%"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-route latency benchmark.')
+    parser.add_argument('--db', default='bench.db', help='SQLite benchmark database')
+    parser.add_argument('--generate', action='store_true', help='fill the database first (if it is empty)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per worker and scenario')
+    parser.add_argument('--only', help='comma-separated scenario names')
+    parser.add_argument('--no-page-cache', action='store_true', help='disable the anonymous page cache')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON (e.g. a new baseline)')
+    parser.add_argument('--compare', help='baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown that counts')
+    parser.add_argument('--min-ms', type=float, default=2.0, help='absolute slowdown that counts')
+    args = parser.parse_args(argv)
+
+    app = configure(args.db)
+    if args.no_page_cache:
+        app.config['PAGE_CACHE_ENABLED'] = False
+
+    from app import db
+    from models import Car, User
+
+    with app.app_context():
+        db.create_all()
+        if args.generate and not User.query.filter_by(email=ADMIN_EMAIL).first():
+            generate(seed=args.seed, **SCALES[args.scale])
+        users = User.query.filter(User.is_admin.is_(False), User.email.like('user%@bench.test')) \
+            .order_by(User.id).limit(args.concurrency).all()
+        car_ids = [car_id for car_id, in db.session.query(Car.id).filter(Car.is_available.is_(True))]
+        counts = {'users': User.query.count(), 'cars': len(car_ids)}
+        users = [(u.id, u.email) for u in users]
+    if len(users) < args.concurrency or not car_ids:
+        sys.exit(f'{args.db} has no benchmark dataset; run with --generate or python -m benchmarks.datagen')
+
+    scenarios = SCENARIOS
+    if args.only:
+        wanted = set(args.only.split(','))
+        scenarios = [s for s in SCENARIOS if s.name in wanted]
+
+    workers = [Worker(app, i, user_id, email, car_ids, args.seed) for i, (user_id, email) in enumerate(users)]
+    results = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': os.path.basename(args.db),
+            'dataset': counts,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'page_cache': app.config.get('PAGE_CACHE_ENABLED', True),
+        },
+        'routes': {},
+        'unbenchmarked': sorted(
+            set(app.view_functions) - {s.endpoint for s in SCENARIOS} - SKIPPED_ENDPOINTS
+        ),
+    }
+    for scenario in scenarios:
+        results['routes'][scenario.name] = run_scenario(scenario, workers, args.requests, args.warmup)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    _print_table(results, baseline)
+    if results['unbenchmarked']:
+        print(f"\nRoutes without a scenario: {', '.join(results['unbenchmarked'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nResults written to {args.output}')
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold, args.min_ms)
+        if regressions:
+            print('\nRegressions against the baseline:')
+            for line in regressions:
+                print(f'  {line}')
+            sys.exit(1)
+        print('\nNo regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    main()
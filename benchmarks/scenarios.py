@@ -0,0 +1,139 @@
+"""The requests the benchmark runner drives, one or more per route.
+
+Each Scenario names the endpoint it exercises and which client sends it:
+
+    anon        a shared anonymous client
+    user        the worker's logged-in regular user
+    admin       the worker's logged-in admin
+    fresh       a new anonymous client per request (login, register)
+    fresh_user  a new client logged in as the worker's user, per request
+
+`prepare(worker)` runs untimed before each request, e.g. to create the row
+a destructive request consumes, and returns values for `path` and `data`.
+"""
+from datetime import date, timedelta
+from uuid import uuid4
+
+
+class Scenario:
+    def __init__(self, name, endpoint, path, method='GET', role='anon', data=None, prepare=None, as_json=False):
+        self.name = name
+        self.endpoint = endpoint
+        self.path = path
+        self.method = method
+        self.role = role
+        self.data = data
+        self.prepare = prepare
+        # Send `data` as a JSON body instead of a form
+        self.as_json = as_json
+
+
+def _dates(worker, max_offset=300, max_length=5):
+    start = date.today() + timedelta(days=worker.rng.randint(1, max_offset))
+    end = start + timedelta(days=worker.rng.randint(1, max_length))
+    return {'start_date': start.isoformat(), 'end_date': end.isoformat()}
+
+
+def _car_form(worker, p=None):
+    return {
+        'make': 'Bench', 'model': f'Model {worker.rng.randint(1, 999)}', 'year': '2022',
+        'category': worker.rng.choice(['sedan', 'suv', 'economy']),
+        'daily_rate': str(worker.rng.randint(30, 150)), 'description': 'benchmark car',
+        'image_url': '', 'is_available': 'y',
+    }
+
+
+def _new_booking(worker):
+    return {'booking_id': worker.create_booking()}
+
+
+def _new_car(worker):
+    return {'car_id': worker.create_car()}
+
+
+def _new_user(worker):
+    return {'user_id': worker.create_user()}
+
+
+SCENARIOS = [
+    # Public catalog
+    Scenario('home', 'home', lambda w, p: '/'),
+    Scenario('cars', 'cars', lambda w, p: '/cars'),
+    Scenario('cars_filtered', 'cars',
+             lambda w, p: f"/cars?category={w.rng.choice(['sedan', 'suv', 'economy'])}&sort=price_low"),
+    Scenario('cars_dates', 'cars',
+             lambda w, p: '/cars?start={start_date}&end={end_date}'.format(**_dates(w, 60))),
+    Scenario('cars_search', 'cars', lambda w, p: f"/cars?q={w.rng.choice(['toyota', 'camry', 'honda civic'])}"),
+    Scenario('cars_suggest', 'cars_suggest', lambda w, p: f"/cars/suggest?q={w.rng.choice(['to', 'ho', 'ford f'])}"),
+    Scenario('car_detail', 'car_detail', lambda w, p: f'/car/{w.random_car()}'),
+    # Whole-fleet quotes need the bulk limit of partners and admins
+    Scenario('api_quotes', 'api_quotes', lambda w, p: '/api/quotes', 'POST', 'admin', lambda w, p: {
+        'ranges': [{'start': d['start_date'], 'end': d['end_date']} for d in (_dates(w, 120) for _ in range(5))],
+    }, as_json=True),
+
+    # Authentication
+    Scenario('register_form', 'register', lambda w, p: '/register'),
+    Scenario('register', 'register', lambda w, p: '/register', 'POST', 'fresh', lambda w, p: {
+        'name': 'New Bench User', 'email': f'{uuid4().hex}@bench.test', 'phone': '5551234567',
+        'password': 'benchmark', 'confirm_password': 'benchmark',
+    }),
+    Scenario('login_form', 'login', lambda w, p: '/login'),
+    Scenario('login', 'login', lambda w, p: '/login', 'POST', 'fresh',
+             lambda w, p: {'email': w.user_email, 'password': w.password}),
+    Scenario('logout', 'logout', lambda w, p: '/logout', role='fresh_user'),
+
+    # Customer flows
+    Scenario('book_form', 'book_car', lambda w, p: f'/book/{w.random_car()}', role='user'),
+    Scenario('book', 'book_car', lambda w, p: f'/book/{w.random_car()}', 'POST', 'user',
+             lambda w, p: dict(_dates(w), payment_method='TEST_CARD')),
+    Scenario('booking_confirmation', 'booking_confirmation',
+             lambda w, p: f'/booking/{w.booking_id}/confirmation', role='user'),
+    Scenario('my_bookings', 'my_bookings', lambda w, p: '/my-bookings', role='user'),
+    Scenario('history', 'history', lambda w, p: '/history', role='user'),
+    Scenario('edit_booking_form', 'edit_booking', lambda w, p: f'/booking/{w.booking_id}/edit', role='user'),
+    Scenario('edit_booking', 'edit_booking', lambda w, p: f'/booking/{w.booking_id}/edit', 'POST', 'user',
+             lambda w, p: dict(_dates(w), payment_method='TEST_CARD')),
+    Scenario('cancel_booking', 'cancel_booking', lambda w, p: f"/booking/{p['booking_id']}/cancel",
+             'POST', 'user', prepare=_new_booking),
+
+    # Admin
+    Scenario('admin_dashboard', 'admin', lambda w, p: '/admin', role='admin'),
+    Scenario('admin_cars', 'admin_cars', lambda w, p: '/admin/cars', role='admin'),
+    Scenario('admin_new_car_form', 'admin_new_car', lambda w, p: '/admin/car/new', role='admin'),
+    Scenario('admin_new_car', 'admin_new_car', lambda w, p: '/admin/car/new', 'POST', 'admin', _car_form),
+    Scenario('admin_edit_car_form', 'admin_edit_car', lambda w, p: f'/admin/car/{w.car_id}/edit', role='admin'),
+    Scenario('admin_edit_car', 'admin_edit_car', lambda w, p: f'/admin/car/{w.car_id}/edit',
+             'POST', 'admin', _car_form),
+    Scenario('admin_delete_car', 'admin_delete_car', lambda w, p: f"/admin/car/{p['car_id']}/delete",
+             'POST', 'admin', prepare=_new_car),
+    Scenario('admin_bookings', 'admin_bookings', lambda w, p: '/admin/bookings', role='admin'),
+    Scenario('admin_modify_booking_form', 'admin_modify_booking',
+             lambda w, p: f'/admin/booking/{w.booking_id}/modify', role='admin'),
+    Scenario('admin_modify_booking', 'admin_modify_booking',
+             lambda w, p: f'/admin/booking/{w.booking_id}/modify', 'POST', 'admin', lambda w, p: _dates(w)),
+    Scenario('admin_cancel_booking', 'admin_cancel_booking',
+             lambda w, p: f"/admin/booking/{p['booking_id']}/cancel", 'POST', 'admin', prepare=_new_booking),
+    Scenario('admin_export_bookings', 'admin_export', lambda w, p: '/admin/export/bookings.csv', role='admin'),
+    Scenario('admin_export_payments', 'admin_export', lambda w, p: '/admin/export/payments.jsonl', role='admin'),
+    Scenario('admin_analytics', 'admin_analytics', lambda w, p: '/admin/analytics', role='admin'),
+    Scenario('admin_occupancy', 'admin_occupancy', lambda w, p: '/admin/occupancy', role='admin'),
+    Scenario('api_utilization', 'api_utilization', lambda w, p: '/api/occupancy/utilization', role='admin'),
+    Scenario('api_idle_cars', 'api_idle_cars', lambda w, p: '/api/occupancy/idle?limit=100', role='admin'),
+    Scenario('metrics', 'metrics', lambda w, p: '/metrics'),
+    Scenario('admin_slow_requests', 'admin_slow_requests', lambda w, p: '/admin/slow-requests', role='admin'),
+    Scenario('admin_profiles', 'admin_profiles', lambda w, p: '/admin/profiles', role='admin'),
+    Scenario('admin_users', 'admin_users', lambda w, p: '/admin/users', role='admin'),
+    Scenario('admin_edit_user_form', 'admin_edit_user', lambda w, p: f'/admin/user/{w.scratch_user_id}/edit',
+             role='admin'),
+    Scenario('admin_edit_user', 'admin_edit_user', lambda w, p: f'/admin/user/{w.scratch_user_id}/edit',
+             'POST', 'admin', lambda w, p: {
+                 'name': 'Scratch User', 'email': f'scratch-{w.scratch_user_id}@bench.test', 'phone': '5559876543',
+             }),
+    Scenario('admin_toggle_user', 'admin_toggle_user', lambda w, p: f'/admin/user/{w.scratch_user_id}/toggle',
+             'POST', 'admin'),
+    Scenario('admin_delete_user', 'admin_delete_user', lambda w, p: f"/admin/user/{p['user_id']}/delete",
+             'POST', 'admin', prepare=_new_user),
+]
+
+# Endpoints deliberately not benchmarked
+SKIPPED_ENDPOINTS = {'static', 'error_route', 'admin_profile_download'}
@@ -0,0 +1,185 @@
+"""Hammer the booking routes from many threads and check the invariants.
+
+Workers book a handful of cars over a short date window (so most requests
+contend for the same slots), reschedule and cancel their own bookings, and
+pay mostly from their test wallets. Afterwards the database must show:
+
+* no two bookings of the same car overlapping,
+* no negative wallet balance,
+* every wallet equal to its starting balance minus its TEST_WALLET payments.
+
+    python -m benchmarks.stress_booking --threads 16 --requests 300
+
+Exits with status 1 if an invariant is violated or a request failed with 5xx.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from benchmarks import configure
+from benchmarks.datagen import PASSWORD
+
+STARTING_BALANCE = 1000.0
+DAILY_RATE = 40.0
+
+
+def _setup(app, users, cars, prefix='stress'):
+    from werkzeug.security import generate_password_hash
+
+    from app import db
+    from models import Car, User, Wallet
+
+    with app.app_context():
+        db.create_all()
+        password = generate_password_hash(PASSWORD)
+        emails = []
+        for i in range(users):
+            user = User(name=f'Stress {i}', email=f'{prefix}{i}@bench.test', phone='5550000000', password=password)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Wallet(user_id=user.id, balance=STARTING_BALANCE))
+            emails.append(user.email)
+        car_ids = []
+        for i in range(cars):
+            car = Car(make='Stress', model=f'Car {i}', year=2022, category='sedan', daily_rate=DAILY_RATE)
+            db.session.add(car)
+            db.session.flush()
+            car_ids.append(car.id)
+        db.session.commit()
+    return emails, car_ids
+
+
+def _own_booking_ids(app, email):
+    from models import Booking, User
+
+    with app.app_context():
+        return [b.id for b in Booking.query.join(User).filter(User.email == email)]
+
+
+def _worker(app, email, car_ids, requests, window_days, seed, outcomes, lock):
+    rng = random.Random(seed)
+    client = app.test_client()
+    client.post('/login', data={'email': email, 'password': PASSWORD})
+    counts = Counter()
+    for _ in range(requests):
+        start = date.today() + timedelta(days=rng.randint(1, window_days))
+        dates = {
+            'start_date': start.isoformat(),
+            'end_date': (start + timedelta(days=rng.randint(1, 3))).isoformat(),
+            'payment_method': 'TEST_WALLET' if rng.random() < 0.85 else 'TEST_CARD',
+        }
+        action = rng.random()
+        own = _own_booking_ids(app, email) if action >= 0.7 else []
+        if own and action < 0.85:
+            response = client.post(f'/booking/{rng.choice(own)}/edit', data=dates)
+            kind = 'edit'
+        elif own:
+            response = client.post(f'/booking/{rng.choice(own)}/cancel')
+            kind = 'cancel'
+        else:
+            response = client.post(f'/book/{rng.choice(car_ids)}', data=dates)
+            kind = 'book'
+        # Redirect means the change went through; 200 re-renders the form with a message
+        outcome = 'ok' if response.status_code == 302 else (
+            'rejected' if response.status_code == 200 else f'status {response.status_code}')
+        counts[(kind, outcome)] += 1
+    with lock:
+        outcomes.update(counts)
+
+
+def check_invariants(app, emails=None, car_ids=None):
+    """Return a list of violated invariants (empty when all hold).
+
+    `emails` and `car_ids` limit the checks to the users and cars of one run.
+    """
+    from sqlalchemy import and_, case, func
+    from sqlalchemy.orm import aliased
+
+    from app import db
+    from models import Booking, Payment, User, Wallet
+
+    problems = []
+    with app.app_context():
+        a, b = aliased(Booking), aliased(Booking)
+        overlaps = db.session.query(func.count()).select_from(a).join(b, and_(
+            a.car_id == b.car_id, a.id < b.id, a.end_date >= b.start_date, a.start_date <= b.end_date,
+        ))
+        if car_ids is not None:
+            overlaps = overlaps.filter(a.car_id.in_(car_ids))
+        overlaps = overlaps.scalar()
+        if overlaps:
+            problems.append(f'{overlaps} overlapping booking pairs')
+
+        wallets = Wallet.query
+        if emails is not None:
+            wallets = wallets.join(User, User.id == Wallet.user_id).filter(User.email.in_(emails))
+        negative = wallets.filter(Wallet.balance < 0).count()
+        if negative:
+            problems.append(f'{negative} wallets with a negative balance')
+
+        spent = dict(db.session.query(
+            Payment.user_id,
+            func.sum(case((Payment.method == 'TEST_WALLET', Payment.amount), else_=0.0)),
+        ).group_by(Payment.user_id).all())
+        for wallet in wallets:
+            expected = STARTING_BALANCE - (spent.get(wallet.user_id) or 0.0)
+            if abs(wallet.balance - expected) > 0.005:
+                problems.append(f'wallet of user {wallet.user_id} holds {wallet.balance:.2f}, ledger says {expected:.2f}')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent booking stress test.')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    parser.add_argument('--cars', type=int, default=4)
+    parser.add_argument('--window-days', type=int, default=30, help='days the start dates are drawn from')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='travora-stress-'), 'stress.db')
+    app = configure(db_path)
+    # Every request would otherwise invalidate and re-render cached pages
+    app.config['PAGE_CACHE_ENABLED'] = False
+    emails, car_ids = _setup(app, args.threads, args.cars)
+
+    outcomes, lock = Counter(), threading.Lock()
+    threads = [
+        threading.Thread(target=_worker, args=(
+            app, email, car_ids, args.requests, args.window_days, args.seed + i, outcomes, lock,
+        ))
+        for i, email in enumerate(emails)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = sum(outcomes.values())
+    print(f'{total} requests from {args.threads} threads in {elapsed:.1f}s ({total / elapsed:.0f} req/s)')
+    for (kind, outcome), count in sorted(outcomes.items()):
+        print(f'  {kind:7} {outcome:10} {count}')
+
+    problems = check_invariants(app)
+    failures = sum(count for (_, outcome), count in outcomes.items() if outcome.startswith('status'))
+    if failures:
+        problems.append(f'{failures} requests failed')
+    if problems:
+        print('FAILED:')
+        for problem in problems:
+            print(f'  {problem}')
+        sys.exit(1)
+    print('OK: no double bookings, no negative balances, wallets match the payment ledger.')
+
+
+if __name__ == '__main__':
+    main()
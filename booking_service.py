@@ -0,0 +1,247 @@
+"""Race-free booking and wallet writes.
+
+Checking availability and then inserting is not enough once two requests
+run at the same time, and `with_for_update()` is a no-op on SQLite. So every
+booking write here follows the same pattern inside one transaction:
+
+* claim the slot first: insert (or move) the booking and flush, then check
+  for an overlapping booking with the write already in place. On SQLite the
+  flush takes the database write lock, so the check cannot race another
+  writer; on PostgreSQL the `booking_no_overlap` exclusion constraint (see
+  add_overlap_constraint) rejects the loser of a race outright.
+* debit the wallet with a single conditional UPDATE (balance >= amount), so
+  concurrent debits can never take a balance below zero.
+
+Lock timeouts, serialization failures and constraint violations roll the
+transaction back and are retried with jittered backoff; a retry re-runs the
+availability check and fails cleanly if the slot has been taken meanwhile.
+"""
+import random
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import DDL, event
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import app, db
+from availability import has_conflict, has_conflict_in_db
+from models import Booking, Payment, Wallet
+from pricing import booking_total
+
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 0.02  # seconds, doubled per attempt
+DEFAULT_WALLET_BALANCE = 500.0
+
+
+class BookingError(Exception):
+    pass
+
+
+class SlotUnavailable(BookingError):
+    pass
+
+
+class InsufficientFunds(BookingError):
+    pass
+
+
+class BookingNotFound(BookingError):
+    pass
+
+
+# PostgreSQL enforces "no overlapping bookings per car" itself. The range is
+# inclusive on both ends to match availability.overlap_clause.
+OVERLAP_CONSTRAINT_DDL = [
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist'),
+    DDL(
+        'ALTER TABLE booking ADD CONSTRAINT booking_no_overlap EXCLUDE USING gist '
+        "(car_id WITH =, tsrange(start_date, end_date, '[]') WITH &&)"
+    ),
+]
+for _ddl in OVERLAP_CONSTRAINT_DDL:
+    event.listen(Booking.__table__, 'after_create', _ddl.execute_if(dialect='postgresql'))
+
+
+def add_overlap_constraint():
+    """Add the exclusion constraint to an existing PostgreSQL booking table."""
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return False
+    for ddl in OVERLAP_CONSTRAINT_DDL:
+        connection.execute(ddl)
+    db.session.commit()
+    return True
+
+
+def with_retries(operation, attempts=MAX_ATTEMPTS, backoff=RETRY_BACKOFF):
+    """Run `operation()` and commit, retrying the whole transaction on contention.
+
+    BookingErrors are business outcomes and are raised at once.
+    """
+    for attempt in range(attempts):
+        try:
+            result = operation()
+            db.session.commit()
+            return result
+        except BookingError:
+            db.session.rollback()
+            raise
+        except (OperationalError, IntegrityError):
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+def debit_wallet(user_id, amount):
+    """Atomically take `amount` from the user's wallet; False if it is short."""
+    updated = Wallet.query.filter(Wallet.user_id == user_id, Wallet.balance >= amount).update(
+        {Wallet.balance: Wallet.balance - amount, Wallet.updated_at: datetime.utcnow()},
+        synchronize_session=False,
+    )
+    if updated:
+        return True
+    if Wallet.query.filter_by(user_id=user_id).first() is None:
+        # First booking without a wallet: open one with the usual test credits
+        db.session.add(Wallet(user_id=user_id, balance=DEFAULT_WALLET_BALANCE))
+        db.session.flush()
+        return debit_wallet(user_id, amount)
+    return False
+
+
+def credit_wallet(user_id, amount):
+    updated = Wallet.query.filter(Wallet.user_id == user_id).update(
+        {Wallet.balance: Wallet.balance + amount, Wallet.updated_at: datetime.utcnow()},
+        synchronize_session=False,
+    )
+    if not updated:
+        db.session.add(Wallet(user_id=user_id, balance=amount))
+        db.session.flush()
+
+
+def _lock_booking(booking_id):
+    """Take the booking's row (or SQLite's database) write lock and reload it.
+
+    Returns None if the booking was deleted by a concurrent request.
+    """
+    locked = Booking.query.filter(Booking.id == booking_id).update(
+        {Booking.total_cost: Booking.total_cost}, synchronize_session=False,
+    )
+    if not locked:
+        return None
+    return db.session.get(Booking, booking_id, populate_existing=True)
+
+
+def _claim_slot(booking):
+    # The booking row is written before the check, see the module docstring
+    db.session.flush()
+    if has_conflict_in_db(booking.car_id, booking.start_date, booking.end_date, exclude_booking_id=booking.id):
+        raise SlotUnavailable()
+
+
+def create_booking(user_id, car, start_date, end_date, method):
+    """Book `car` for the user and record the payment; returns the Booking."""
+    total_cost = booking_total(car.daily_rate, start_date, end_date)
+    car_id = car.id
+
+    def operation():
+        # Cheap early exit; the authoritative check follows the insert
+        if has_conflict(car_id, start_date, end_date):
+            raise SlotUnavailable()
+        booking = Booking(
+            user_id=user_id, car_id=car_id, start_date=start_date, end_date=end_date, total_cost=total_cost,
+        )
+        db.session.add(booking)
+        _claim_slot(booking)
+        if method == 'TEST_WALLET' and not debit_wallet(user_id, total_cost):
+            raise InsufficientFunds()
+        db.session.add(Payment(
+            booking_id=booking.id, user_id=user_id, amount=total_cost, method=method, status='succeeded',
+        ))
+        return booking
+
+    return with_retries(operation)
+
+
+def reschedule_booking(booking_id, user_id, start_date, end_date, method, daily_rate):
+    """Move a booking to new dates, charging or refunding the difference."""
+
+    def operation():
+        booking = _lock_booking(booking_id)
+        if booking is None:
+            raise BookingNotFound()
+        if has_conflict(booking.car_id, start_date, end_date, exclude_booking_id=booking.id):
+            raise SlotUnavailable()
+        new_total = booking_total(daily_rate, start_date, end_date)
+        delta = new_total - booking.total_cost
+        booking.start_date, booking.end_date, booking.total_cost = start_date, end_date, new_total
+        _claim_slot(booking)
+        if delta > 0:
+            if method == 'TEST_WALLET' and not debit_wallet(user_id, delta):
+                raise InsufficientFunds()
+            db.session.add(Payment(
+                booking_id=booking.id, user_id=user_id, amount=delta, method=method, status='succeeded',
+            ))
+        elif delta < 0:
+            # Refund to wallet for simplicity; a negative amount marks a refund
+            credit_wallet(user_id, -delta)
+            db.session.add(Payment(
+                booking_id=booking.id, user_id=user_id, amount=delta, method='TEST_WALLET', status='succeeded',
+            ))
+        return booking
+
+    return with_retries(operation)
+
+
+def move_booking(booking_id, start_date, end_date):
+    """Admin change of dates: reprices the booking without touching wallets."""
+
+    def operation():
+        booking = _lock_booking(booking_id)
+        if booking is None:
+            raise BookingNotFound()
+        if has_conflict(booking.car_id, start_date, end_date, exclude_booking_id=booking.id):
+            raise SlotUnavailable()
+        booking.start_date, booking.end_date = start_date, end_date
+        booking.total_cost = booking_total(booking.car.daily_rate, start_date, end_date)
+        _claim_slot(booking)
+        return booking
+
+    return with_retries(operation)
+
+
+def cancel_booking(booking_id):
+    """Delete a booking and refund its cost to the owner's wallet."""
+
+    def operation():
+        booking = _lock_booking(booking_id)
+        if booking is None:
+            # Already cancelled by a concurrent request: refund only once
+            return None
+        user_id, refund = booking.user_id, booking.total_cost
+        db.session.add(Payment(
+            booking_id=booking.id, user_id=user_id, amount=-refund, method='TEST_WALLET', status='succeeded',
+        ))
+        db.session.delete(booking)
+        db.session.flush()
+        credit_wallet(user_id, refund)
+        return booking
+
+    return with_retries(operation)
+
+
+bookings_cli = AppGroup('bookings', help='Booking data maintenance.')
+
+
+@bookings_cli.command('add-overlap-constraint')
+def add_overlap_constraint_command():
+    """Add the PostgreSQL exclusion constraint to an existing database."""
+    if add_overlap_constraint():
+        click.echo('Added booking_no_overlap.')
+    else:
+        click.echo('Not a PostgreSQL database; overlaps are checked after each booking write.')
+
+
+app.cli.add_command(bookings_cli)
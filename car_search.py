@@ -0,0 +1,179 @@
+"""Full-text car search over make, model, category and description.
+
+On SQLite the text lives in an FTS5 index (``car_fts``) that reads its
+content from the car table. Triggers keep it in step with every insert,
+update and delete, including Core writes such as the fleet upsert. The
+index is created with the car table; ``flask search rebuild`` adds it to an
+existing database or rebuilds it. Without FTS5 (other backends, or before
+the rebuild) searches fall back to LIKE filters, which match the same
+terms but have no ranking.
+
+Every term of a query is a prefix match, so "toy cam" finds a Toyota Camry.
+"""
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Column, DDL, Float, Integer, MetaData, String, Table, and_, event, or_, select, text
+
+from app import app, db
+from models import Car
+
+FTS_TABLE = 'car_fts'
+INDEXED_COLUMNS = ('make', 'model', 'category', 'description')
+# Column weights for bm25: make and model matter most
+RANK_FUNCTION = 'bm25(10.0, 8.0, 2.0, 1.0)'
+# Autocomplete inspects at most this many matches before grouping them
+SUGGEST_SCAN_LIMIT = 500
+MIN_SUGGEST_PREFIX = 2
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Not part of db.metadata: create_all must not try to create it as a plain table
+car_fts = Table(
+    FTS_TABLE, MetaData(),
+    Column('rowid', Integer),
+    Column('rank', Float),
+    Column(FTS_TABLE, String),
+)
+
+_columns = ', '.join(INDEXED_COLUMNS)
+_new = ', '.join(f'new.{c}' for c in INDEXED_COLUMNS)
+_old = ', '.join(f'old.{c}' for c in INDEXED_COLUMNS)
+
+FTS_DDL = [
+    DDL(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({_columns}, "
+        f"content='car', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ),
+    DDL(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', '{RANK_FUNCTION}')"),
+    DDL(
+        f"CREATE TRIGGER IF NOT EXISTS car_fts_insert AFTER INSERT ON car BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new}); END"
+    ),
+    DDL(
+        f"CREATE TRIGGER IF NOT EXISTS car_fts_delete AFTER DELETE ON car BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old}); END"
+    ),
+    # Only edits of indexed text touch the index, not availability or prices
+    DDL(
+        f"CREATE TRIGGER IF NOT EXISTS car_fts_update AFTER UPDATE OF {_columns} ON car BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new}); END"
+    ),
+]
+
+
+def _fts5_supported(ddl, target, bind, **kw):
+    if bind.dialect.name != 'sqlite':
+        return False
+    options = {row[0] for row in bind.exec_driver_sql('PRAGMA compile_options')}
+    return 'ENABLE_FTS5' in options
+
+
+for _ddl in FTS_DDL:
+    event.listen(Car.__table__, 'after_create', _ddl.execute_if(callable_=_fts5_supported))
+
+# Engine URL -> whether that database has the index
+_fts_ready = {}
+
+
+def fts_enabled():
+    bind = db.session.get_bind(mapper=Car.__mapper__)
+    key = str(bind.url)
+    if key not in _fts_ready:
+        _fts_ready[key] = bind.dialect.name == 'sqlite' and db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE},
+        ).first() is not None
+    return _fts_ready[key]
+
+
+def terms(q):
+    return [token.lower() for token in _TOKEN.findall(q or '')]
+
+
+def match_expression(words, columns=None):
+    # Quoting every term keeps FTS5 query syntax (AND, NEAR, ^...) out of user input
+    expression = ' '.join(f'"{word}"*' for word in words)
+    if columns:
+        return '{' + ' '.join(columns) + '}: (' + expression + ')'
+    return expression
+
+
+def _like(column, word):
+    escaped = word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.ilike(f'{escaped}%', escape='\\') | column.ilike(f'% {escaped}%', escape='\\')
+
+
+def _like_filter(words, columns):
+    return and_(*[or_(*[_like(getattr(Car, name), word) for name in columns]) for word in words])
+
+
+def apply_search(query, q):
+    """Restrict a Car query to matches of `q`.
+
+    Returns (query, rank) where rank is a column to order by (best first,
+    ascending) or None when the fallback cannot rank.
+    """
+    words = terms(q)
+    if not words:
+        return query, None
+    if fts_enabled():
+        query = query.join(car_fts, car_fts.c.rowid == Car.id).filter(
+            car_fts.c[FTS_TABLE].op('MATCH')(match_expression(words))
+        )
+        return query, car_fts.c.rank
+    return query.filter(_like_filter(words, INDEXED_COLUMNS)), None
+
+
+def suggest(q, limit=8):
+    """Up to `limit` "Make Model" completions for the text typed so far."""
+    words = terms(q)
+    if not words or len(words[-1]) < MIN_SUGGEST_PREFIX:
+        return []
+    if fts_enabled():
+        # Unranked, so FTS5 can stop after SUGGEST_SCAN_LIMIT hits
+        matches = select(car_fts.c.rowid).where(
+            car_fts.c[FTS_TABLE].op('MATCH')(match_expression(words, columns=('make', 'model')))
+        ).limit(SUGGEST_SCAN_LIMIT).scalar_subquery()
+        criteria = Car.id.in_(matches)
+    else:
+        criteria = Car.id.in_(
+            select(Car.id).where(_like_filter(words, ('make', 'model'))).limit(SUGGEST_SCAN_LIMIT).scalar_subquery()
+        )
+    rows = db.session.execute(
+        select(Car.make, Car.model, db.func.count())
+        .where(criteria)
+        .group_by(Car.make, Car.model)
+        .order_by(db.func.count().desc(), Car.make, Car.model)
+        .limit(limit)
+    )
+    return [f'{make} {model}' for make, model, _ in rows]
+
+
+def rebuild():
+    """Create the FTS5 index and triggers if missing and reindex every car."""
+    connection = db.session.connection()
+    if not _fts5_supported(None, None, connection):
+        return False
+    for ddl in FTS_DDL:
+        connection.execute(ddl)
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    db.session.commit()
+    _fts_ready.clear()
+    return True
+
+
+search_cli = AppGroup('search', help='Car search index.')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Create (if needed) and rebuild the FTS5 car index."""
+    if rebuild():
+        click.echo(f'Rebuilt {FTS_TABLE} for {Car.query.count()} cars.')
+    else:
+        click.echo('This database has no FTS5; searches use LIKE filters.')
+
+
+app.cli.add_command(search_cli)
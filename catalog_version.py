@@ -0,0 +1,57 @@
+"""Process-wide version counter for catalog data.
+
+Any committed change to a Car, CarImage or Booking bumps the version, so
+caches keyed on it (rendered pages, facet counts) never serve data from
+before the change. Callbacks registered with ``on_change`` run after each
+bump, e.g. to drop entries that can no longer be hit.
+"""
+import threading
+
+from sqlalchemy import event
+
+from app import db
+from models import Booking, Car, CarImage
+
+CATALOG_MODELS = (Car, CarImage, Booking)
+
+_lock = threading.Lock()
+_version = 0
+_callbacks = []
+
+
+def current_version():
+    return _version
+
+
+def bump():
+    global _version
+    with _lock:
+        _version += 1
+        version = _version
+    for callback in list(_callbacks):
+        callback(version)
+    return version
+
+
+def on_change(callback):
+    _callbacks.append(callback)
+    return callback
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_catalog_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, CATALOG_MODELS):
+            session.info['catalog_changed'] = True
+            return
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_on_commit(session):
+    if session.info.pop('catalog_changed', False):
+        bump()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,126 @@
+"""Conditional GET (ETag / If-None-Match) for the car and catalog pages.
+
+A view wrapped in ``conditional(state)`` first asks ``state`` for a cheap
+description of the data the page shows. The ETag hashes that state together
+with the request URL, the visitor, a CSRF time bucket and the deployed
+templates. A matching If-None-Match gets a 304 before the view or its
+template runs.
+
+Car.updated_at is a car's version. It changes on every update of the car
+and, via the before_flush hook below, whenever one of its images is added,
+changed or removed. The catalog pages use no query at all: their state is
+the process's catalog version (bumped by every committed Car, CarImage or
+Booking change), so they validate as cheaply as a page-cache hit. Changes
+committed by other worker processes do not bump that version, so the state
+also carries the PAGE_CACHE_TTL time bucket: like the page cache, a catalog
+ETag goes stale at most that long after another worker's change. A
+per-process token keeps one worker from confirming another worker's ETag.
+"""
+import hashlib
+import os
+import time
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event
+
+import catalog_version
+from app import app, db
+from models import Car, CarImage
+
+_build_id = None
+# Catalog versions are only comparable within one process
+_process_token = os.urandom(8).hex()
+
+
+@event.listens_for(db.session, 'before_flush')
+def _touch_cars_of_changed_images(session, flush_context, instances):
+    now = datetime.utcnow()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, CarImage):
+            continue
+        car = obj.car if obj.car is not None else (session.get(Car, obj.car_id) if obj.car_id else None)
+        if car is not None and car not in session.deleted:
+            car.updated_at = now
+
+
+def _deployed_build():
+    """Hash of the templates and asset manifest, so a deploy changes every ETag."""
+    global _build_id
+    if _build_id is None:
+        digest = hashlib.sha256()
+        for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+            for name in sorted(files):
+                with open(os.path.join(root, name), 'rb') as f:
+                    digest.update(f.read())
+        manifest = os.path.join(app.static_folder, 'dist', 'manifest.json')
+        if os.path.exists(manifest):
+            with open(manifest, 'rb') as f:
+                digest.update(f.read())
+        _build_id = digest.hexdigest()[:16]
+    return _build_id
+
+
+def _csrf_bucket():
+    # Pages with forms embed a CSRF token; reusing a copy for at most half
+    # its lifetime leaves the token valid for the other half
+    limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if not limit or not current_app.config.get('WTF_CSRF_ENABLED', True):
+        return 0
+    return int(time.time() // max(limit // 2, 60))
+
+
+def etag_for(state):
+    user = current_user.get_id() if current_user.is_authenticated else 'anon'
+    # The date too: availability shown relative to today changes at midnight
+    parts = (_deployed_build(), request.full_path, user, _csrf_bucket(), datetime.utcnow().date()) + tuple(state)
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def conditional(state):
+    """Answer If-None-Match with 304 when `state(**view_args)` is unchanged.
+
+    `state` returns a tuple describing what the page shows, or None to skip
+    validation (the view then runs as usual, e.g. to return a 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (not current_app.config.get('ETAG_ENABLED', True)
+                    or request.method not in ('GET', 'HEAD')
+                    or session.get('_flashes')):
+                return view(*args, **kwargs)
+            page_state = state(*args, **kwargs)
+            if page_state is None:
+                return view(*args, **kwargs)
+            etag = etag_for(page_state)
+            # The page cache keys on it too, so a cached body always matches its ETag
+            g._etag = etag
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                # Flashed messages or a new session cookie make the page one-off
+                if response.status_code != 200 or session.modified:
+                    return response
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def car_state(car_id):
+    row = db.session.query(Car.updated_at, Car.is_available).filter(Car.id == car_id).first()
+    if row is None:
+        return None
+    return ('car', car_id, row.updated_at, row.is_available)
+
+
+def catalog_state():
+    ttl = current_app.config.get('PAGE_CACHE_TTL', 60)
+    return ('cars', _process_token, catalog_version.current_version(), int(time.time() // max(ttl, 1)))
@@ -0,0 +1,125 @@
+"""Database engine profile: URL, pool, SQLite pragmas and a read replica.
+
+Settings come from the environment (or .env):
+
+    DATABASE_URL          primary database, default sqlite:///travora.db
+    DATABASE_REPLICA_URL  optional read replica for views marked @read_only
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT
+                          connection pool of server databases (not SQLite)
+    SQLITE_WAL, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE
+                          pragmas applied to every new SQLite connection
+
+WAL lets SQLite readers keep going while a writer commits, and the busy
+timeout makes writers wait for the lock instead of failing at once.
+"""
+import os
+import sqlite3
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.engine import Engine
+
+REPLICA_BIND = 'replica'
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
+
+
+def database_url():
+    url = os.environ.get('DATABASE_URL', 'sqlite:///travora.db')
+    # Heroku-style URLs use a scheme SQLAlchemy 1.4 no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def configure_database(app):
+    """Fill the app's database settings from the environment."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        if replica_url.startswith('postgres://'):
+            replica_url = 'postgresql://' + replica_url[len('postgres://'):]
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: replica_url}
+
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+
+    app.config['SQLITE_WAL'] = _env_flag('SQLITE_WAL', '1')
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+
+def _install_sqlite_pragmas(app):
+    def set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        config = app.config
+        cursor = dbapi_connection.cursor()
+        try:
+            if config.get('SQLITE_WAL', True):
+                cursor.execute('PRAGMA journal_mode=WAL')
+            if config.get('SQLITE_SYNCHRONOUS') in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+                cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+            cursor.execute(f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+            cursor.execute(f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 0))}")
+        finally:
+            cursor.close()
+
+    event.listen(Engine, 'connect', set_pragmas)
+
+
+def read_only(view):
+    """Mark a view as safe to serve from the read replica (when one is set)."""
+    view.read_only = True
+    return view
+
+
+def _use_replica():
+    return has_request_context() and g.get('_db_read_only', False)
+
+
+class RoutingSession(SignallingSession):
+    """Sends reads of @read_only requests to the replica bind.
+
+    Flushes always go to the primary, so a read-only view that does write
+    something still writes to the right place.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self._flushing and _use_replica():
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with pool settings from config and replica routing."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        super().init_app(app)
+        _install_sqlite_pragmas(app)
+
+        @app.before_request
+        def _route_reads():
+            view = app.view_functions.get(request.endpoint)
+            if getattr(view, 'read_only', False) and REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {}):
+                g._db_read_only = True
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        if not sa_url.drivername.startswith('sqlite'):
+            config = app.config
+            options.setdefault('pool_size', config.get('DB_POOL_SIZE', 10))
+            options.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 20))
+            options.setdefault('pool_recycle', config.get('DB_POOL_RECYCLE', 1800))
+            options.setdefault('pool_timeout', config.get('DB_POOL_TIMEOUT', 30))
+            # Drop connections the server closed while they sat in the pool
+            options.setdefault('pool_pre_ping', True)
+        return super().apply_driver_hacks(app, sa_url, options)
@@ -0,0 +1,102 @@
+"""Bring an existing database up to date with the models (`flask db-upgrade`).
+
+``db.create_all()`` creates missing tables but never alters existing ones,
+so columns and indexes added to tables that already exist are listed in
+UPGRADES. Each step is applied only when its column or index is missing,
+so the command is safe to run on every deploy.
+
+    ('column', table, column)   ALTER TABLE ... ADD COLUMN, then the
+                                column's own index or unique index
+    ('index', table, index)     CREATE INDEX from the model's definition
+"""
+import click
+from sqlalchemy import inspect
+
+from app import app, db
+
+UPGRADES = [
+    # Availability overlap check
+    ('index', 'booking', 'ix_booking_car_dates'),
+    # Newest-first keyset pagination of booking lists
+    ('index', 'booking', 'ix_booking_user_created'),
+    ('index', 'booking', 'ix_booking_created'),
+    # Resized image derivatives
+    ('column', 'car_image', 'derivatives'),
+    # Content-addressed uploads (the image_blob table itself is created by create_all)
+    ('column', 'car_image', 'content_hash'),
+    # Fleet import upsert key
+    ('column', 'car', 'fleet_id'),
+    # ETag versions of cars and their images
+    ('column', 'car', 'updated_at'),
+    ('column', 'car_image', 'updated_at'),
+    # Account deactivation
+    ('column', 'user', 'active'),
+]
+
+
+def _add_column(connection, table, column):
+    # SQLite cannot add a column with a UNIQUE constraint; an index enforces it
+    preparer = connection.dialect.identifier_preparer
+    ddl = f'{preparer.quote(column.name)} {column.type.compile(connection.dialect)}'
+    if column.server_default is not None:
+        # Fills existing rows, which is also what lets the column be NOT NULL
+        default = column.server_default.arg
+        if isinstance(default, str):
+            default = "'" + default.replace("'", "''") + "'"
+        else:
+            default = str(default.compile(dialect=connection.dialect))
+        ddl += f' DEFAULT {default}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    connection.exec_driver_sql(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}')
+    if column.unique:
+        connection.exec_driver_sql(
+            f'CREATE UNIQUE INDEX uq_{table.name}_{column.name} ON {table.name} ({column.name})'
+        )
+    for index in table.indexes:
+        if [c.name for c in index.columns] == [column.name]:
+            index.create(connection)
+
+
+def _index_named(table, name):
+    for index in table.indexes:
+        if index.name == name:
+            return index
+    raise KeyError(f'{table.name} has no index {name}')
+
+
+def pending_upgrades(connection):
+    """The UPGRADES steps this database still needs."""
+    inspector = inspect(connection)
+    pending = []
+    for kind, table_name, name in UPGRADES:
+        if kind == 'column':
+            present = {c['name'] for c in inspector.get_columns(table_name)}
+        else:
+            present = {i['name'] for i in inspector.get_indexes(table_name)}
+        if name not in present:
+            pending.append((kind, table_name, name))
+    return pending
+
+
+def upgrade(echo=None):
+    """Create missing tables, then apply the pending UPGRADES steps; returns them."""
+    db.create_all()
+    with db.engine.begin() as connection:
+        pending = pending_upgrades(connection)
+        for kind, table_name, name in pending:
+            table = db.metadata.tables[table_name]
+            if kind == 'column':
+                _add_column(connection, table, table.c[name])
+            else:
+                _index_named(table, name).create(connection)
+            if echo:
+                echo(f'{kind} {table_name}.{name} added')
+    return pending
+
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Add tables, columns and indexes missing from an existing database."""
+    applied = upgrade(echo=click.echo)
+    click.echo(f'Applied {len(applied)} upgrade steps.' if applied else 'Database is up to date.')
@@ -0,0 +1,44 @@
+"""Portable INSERT ... ON CONFLICT DO UPDATE for Core tables.
+
+SQLite (3.24+) and PostgreSQL get a native upsert executed as one
+executemany; other backends fall back to UPDATE-then-INSERT per row.
+"""
+from types import SimpleNamespace
+
+from sqlalchemy import and_, literal
+
+
+def _native_insert(dialect_name):
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    return None
+
+
+def upsert(connection, table, rows, key_columns, set_):
+    """Insert `rows` (dicts) into `table`, updating rows whose keys already exist.
+
+    `set_(target, excluded)` returns the {column name: expression} to apply on
+    conflict, where `target` is the table's column collection and `excluded`
+    exposes the incoming row's values by column name, e.g. for a counter:
+
+        lambda t, ex: {'hits': t.hits + ex.hits}
+    """
+    if not rows:
+        return
+    insert = _native_insert(connection.dialect.name)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=set_(table.c, stmt.excluded))
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        excluded = SimpleNamespace(**{name: literal(value, table.c[name].type) for name, value in row.items()})
+        match = and_(*[table.c[name] == row[name] for name in key_columns])
+        result = connection.execute(table.update().where(match).values(set_(table.c, excluded)))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
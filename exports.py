@@ -0,0 +1,74 @@
+"""Row serialization shared by the fleet CLI and the admin export endpoints.
+
+Everything here works on iterables of dicts and yields one line at a time,
+so callers can stream arbitrarily large result sets with flat memory.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+FORMATS = ('csv', 'jsonl')
+
+
+class InvalidRow(ValueError):
+    """A line that could not be decoded.
+
+    read_rows yields it in place of the row, so one bad line does not end
+    the iteration; importers skip and report it like any invalid row.
+    """
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_csv_lines(rows, fieldnames):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({k: _plain(v) for k, v in row.items()})
+        # Hand back whatever the writer produced and reuse the buffer
+        if buffer.tell() >= 16 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps({k: _plain(v) for k, v in row.items()}, separators=(',', ':')) + '\n'
+
+
+def iter_lines(rows, fieldnames, fmt):
+    if fmt == 'csv':
+        return iter_csv_lines(rows, fieldnames)
+    if fmt == 'jsonl':
+        return iter_jsonl_lines(rows)
+    raise ValueError(f'Unsupported export format: {fmt}')
+
+
+def read_rows(fp, fmt):
+    """Yield dicts from a CSV (with header) or JSON-lines text stream.
+
+    Undecodable JSON lines are yielded as InvalidRow errors.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(fp)
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(fp, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                row = InvalidRow(f'line {line_number}: invalid JSON ({exc})')
+            yield row
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
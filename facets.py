@@ -0,0 +1,118 @@
+"""Facet counts for the catalog filters (category, year, price, availability).
+
+One grouped query counts the cars matching the search text for every
+(category, year bucket, price bucket, free) combination; that is at most a
+few dozen rows. Each facet is then added up in Python under the *other*
+selected filters, so picking "SUV" still shows how many sedans there are.
+Because the category, year and price selections are applied afterwards,
+the grouped rows depend only on the search text and the date window, and
+are cached under those and the catalog version.
+"""
+from sqlalchemy import and_, case, func
+
+import catalog_version
+import car_search
+from app import app, db
+from availability import free_cars_clause
+from models import Car
+from page_cache import PageCache
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = (
+    ('under-50', 'Under $50', None, 50),
+    ('50-80', '$50 to $80', 50, 80),
+    ('80-120', '$80 to $120', 80, 120),
+    ('120-up', '$120 and up', 120, None),
+)
+YEAR_BUCKETS = (
+    ('2023-up', '2023 and newer', 2023, None),
+    ('2020-2022', '2020 to 2022', 2020, 2023),
+    ('2015-2019', '2015 to 2019', 2015, 2020),
+    ('before-2015', 'Before 2015', None, 2015),
+)
+DIMENSIONS = ('category', 'year', 'price')
+
+facet_cache = PageCache(
+    maxsize=app.config.get('FACET_CACHE_SIZE', 256),
+    ttl=app.config.get('FACET_CACHE_TTL', 60),
+)
+
+
+@catalog_version.on_change
+def _evict_stale_facets(version):
+    facet_cache.clear()
+
+
+def bucket_filter(column, buckets, key):
+    """Criteria for `column` within bucket `key`, or None for an unknown key."""
+    for bucket_key, _, lower, upper in buckets:
+        if bucket_key == key:
+            criteria = []
+            if lower is not None:
+                criteria.append(column >= lower)
+            if upper is not None:
+                criteria.append(column < upper)
+            return and_(*criteria)
+    return None
+
+
+def _bucket_case(column, buckets):
+    return case(*[(bucket_filter(column, buckets, key), key) for key, _, _, _ in buckets])
+
+
+def _grouped_counts(q, start_date, end_date):
+    if start_date is not None:
+        free = and_(Car.is_available.is_(True), free_cars_clause(start_date, end_date))
+    else:
+        free = Car.is_available.is_(True)
+    dimensions = (
+        Car.category,
+        _bucket_case(Car.year, YEAR_BUCKETS),
+        _bucket_case(Car.daily_rate, PRICE_BUCKETS),
+        case((free, True), else_=False),
+    )
+    query, _ = car_search.apply_search(db.session.query(*dimensions, func.count()).select_from(Car), q)
+    return [tuple(row) for row in query.group_by(*dimensions)]
+
+
+def _labels(buckets, counts):
+    return [(key, label, counts.get(key, 0)) for key, label, _, _ in buckets]
+
+
+def facet_counts(q, start_date, end_date, selected):
+    """Facet counts for the catalog page.
+
+    `selected` maps 'category', 'year' and 'price' to the chosen key (or a
+    false value). With a date window, only cars free in it are counted.
+    """
+    key = (catalog_version.current_version(), q, start_date, end_date)
+    rows = facet_cache.get(key)
+    if rows is None:
+        rows = _grouped_counts(q, start_date, end_date)
+        facet_cache.set(key, rows)
+
+    def matches(row, skip=None):
+        return all(not selected.get(d) or row[i] == selected[d] for i, d in enumerate(DIMENSIONS) if d != skip)
+
+    counts = {d: {} for d in DIMENSIONS}
+    availability = {True: 0, False: 0}
+    total = 0
+    for row in rows:
+        *values, is_free, count = row
+        window_ok = is_free or start_date is None
+        for i, dimension in enumerate(DIMENSIONS):
+            if window_ok and matches(row, skip=dimension):
+                counts[dimension][values[i]] = counts[dimension].get(values[i], 0) + count
+        if matches(row):
+            availability[is_free] += count
+            if window_ok:
+                total += count
+    return {
+        'total': total,
+        'category': sorted(((c, (c or '').capitalize(), n) for c, n in counts['category'].items()),
+                           key=lambda item: (-item[2], item[0] or '')),
+        'year': _labels(YEAR_BUCKETS, counts['year']),
+        'price': _labels(PRICE_BUCKETS, counts['price']),
+        'free': availability[True],
+        'unavailable': availability[False],
+    }
@@ -0,0 +1,251 @@
+"""Bulk fleet import and export (`flask fleet ...`).
+
+Imports read CSV or JSON-lines files row by row and write them in chunks:
+cars are upserted on Car.fleet_id with one executemany per chunk, and their
+image references are inserted alongside, so memory stays bounded by the
+chunk size however large the file is. Exports stream rows from a
+server-side cursor straight to the output.
+
+CSV files carry image references in an `images` column separated by `|`;
+JSON lines may use a list instead. A reference is stored as-is in
+CarImage.file_path, so it can be a static path or an absolute URL.
+"""
+import os
+from datetime import datetime
+from itertools import groupby
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+import catalog_version
+from app import app, db
+from db_upsert import upsert
+from exports import FORMATS, InvalidRow, iter_lines, read_rows
+from models import Booking, Car, CarImage, User
+
+CAR_FIELDS = ('fleet_id', 'make', 'model', 'year', 'category', 'daily_rate',
+              'description', 'image_url', 'is_available')
+CAR_EXPORT_FIELDS = ('id',) + CAR_FIELDS + ('images',)
+BOOKING_EXPORT_FIELDS = ('id', 'user_id', 'user_email', 'car_id', 'fleet_id',
+                         'start_date', 'end_date', 'total_cost', 'created_at')
+IMAGE_SEPARATOR = '|'
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on')
+
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'jsonl' if os.path.splitext(path or '')[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+
+def _text(raw, name, required=False, max_length=None):
+    value = raw.get(name)
+    value = str(value).strip() if value is not None else ''
+    if required and not value:
+        raise ValueError(f'missing {name}')
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{name} longer than {max_length} characters')
+    return value or None
+
+
+def _image_refs(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(IMAGE_SEPARATOR)
+    return [str(ref).strip() for ref in value if str(ref).strip()]
+
+
+def parse_car(raw):
+    """Validate one input row; returns (car column values, image references).
+
+    The file is authoritative: optional columns left empty reset to their
+    defaults when an existing car is updated.
+    """
+    try:
+        year = int(raw.get('year'))
+        daily_rate = float(raw.get('daily_rate'))
+    except (TypeError, ValueError):
+        raise ValueError('year and daily_rate must be numbers')
+    available = raw.get('is_available')
+    if isinstance(available, str):
+        available = available.strip().lower() in TRUE_VALUES if available.strip() else True
+    car = {
+        'fleet_id': _text(raw, 'fleet_id', required=True, max_length=64),
+        'make': _text(raw, 'make', required=True, max_length=50),
+        'model': _text(raw, 'model', required=True, max_length=50),
+        'year': year,
+        'category': _text(raw, 'category', required=True, max_length=20).lower(),
+        'daily_rate': daily_rate,
+        'description': _text(raw, 'description'),
+        'image_url': _text(raw, 'image_url', max_length=200),
+        'is_available': True if available is None else bool(available),
+    }
+    return car, _image_refs(raw.get('images'))
+
+
+def _write_chunk(connection, cars, images):
+    """Upsert one chunk of cars and add any image references they lack."""
+    car_table, image_table = Car.__table__, CarImage.__table__
+    upsert(
+        connection, car_table, list(cars.values()), ['fleet_id'],
+        # ON CONFLICT DO UPDATE skips column onupdate defaults, so bump the version here
+        lambda t, ex: dict({name: getattr(ex, name) for name in CAR_FIELDS if name != 'fleet_id'},
+                           updated_at=datetime.utcnow()),
+    )
+    if not images:
+        return 0
+
+    car_ids = dict(connection.execute(
+        select(car_table.c.fleet_id, car_table.c.id).where(car_table.c.fleet_id.in_(list(images)))
+    ).all())
+    existing, has_primary = set(), set()
+    for car_id, file_path, is_primary in connection.execute(
+        select(image_table.c.car_id, image_table.c.file_path, image_table.c.is_primary)
+        .where(image_table.c.car_id.in_(list(car_ids.values())))
+    ):
+        existing.add((car_id, file_path))
+        if is_primary:
+            has_primary.add(car_id)
+
+    rows = []
+    for fleet_id, refs in images.items():
+        car_id = car_ids[fleet_id]
+        for ref in refs:
+            if (car_id, ref) in existing:
+                continue
+            existing.add((car_id, ref))
+            rows.append({'car_id': car_id, 'file_path': ref, 'is_primary': car_id not in has_primary})
+            has_primary.add(car_id)
+    if rows:
+        connection.execute(image_table.insert(), rows)
+    return len(rows)
+
+
+def import_cars(rows, chunk_size=1000, echo=None):
+    """Upsert cars (and image references) from an iterable of dicts.
+
+    Each chunk commits on its own, so an interrupted import can simply be
+    re-run. Invalid rows are skipped and reported. Returns counters.
+    """
+    stats = {'rows': 0, 'cars': 0, 'images': 0, 'skipped': 0}
+    cars, images = {}, {}
+
+    def flush():
+        if not cars:
+            return
+        stats['images'] += _write_chunk(db.session.connection(), cars, images)
+        db.session.commit()
+        stats['cars'] += len(cars)
+        cars.clear()
+        images.clear()
+        if echo:
+            echo(f"{stats['cars']} cars imported")
+
+    for line_number, raw in enumerate(rows, 1):
+        stats['rows'] += 1
+        try:
+            if isinstance(raw, InvalidRow):
+                raise raw
+            car, refs = parse_car(raw)
+        except (ValueError, AttributeError) as exc:
+            stats['skipped'] += 1
+            if echo:
+                echo(f'row {line_number}: skipped ({exc})', err=True)
+            continue
+        # A fleet_id repeated within a chunk keeps its last values
+        cars[car['fleet_id']] = car
+        if refs:
+            images.setdefault(car['fleet_id'], []).extend(refs)
+        if len(cars) >= chunk_size:
+            flush()
+    flush()
+
+    if stats['cars']:
+        # Core statements bypass the session events that normally bump this
+        catalog_version.bump()
+    return stats
+
+
+def iter_cars(chunk_size=1000):
+    """Yield every car as an export dict, streamed with a server-side cursor."""
+    car_table, image_table = Car.__table__, CarImage.__table__
+    stmt = (
+        select(*[car_table.c[name] for name in ('id',) + CAR_FIELDS], image_table.c.file_path.label('image'))
+        .outerjoin(image_table, image_table.c.car_id == car_table.c.id)
+        .order_by(car_table.c.id, image_table.c.is_primary.desc(), image_table.c.id)
+    )
+    result = db.session.execute(stmt, execution_options={'stream_results': True}).yield_per(chunk_size)
+    for _, group in groupby(result.mappings(), key=lambda row: row['id']):
+        group = list(group)
+        car = {name: group[0][name] for name in ('id',) + CAR_FIELDS}
+        car['images'] = IMAGE_SEPARATOR.join(row['image'] for row in group if row['image'])
+        yield car
+
+
+def iter_bookings(chunk_size=1000):
+    """Yield every booking as an export dict, streamed with a server-side cursor."""
+    stmt = (
+        select(
+            Booking.id, Booking.user_id, User.email.label('user_email'), Booking.car_id,
+            Car.fleet_id, Booking.start_date, Booking.end_date, Booking.total_cost, Booking.created_at,
+        )
+        .join(User, User.id == Booking.user_id)
+        .join(Car, Car.id == Booking.car_id)
+        .order_by(Booking.id)
+    )
+    result = db.session.execute(stmt, execution_options={'stream_results': True}).yield_per(chunk_size)
+    for row in result.mappings():
+        yield dict(row)
+
+
+fleet_cli = AppGroup('fleet', help='Bulk fleet import and export.')
+
+format_option = click.option('--format', 'fmt', type=click.Choice(FORMATS),
+                             help='File format (default: from the file extension, else csv).')
+chunk_option = click.option('--chunk-size', default=1000, show_default=True,
+                            help='Rows per database round trip.')
+
+
+@fleet_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@format_option
+@chunk_option
+def import_command(path, fmt, chunk_size):
+    """Create or update cars from a CSV or JSON-lines file, keyed on fleet_id."""
+    db.create_all()
+    with open(path, newline='', encoding='utf-8') as fp:
+        stats = import_cars(read_rows(fp, _format_for(path, fmt)), chunk_size=chunk_size, echo=click.echo)
+    click.echo(
+        f"Imported {stats['cars']} cars and {stats['images']} new image references "
+        f"from {stats['rows']} rows ({stats['skipped']} skipped)."
+    )
+
+
+def _export(rows, fields, output, fmt):
+    for chunk in iter_lines(rows, fields, _format_for(output.name, fmt)):
+        output.write(chunk)
+
+
+@fleet_cli.command('export-cars')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='Destination file (default: stdout).')
+@format_option
+@chunk_option
+def export_cars_command(output, fmt, chunk_size):
+    """Stream all cars with their image references."""
+    _export(iter_cars(chunk_size), CAR_EXPORT_FIELDS, output, fmt)
+
+
+@fleet_cli.command('export-bookings')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='Destination file (default: stdout).')
+@format_option
+@chunk_option
+def export_bookings_command(output, fmt, chunk_size):
+    """Stream all bookings with their user email and car fleet_id."""
+    _export(iter_bookings(chunk_size), BOOKING_EXPORT_FIELDS, output, fmt)
+
+
+app.cli.add_command(fleet_cli)
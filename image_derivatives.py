@@ -0,0 +1,138 @@
+"""Fixed-width derivatives (thumbnail, card, hero) for uploaded car images.
+
+Encoding runs in a process pool so uploads return as soon as the originals
+are saved; when a job finishes its result is recorded on CarImage.derivatives
+and templates switch to the smaller files via srcset. Pillow is optional:
+without it originals are served unchanged.
+
+Worker processes are spawned and only import this module, which therefore
+keeps its app/model imports inside the functions that run in the web process.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow not installed: derivatives are skipped
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# name -> target width in pixels; images are never upscaled
+DERIVATIVE_WIDTHS = {'thumb': 320, 'card': 640, 'hero': 1600}
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVED_DIR = 'derived'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def available():
+    return Image is not None
+
+
+def render_derivatives(source_path, dest_dir, stem):
+    """Encode every derivative of `source_path` into `dest_dir` (runs in a worker).
+
+    Returns {name: {'width': w, 'webp': path, 'jpeg': path}} with paths using
+    forward slashes so they can be served as static-relative URLs.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    results = {}
+    with Image.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+        for name, target_width in DERIVATIVE_WIDTHS.items():
+            width = min(target_width, original.width)
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS) if width != original.width else original
+            entry = {'width': width}
+            for ext, (fmt, options) in DERIVATIVE_FORMATS.items():
+                image = resized.convert('RGB') if fmt == 'JPEG' and resized.mode != 'RGB' else resized
+                path = os.path.join(dest_dir, f'{stem}-{name}.{"jpg" if ext == "jpeg" else ext}')
+                image.save(path, fmt, **options)
+                entry[ext] = path.replace(os.sep, '/')
+            results[name] = entry
+    return results
+
+
+def _get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _save_derivatives(image_id, derivatives):
+    from app import db
+    from models import CarImage, ImageBlob
+
+    image = db.session.get(CarImage, image_id)
+    if image is None:
+        return
+    image.derivatives = derivatives
+    if image.content_hash:
+        # Every image sharing the blob shares its derivative files too
+        blob = db.session.get(ImageBlob, image.content_hash)
+        if blob is not None:
+            blob.derivatives = derivatives
+        for sibling in CarImage.query.filter(
+                CarImage.content_hash == image.content_hash, CarImage.derivatives.is_(None)):
+            sibling.derivatives = derivatives
+    db.session.commit()
+
+
+def _on_done(image_id, future):
+    # Runs on the executor's result thread, outside any request
+    from app import app
+
+    try:
+        derivatives = future.result()
+    except Exception:
+        logger.exception('Derivative encoding failed for CarImage %s', image_id)
+        return
+    with app.app_context():
+        _save_derivatives(image_id, derivatives)
+
+
+def schedule_derivatives(images):
+    """Queue derivative encoding for committed CarImage rows that lack them.
+
+    Files are named after the source file's stem, which for content-addressed
+    uploads is the SHA-256, so each distinct image is encoded once.
+    With IMAGE_WORKERS = 0 the work runs inline, which is handy for scripts.
+    """
+    if not available():
+        return
+    from app import app
+
+    workers = app.config.get('IMAGE_WORKERS', 2)
+    dest_dir = os.path.join(app.config.get('UPLOAD_FOLDER', os.path.join('static', 'uploads')), DERIVED_DIR)
+    scheduled = set()
+    for image in images:
+        source_path = image.file_path
+        if image.derivatives or source_path in scheduled or not os.path.exists(source_path):
+            continue
+        scheduled.add(source_path)
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        if workers <= 0:
+            try:
+                derivatives = render_derivatives(source_path, dest_dir, stem)
+            except Exception:
+                logger.exception('Derivative encoding failed for CarImage %s', image.id)
+                continue
+            _save_derivatives(image.id, derivatives)
+            continue
+        future = _get_executor(workers).submit(render_derivatives, source_path, dest_dir, stem)
+        future.add_done_callback(lambda f, image_id=image.id: _on_done(image_id, f))
@@ -0,0 +1,202 @@
+"""Content-addressed storage for uploaded car images.
+
+Uploads (and seeded stock images) are hashed (SHA-256) while they stream
+to disk and stored once at <UPLOAD_FOLDER>/blobs/<aa>/<sha256>.<ext>;
+identical content resolves to the existing blob. upload_url() maps stored
+paths to URLs: the static view serves the default static/uploads folder,
+and /uploads/ serves one configured elsewhere. ImageBlob.ref_count tracks how many CarImage rows point at each blob
+and is adjusted in the same flush that adds or deletes those rows. Blobs
+whose count drops to zero are removed by release_unreferenced() (called after
+admin_delete_car) or `flask images gc`.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from collections import Counter
+
+import click
+from flask import url_for
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+
+from app import app, db
+from db_upsert import upsert
+from models import CarImage, ImageBlob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+BLOB_DIR = 'blobs'
+
+
+def _upload_folder():
+    return app.config.get('UPLOAD_FOLDER', os.path.join('static', 'uploads'))
+
+
+def _blob_dir():
+    return os.path.join(_upload_folder(), BLOB_DIR)
+
+
+def blob_path(sha256, ext):
+    # Forward slashes: stored on the rows and mapped to a URL by upload_url
+    return os.path.join(_blob_dir(), sha256[:2], f'{sha256}.{ext}').replace(os.sep, '/')
+
+
+def upload_url(path):
+    """URL of a stored image path (also the `upload_url` template filter).
+
+    static/... paths are served by the static view; paths inside an
+    UPLOAD_FOLDER outside the static folder by /uploads/. Anything else, such
+    as a legacy external image URL, is returned unchanged.
+    """
+    if not path:
+        return path
+    path = path.replace('\\', '/')
+    if path.startswith('static/'):
+        return '/' + path
+    folder = os.path.abspath(_upload_folder())
+    absolute = os.path.abspath(path)
+    if absolute.startswith(folder + os.sep):
+        return url_for('uploaded_file', filename=os.path.relpath(absolute, folder).replace(os.sep, '/'))
+    return path
+
+
+app.add_template_filter(upload_url)
+
+
+def write_blob(chunks, ext):
+    """Stream byte `chunks` into the blob store; returns (sha256, path, size).
+
+    The bytes are hashed while they are written to a temp file, which is then
+    renamed into place, so readers never see a partial file. No database
+    access: safe to call from worker threads (see seed_images.py).
+    """
+    blob_dir = _blob_dir()
+    os.makedirs(blob_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    # Beside the blobs, so the rename never crosses a filesystem
+    fd, tmp_path = tempfile.mkstemp(dir=blob_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        file_path = blob_path(sha256, ext)
+        if not os.path.exists(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # Same bytes under the same name, so a concurrent identical write is harmless
+            os.replace(tmp_path, file_path)
+            tmp_path = None
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return sha256, file_path, size
+
+
+def register_blob(sha256, file_path, size):
+    """Return the ImageBlob row for a file written by write_blob, creating it if missing.
+
+    The row starts with ref_count 0; the CarImage that references it bumps the
+    count when it is flushed.
+    """
+    blob = db.session.get(ImageBlob, sha256)
+    if blob is not None:
+        if blob.file_path != file_path:
+            if os.path.exists(blob.file_path):
+                # Same bytes already stored under another extension
+                _remove_files([file_path])
+            else:
+                blob.file_path = file_path
+        return blob
+    upsert(
+        db.session.connection(), ImageBlob.__table__,
+        [{'sha256': sha256, 'file_path': file_path, 'size': size, 'ref_count': 0}],
+        ['sha256'], lambda t, ex: {'size': ex.size},
+    )
+    return db.session.get(ImageBlob, sha256, populate_existing=True)
+
+
+def store_upload(file_storage, ext):
+    """Stream an upload to the blob store and return its ImageBlob row."""
+    chunks = iter(lambda: file_storage.stream.read(CHUNK_SIZE), b'')
+    return register_blob(*write_blob(chunks, ext))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _count_blob_references(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, CarImage) and obj.content_hash:
+            deltas[obj.content_hash] += 1
+    for obj in session.deleted:
+        if isinstance(obj, CarImage):
+            history = inspect(obj).attrs.content_hash.history
+            content_hash = (history.deleted or history.unchanged or [obj.content_hash])[0]
+            if content_hash:
+                deltas[content_hash] -= 1
+    if not deltas:
+        return
+    table = ImageBlob.__table__
+    connection = session.connection()
+    for sha256, delta in deltas.items():
+        if delta:
+            connection.execute(
+                table.update().where(table.c.sha256 == sha256).values(ref_count=table.c.ref_count + delta)
+            )
+
+
+def _blob_files(blob):
+    paths = [blob.file_path]
+    for entry in (blob.derivatives or {}).values():
+        paths.extend(v for k, v in entry.items() if k != 'width')
+    return paths
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.warning('Could not remove image file %s', path, exc_info=True)
+
+
+def release_unreferenced(hashes=None):
+    """Delete blobs (rows and files) that no CarImage references any more.
+
+    Each row is removed with a DELETE guarded on ref_count <= 0, so a blob that
+    was re-referenced in the meantime is left alone. Returns the number removed.
+    """
+    query = ImageBlob.query.filter(ImageBlob.ref_count <= 0)
+    if hashes is not None:
+        if not hashes:
+            return 0
+        query = query.filter(ImageBlob.sha256.in_(list(hashes)))
+    removed = 0
+    candidates = [(blob.sha256, _blob_files(blob)) for blob in query.all()]
+    for sha256, paths in candidates:
+        deleted = ImageBlob.query.filter(
+            ImageBlob.sha256 == sha256, ImageBlob.ref_count <= 0
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            _remove_files(paths)
+            removed += 1
+    return removed
+
+
+images_cli = AppGroup('images', help='Uploaded image storage maintenance.')
+
+
+@images_cli.command('gc')
+def gc_command():
+    """Remove stored image blobs that are no longer referenced."""
+    click.echo(f'Removed {release_unreferenced()} unreferenced image blobs.')
+
+
+app.cli.add_command(images_cli)
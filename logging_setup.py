@@ -1,26 +1,203 @@
+"""Queue-based logging: request threads only enqueue, one thread writes.
+
+Records go through a QueueHandler on the root logger into a bounded queue;
+a single QueueListener thread formats them as JSON lines and writes them to
+the log file (rotation included) and the console. A full queue drops the
+record and counts it instead of blocking the request.
+
+Environment:
+
+    LOG_FILE                 JSON-lines log file (default app.log)
+    LOG_LEVEL                root level (default INFO)
+    LOG_LEVELS               per-logger levels, e.g. "sqlalchemy.engine=INFO,travora=DEBUG"
+    LOG_CONSOLE              also write to stderr (default 1)
+    LOG_DEBUG_SAMPLE_RATE    fraction of DEBUG records kept (default 0.01), except
+                             from loggers LOG_LEVELS sets to DEBUG, which keep all
+    LOG_QUEUE_SIZE           records buffered before dropping (default 10000)
+"""
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import has_request_context, request
+
+# Noisy libraries stay quiet unless LOG_LEVELS asks otherwise
+DEFAULT_LEVELS = {
+    'sqlalchemy': 'WARNING',
+    'werkzeug': 'INFO',
+    'urllib3': 'WARNING',
+    'PIL': 'INFO',
+}
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+_queue_handler = None
+# Logger trees written to their own file instead of app.log (see log_to_file)
+_dedicated_names = []
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Keep every record above DEBUG and a random `rate` share of DEBUG ones.
+
+    DEBUG records of the `exempt` logger trees are all kept, so a logger an
+    operator turned to DEBUG on purpose is not sampled away.
+    """
+
+    def __init__(self, rate, exempt=()):
+        super().__init__()
+        self.rate = rate
+        self.exempt = _NameFilter(list(exempt))
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.exempt.filter(record) or random.random() < self.rate
+
+
+class RequestContextFilter(logging.Filter):
+    # Runs on the thread that logs, before enqueueing, while the request is still active
+    def filter(self, record):
+        if has_request_context():
+            for key, value in (('method', request.method), ('path', request.path), ('endpoint', request.endpoint)):
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback here (the arguments may not be
+        # safe to format later on another thread) but leave the rest to the
+        # listener's formatter
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _NameFilter(logging.Filter):
+    """Accept records of the given logger trees (or reject them with exclude=True)."""
+
+    def __init__(self, names, exclude=False):
+        super().__init__()
+        self.names = names
+        self.exclude = exclude
+
+    def filter(self, record):
+        matched = any(record.name == n or record.name.startswith(n + '.') for n in self.names)
+        return matched != self.exclude
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _debug_overrides(levels):
+    # Logger trees explicitly set to DEBUG; their records are never sampled
+    return [name for name, level in levels.items() if logging.getLevelName(level) == logging.DEBUG]
+
 
 def setup_logging():
-    # Set up a rotating file handler (log rotation)
-    handler = RotatingFileHandler('app.log', maxBytes=5*1024*1024, backupCount=3)
-    handler.setLevel(logging.DEBUG)  # Log all levels from DEBUG upwards
+    """Install the queue handler on the root logger and start the writer thread."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    json_formatter = JsonFormatter()
+    file_handler = RotatingFileHandler(os.environ.get('LOG_FILE', 'app.log'), maxBytes=5*1024*1024, backupCount=3)
+    file_handler.setFormatter(json_formatter)
+    handlers = [file_handler]
+    if os.environ.get('LOG_CONSOLE', '1').lower() in ('1', 'true', 'yes'):
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(json_formatter)
+        handlers.append(console_handler)
+    for handler in handlers:
+        handler.addFilter(_NameFilter(_dedicated_names, exclude=True))
+
+    overrides = _parse_levels(os.environ.get('LOG_LEVELS'))
+    log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(DebugSampler(
+        float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.01)), exempt=_debug_overrides(overrides),
+    ))
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    root.addHandler(_queue_handler)
+    levels = dict(DEFAULT_LEVELS, **overrides)
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logging.getLogger(__name__).info('Logging setup complete')
+    return _listener
 
-    # Define log message format (timestamp, log level, message)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
 
-    # Add handler to the root logger
-    logging.getLogger().addHandler(handler)
+def log_to_file(logger_name, path, max_bytes=5*1024*1024, backup_count=3):
+    """Send `logger_name`'s records to their own JSON-lines file only.
 
-    # Set logging level to capture all messages
-    logging.basicConfig(level=logging.DEBUG)
+    The file is written by the same listener thread as everything else.
+    """
+    if _listener is None:
+        setup_logging()
+    if logger_name in _dedicated_names:
+        return
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(_NameFilter([logger_name]))
+    _dedicated_names.append(logger_name)
+    _listener.handlers = _listener.handlers + (handler,)
 
-    # Also log to the console (optional)
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)  # Log level for console (INFO and above)
-    console_handler.setFormatter(formatter)
-    logging.getLogger().addHandler(console_handler)
 
-    # Now you can use logging in your app
-    logging.info("Logging setup complete")
\ No newline at end of file
+def dropped_records():
+    return _queue_handler.dropped if _queue_handler is not None else 0
@@ -0,0 +1,271 @@
+"""Request metrics in the Prometheus text format, served on /metrics.
+
+Every request adds to a per-endpoint counter (by method and status) and a
+latency histogram. Scrapes also report DB pool usage and the page, facet
+and user cache hit rates.
+
+With several worker processes on one host, set METRICS_DIR to a directory
+they share. Each process then writes its totals there (at most every
+METRICS_FLUSH_SECONDS, and at exit), and /metrics sums the files of all
+processes. Files are named after the pid plus a random per-process token,
+so a worker that reuses a dead worker's pid starts a file of its own.
+Counters of exited processes are kept, so totals never go backwards; their
+pool gauges are dropped.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from flask import Response, abort, g, request
+
+PREFIX = 'travora'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """This process's request counters and latency histograms."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)  # (endpoint, method, status) -> count
+        # (endpoint, method) -> [per-bucket counts (non-cumulative, + overflow), sum, count]
+        self._latency = {}
+
+    def observe(self, endpoint, method, status, seconds):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            self._requests[(endpoint, method, status)] += 1
+            entry = self._latency.get((endpoint, method))
+            if entry is None:
+                entry = self._latency[(endpoint, method)] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': [[e, m, s, n] for (e, m, s), n in self._requests.items()],
+                'latency': [[e, m, list(v[0]), v[1], v[2]] for (e, m), v in self._latency.items()],
+            }
+
+
+registry = MetricsRegistry()
+
+# pid -> (snapshot file key, start time); a forked child gets its own entry
+_process_ids = {}
+
+
+def _process_id():
+    pid = os.getpid()
+    if pid not in _process_ids:
+        _process_ids[pid] = (f'{pid}-{uuid.uuid4().hex[:12]}', time.time())
+    return _process_ids[pid]
+
+
+def _cache_counts():
+    from facets import facet_cache
+    from page_cache import page_cache
+    from user_cache import user_cache
+
+    return {
+        'page': [page_cache.hits, page_cache.misses],
+        'facet': [facet_cache.hits, facet_cache.misses],
+        'user': [user_cache.stats['hits'], user_cache.stats['misses']],
+    }
+
+
+def _pool_usage():
+    from app import db
+
+    pool = db.engine.pool
+    usage = {}
+    # NullPool (file SQLite) keeps no connections and has none of these
+    for name in ('size', 'checkedout', 'overflow', 'checkedin'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            usage[name] = method()
+    return usage
+
+
+def process_snapshot():
+    snapshot = registry.snapshot()
+    snapshot['pid'] = os.getpid()
+    snapshot['key'], snapshot['started'] = _process_id()
+    snapshot['cache'] = _cache_counts()
+    snapshot['pool'] = _pool_usage()
+    return snapshot
+
+
+def _write_snapshot(directory, snapshot):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+    # Readers only ever see complete files
+    os.replace(tmp_path, os.path.join(directory, f"{snapshot['key']}.json"))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load_snapshots(directory):
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge(snapshots, buckets=LATENCY_BUCKETS):
+    """Sum counters and histograms across processes; keep live processes' pool gauges."""
+    requests = defaultdict(int)
+    latency = {}
+    cache = defaultdict(lambda: [0, 0])
+    pools, pool_started = {}, {}
+    for snap in snapshots:
+        for endpoint, method, status, count in snap.get('requests', []):
+            requests[(endpoint, method, status)] += count
+        for endpoint, method, counts, total, count in snap.get('latency', []):
+            entry = latency.setdefault((endpoint, method), [[0] * (len(buckets) + 1), 0.0, 0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+            entry[2] += count
+        for name, (hits, misses) in snap.get('cache', {}).items():
+            cache[name][0] += hits
+            cache[name][1] += misses
+        pid, started = snap['pid'], snap.get('started', 0)
+        if snap.get('pool') and (pid == os.getpid() or _pid_alive(pid)):
+            # Of several processes that had this pid, only the newest can be alive
+            if started >= pool_started.get(pid, started):
+                pools[pid], pool_started[pid] = snap['pool'], started
+    return {'requests': requests, 'latency': latency, 'cache': cache, 'pools': pools}
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _format_float(value):
+    return repr(float(value)) if value != int(value) else f'{int(value)}'
+
+
+def render(merged, buckets=LATENCY_BUCKETS):
+    """Render merged metrics as Prometheus text exposition format 0.0.4."""
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+
+    header('http_requests_total', 'counter', 'Requests served, by endpoint, method and status.')
+    for (endpoint, method, status), count in sorted(merged['requests'].items()):
+        lines.append(f'{PREFIX}_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+    header('http_request_duration_seconds', 'histogram', 'Request latency, by endpoint and method.')
+    for (endpoint, method), (counts, total, count) in sorted(merged['latency'].items()):
+        cumulative = 0
+        for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            le = bound if bound == '+Inf' else _format_float(bound)
+            lines.append(f'{PREFIX}_http_request_duration_seconds_bucket'
+                         f'{_labels(endpoint=endpoint, method=method, le=le)} {cumulative}')
+        lines.append(f'{PREFIX}_http_request_duration_seconds_sum{_labels(endpoint=endpoint, method=method)} {total!r}')
+        lines.append(f'{PREFIX}_http_request_duration_seconds_count{_labels(endpoint=endpoint, method=method)} {count}')
+
+    header('cache_hits_total', 'counter', 'Cache lookups that found an entry.')
+    for name, (hits, _) in sorted(merged['cache'].items()):
+        lines.append(f'{PREFIX}_cache_hits_total{_labels(cache=name)} {hits}')
+    header('cache_misses_total', 'counter', 'Cache lookups that found nothing.')
+    for name, (_, misses) in sorted(merged['cache'].items()):
+        lines.append(f'{PREFIX}_cache_misses_total{_labels(cache=name)} {misses}')
+    header('cache_hit_ratio', 'gauge', 'Share of cache lookups that were hits since start.')
+    for name, (hits, misses) in sorted(merged['cache'].items()):
+        ratio = hits / (hits + misses) if hits + misses else 0.0
+        lines.append(f'{PREFIX}_cache_hit_ratio{_labels(cache=name)} {ratio!r}')
+
+    for key, help_text in (
+        ('size', 'Configured connection pool size.'),
+        ('checkedout', 'Connections currently in use.'),
+        ('overflow', 'Connections open beyond the pool size.'),
+        ('checkedin', 'Idle connections in the pool.'),
+    ):
+        rows = [(pid, pool[key]) for pid, pool in sorted(merged['pools'].items()) if key in pool]
+        if rows:
+            header(f'db_pool_{key}', 'gauge', help_text)
+            lines.extend(f'{PREFIX}_db_pool_{key}{_labels(pid=pid)} {value}' for pid, value in rows)
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """Record every request and register the /metrics endpoint."""
+    app.config.setdefault('METRICS_DIR', None)
+    app.config.setdefault('METRICS_FLUSH_SECONDS', 5)
+    app.config.setdefault('METRICS_TOKEN', None)
+    state = {'flushed_at': 0.0}
+    flush_lock = threading.Lock()
+
+    def flush(force=False):
+        directory = app.config['METRICS_DIR']
+        if not directory:
+            return
+        now = time.monotonic()
+        with flush_lock:
+            if not force and now - state['flushed_at'] < app.config['METRICS_FLUSH_SECONDS']:
+                return
+            state['flushed_at'] = now
+        with app.app_context():
+            _write_snapshot(directory, process_snapshot())
+
+    @app.before_request
+    def _start_metrics_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_metrics(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            # The rule's endpoint, not the path, so labels stay bounded
+            endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+            registry.observe(endpoint, request.method, str(response.status_code), time.perf_counter() - started)
+            flush()
+        return response
+
+    def metrics_view():
+        token = app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        directory = app.config['METRICS_DIR']
+        if directory:
+            flush(force=True)
+            snapshots = _load_snapshots(directory)
+        else:
+            snapshots = [process_snapshot()]
+        return Response(render(merge(snapshots)), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    atexit.register(lambda: flush(force=True))
@@ -9,13 +9,21 @@ class User(db.Model, UserMixin):
     phone = db.Column(db.String(20), nullable=False)
     password = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
+    # Cleared by admin_toggle_user; Flask-Login refuses inactive users
+    active = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
     bookings = db.relationship('Booking', backref='user', lazy=True)
     
     def __repr__(self):
         return f'<User {self.email}>'
 
+    @property
+    def is_active(self):
+        return self.active is not False
+
 class Car(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # External fleet identifier used as the upsert key by `flask fleet import`
+    fleet_id = db.Column(db.String(64), unique=True, nullable=True)
     make = db.Column(db.String(50), nullable=False, index=True)
     model = db.Column(db.String(50), nullable=False, index=True)
     year = db.Column(db.Integer, nullable=False, index=True)
@@ -25,6 +33,8 @@ class Car(db.Model):
     # Legacy single image URL support (kept for backward compatibility)
     image_url = db.Column(db.String(200), nullable=True)
     is_available = db.Column(db.Boolean, default=True, index=True)
+    # Version for ETags (see conditional.py); image changes touch it too
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     bookings = db.relationship('Booking', backref='car', lazy=True)
     # New: related images
     images = db.relationship(
@@ -35,12 +45,19 @@ class Car(db.Model):
         return f'<Car {self.make} {self.model} ({self.year})>'
 
     @property
-    def primary_image_path(self):
-        # Prefer explicitly marked primary, else first image, else legacy image_url
+    def primary_image(self):
+        # Explicitly marked primary, else first image
         if self.images:
             primary = next((img for img in self.images if img.is_primary), None)
-            first = primary or self.images[0]
-            return first.file_path
+            return primary or self.images[0]
+        return None
+
+    @property
+    def primary_image_path(self):
+        # Prefer the primary gallery image, else legacy image_url
+        image = self.primary_image
+        if image is not None:
+            return image.file_path
         return self.image_url
 
     @property
@@ -53,24 +70,100 @@ class Car(db.Model):
 class CarImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     car_id = db.Column(db.Integer, db.ForeignKey('car.id'), nullable=False, index=True)
-    # Stored as a static-relative path e.g., "uploads/uuid_filename.jpg"
+    # Path inside UPLOAD_FOLDER, e.g. "static/uploads/blobs/ab/<sha256>.jpg";
+    # templates turn it into a URL with image_store.upload_url
     file_path = db.Column(db.String(255), nullable=False)
+    # Uploads and seeded images are content-addressed (see image_store.py); NULL for legacy rows
+    content_hash = db.Column(db.String(64), db.ForeignKey('image_blob.sha256'), nullable=True, index=True)
     is_primary = db.Column(db.Boolean, default=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Resized copies written by image_derivatives.py once encoding finishes:
+    # {"thumb": {"width": 320, "webp": "static/...", "jpeg": "static/..."}, ...}
+    derivatives = db.Column(db.JSON(none_as_null=True), nullable=True)
+
+    def srcset(self, fmt='jpeg'):
+        """`srcset` attribute value over all derivatives in `fmt`, or '' if none yet."""
+        if not self.derivatives:
+            return ''
+        from image_store import upload_url
+
+        entries = sorted(self.derivatives.values(), key=lambda d: d['width'])
+        return ', '.join(f"{upload_url(d[fmt])} {d['width']}w" for d in entries if d.get(fmt))
+
+    def derivative_url(self, name, fmt='jpeg'):
+        from image_store import upload_url
+
+        entry = (self.derivatives or {}).get(name)
+        if entry and entry.get(fmt):
+            return upload_url(entry[fmt])
+        return upload_url(self.file_path)
+
+
+class ImageBlob(db.Model):
+    # One stored file per distinct upload content, shared by every CarImage
+    # with the same bytes. ref_count is maintained by image_store.py.
+    sha256 = db.Column(db.String(64), primary_key=True)
+    file_path = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    derivatives = db.Column(db.JSON(none_as_null=True), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImageBlob {self.sha256[:12]} refs={self.ref_count}>'
 
 class Booking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    car_id = db.Column(db.Integer, db.ForeignKey('car.id'), nullable=False)
-    start_date = db.Column(db.DateTime, nullable=False)
-    end_date = db.Column(db.DateTime, nullable=False)
-    total_cost = db.Column(db.Float, nullable=False)
+    # active_history loads the committed value before an expired attribute is
+    # overwritten, so the flush listeners in analytics.py and occupancy.py can
+    # always see where an edited booking used to be
+    car_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('car.id'), nullable=False), active_history=True)
+    start_date = db.column_property(db.Column(db.DateTime, nullable=False), active_history=True)
+    end_date = db.column_property(db.Column(db.DateTime, nullable=False), active_history=True)
+    total_cost = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Serves the availability overlap check (see availability.py) and the
+    # newest-first keyset orderings of the user and admin booking lists
+    __table_args__ = (
+        db.Index('ix_booking_car_dates', 'car_id', 'start_date', 'end_date'),
+        db.Index('ix_booking_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_booking_created', 'created_at', 'id'),
+    )
     
     def __repr__(self):
         return f'<Booking {self.id} - User: {self.user_id}, Car: {self.car_id}>'
  
 
+class BookingRollup(db.Model):
+    # Per car per day booking aggregates, kept current by analytics.py in the
+    # same transaction as the booking change. A booking counts on its start day.
+    # car_id is deliberately not a foreign key so history survives car deletion.
+    car_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    booked_days = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<BookingRollup car={self.car_id} day={self.day} bookings={self.bookings}>'
+
+
+class CarOccupancy(db.Model):
+    # One row per car per month with any booked day: bit d-1 of `days` is set
+    # when day d is booked. Maintained by occupancy.py in the booking's own
+    # flush. Keyed month first so fleet-wide queries read one month's range.
+    month = db.Column(db.Date, primary_key=True)
+    car_id = db.Column(db.Integer, primary_key=True)
+    days = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CarOccupancy car={self.car_id} month={self.month} days={self.days:031b}>'
+
+
 class Wallet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False, index=True)
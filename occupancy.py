@@ -0,0 +1,366 @@
+"""Fleet occupancy kept as one day bitmap per car per month.
+
+Each CarOccupancy row holds a car's booked days in a month as a 31-bit
+integer: bit d-1 is day d. As in the availability checks, a booking occupies
+its start and end days and every day in between. Every flush that creates,
+edits or deletes a Booking recomputes the bitmaps of the car-months it
+touched from the Booking table, on the same connection. The bitmaps
+therefore commit or roll back with the booking, and they stay exact when
+bookings overlap.
+
+Fleet-wide questions become bit tests over at most one row per car per
+month, evaluated by the database:
+
+    idle_cars        available cars with no booked day in a range (and
+                     idle_count, how many there are)
+    booked_per_day   how many cars are booked on each day of a range
+    utilization      booked car-days as a share of the fleet's capacity
+    heatmap          a month of daily utilization per category
+
+``flask occupancy rebuild`` backfills the table from all bookings.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, event, func, inspect, or_, select
+
+from app import app, db
+from availability import as_datetime
+from db_upsert import upsert
+from models import Booking, Car, CarOccupancy
+
+OCCUPANCY_FIELDS = ('car_id', 'start_date', 'end_date')
+# Longest range the utilization and idle-car queries accept
+MAX_RANGE_DAYS = 366
+# Cars per query (and per transaction when rebuilding)
+CAR_CHUNK = 500
+# Idle car ids returned per API page, by default and at most
+IDLE_PAGE_SIZE = 1000
+MAX_IDLE_PAGE_SIZE = 20000
+
+# Booked cars on day i + 1 of the month, for i in 0..30
+_DAY_COUNTS = [func.sum(CarOccupancy.days.op('>>')(i).op('&')(1)) for i in range(31)]
+
+
+class OccupancyRangeError(ValueError):
+    """Invalid date range (reported as 400)."""
+
+
+def as_date(value):
+    return as_datetime(value).date()
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(month):
+    return month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+
+def months(start, end):
+    """First days of the months overlapping [start, end]."""
+    month = month_start(start)
+    while month <= end:
+        yield month
+        month = month_end(month) + timedelta(days=1)
+
+
+def day_mask(month, start, end):
+    """Bits of the days of `month` that fall within [start, end]."""
+    first, last = max(start, month), min(end, month_end(month))
+    if first > last:
+        return 0
+    return ((1 << (last.day - first.day + 1)) - 1) << (first.day - 1)
+
+
+def range_masks(start, end):
+    return [(month, day_mask(month, start, end)) for month in months(start, end)]
+
+
+def bitmaps(intervals):
+    """{month: days} for one car's inclusive (start, end) date intervals."""
+    result = defaultdict(int)
+    for start, end in intervals:
+        for month, mask in range_masks(start, end):
+            result[month] |= mask
+    return result
+
+
+def _chunks(values, size=CAR_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _intervals(connection, car_ids, first=None, last=None):
+    """{car_id: [(start, end)]} of the cars' bookings, optionally within [first, last]."""
+    stmt = select(Booking.car_id, Booking.start_date, Booking.end_date).where(Booking.car_id.in_(car_ids))
+    if first is not None:
+        stmt = stmt.where(Booking.end_date >= as_datetime(first), Booking.start_date <= as_datetime(last))
+    intervals = defaultdict(list)
+    for car_id, start, end in connection.execute(stmt):
+        intervals[car_id].append((as_date(start), as_date(end)))
+    return intervals
+
+
+def _write(connection, rows, empty):
+    upsert(connection, CarOccupancy.__table__, rows, ['month', 'car_id'], lambda t, ex: {'days': ex.days})
+    if empty:
+        table = CarOccupancy.__table__
+        connection.execute(
+            table.delete().where(and_(table.c.month == bindparam('m'), table.c.car_id == bindparam('c'))),
+            [{'m': month, 'c': car_id} for month, car_id in empty],
+        )
+
+
+def recompute(connection, car_months):
+    """Rewrite the bitmaps of the given (car_id, month) pairs from the Booking table."""
+    months_of = defaultdict(set)
+    for car_id, month in car_months:
+        months_of[car_id].add(month)
+    rows, empty = [], []
+    for chunk in _chunks(sorted(months_of)):
+        first = min(min(months_of[car_id]) for car_id in chunk)
+        last = month_end(max(max(months_of[car_id]) for car_id in chunk))
+        intervals = _intervals(connection, chunk, first, last)
+        for car_id in chunk:
+            bits = bitmaps(intervals[car_id])
+            for month in months_of[car_id]:
+                if bits.get(month):
+                    rows.append({'month': month, 'car_id': car_id, 'days': bits[month]})
+                else:
+                    empty.append((month, car_id))
+    _write(connection, rows, empty)
+
+
+def _committed_values(obj):
+    # Values of a booking being edited or deleted as they were before this flush
+    state = inspect(obj)
+    values = []
+    for name in OCCUPANCY_FIELDS:
+        history = state.attrs[name].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(obj, name))
+    return values
+
+
+def _car_months(car_id, start, end):
+    if car_id is None or start is None or end is None:
+        return []
+    return [(car_id, month) for month in months(as_date(start), as_date(end))]
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_occupancy(session, flush_context):
+    car_months = set()
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            car_months.update(_car_months(obj.car_id, obj.start_date, obj.end_date))
+    for obj in session.dirty:
+        state = inspect(obj) if isinstance(obj, Booking) else None
+        if state is not None and any(state.attrs[name].history.has_changes() for name in OCCUPANCY_FIELDS):
+            car_months.update(_car_months(*_committed_values(obj)))
+            car_months.update(_car_months(obj.car_id, obj.start_date, obj.end_date))
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            car_months.update(_car_months(*_committed_values(obj)))
+    if car_months:
+        recompute(session.connection(), car_months)
+
+
+def parse_range(args, default_days=7):
+    """(start, end) dates from `start`/`end` query args; defaults to the next `default_days` days."""
+    try:
+        start = datetime.strptime(args['start'], '%Y-%m-%d').date() if args.get('start') else date.today()
+        if args.get('end'):
+            end = datetime.strptime(args['end'], '%Y-%m-%d').date()
+        else:
+            end = start + timedelta(days=default_days - 1)
+    except ValueError:
+        raise OccupancyRangeError('start and end must be dates in YYYY-MM-DD format') from None
+    if end < start:
+        raise OccupancyRangeError('end must not be before start')
+    if (end - start).days + 1 > MAX_RANGE_DAYS:
+        raise OccupancyRangeError(f'ranges are limited to {MAX_RANGE_DAYS} days')
+    return start, end
+
+
+def busy_clause(start, end):
+    """CarOccupancy criteria for rows with a booked day in [start, end]."""
+    return or_(*[
+        and_(CarOccupancy.month == month, CarOccupancy.days.op('&')(mask) != 0)
+        for month, mask in range_masks(start, end)
+    ])
+
+
+def _idle_criteria(start, end, category):
+    busy = select(CarOccupancy.car_id).where(busy_clause(start, end))
+    criteria = [Car.is_available.is_(True), Car.id.not_in(busy)]
+    if category:
+        criteria.append(Car.category == category)
+    return criteria
+
+
+def idle_count(start, end, category=None):
+    """How many available cars have no booked day in [start, end]."""
+    # Available cars minus the busy ones: both counts read far fewer rows
+    # than testing every available car against the busy set
+    available = select(func.count(Car.id)).where(Car.is_available.is_(True))
+    busy = (
+        select(func.count(func.distinct(CarOccupancy.car_id)))
+        .join(Car, Car.id == CarOccupancy.car_id)
+        .where(busy_clause(start, end), Car.is_available.is_(True))
+    )
+    if category:
+        available = available.where(Car.category == category)
+        busy = busy.where(Car.category == category)
+    return db.session.execute(select(available.scalar_subquery() - busy.scalar_subquery())).scalar()
+
+
+def idle_cars(start, end, category=None, after=None, limit=None):
+    """Ids of available cars with no booked day in [start, end], by id after `after`."""
+    stmt = select(Car.id).where(*_idle_criteria(start, end, category)).order_by(Car.id).limit(limit)
+    if after is not None:
+        stmt = stmt.where(Car.id > after)
+    return db.session.execute(stmt).scalars().all()
+
+
+def booked_per_day(start, end, by=None, category=None):
+    """{group: [booked cars on each day from start to end]}.
+
+    Groups are the values of the Car column `by`, or just None without it.
+    """
+    group = [by] if by is not None else []
+    stmt = (
+        select(CarOccupancy.month, *group, *_DAY_COUNTS)
+        .join(Car, Car.id == CarOccupancy.car_id)
+        .where(CarOccupancy.month.between(month_start(start), month_start(end)))
+        .group_by(CarOccupancy.month, *group)
+    )
+    if category:
+        stmt = stmt.where(Car.category == category)
+    length = (end - start).days + 1
+    result = defaultdict(lambda: [0] * length)
+    for row in db.session.execute(stmt):
+        month, counts = row[0], row[1 + len(group):]
+        counts_of_group = result[row[1] if group else None]
+        for day in range(max(start, month).day, min(end, month_end(month)).day + 1):
+            counts_of_group[(month.replace(day=day) - start).days] += counts[day - 1] or 0
+    return result
+
+
+def _percent(booked, capacity):
+    return round(100.0 * booked / capacity, 1) if capacity else 0.0
+
+
+def utilization(start, end, category=None):
+    """Booked car-days over cars x days for the fleet (or one category)."""
+    cars = db.session.query(func.count(Car.id))
+    if category:
+        cars = cars.filter(Car.category == category)
+    cars = cars.scalar()
+    per_day = booked_per_day(start, end, category=category).get(None) or [0] * ((end - start).days + 1)
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'category': category,
+        'cars': cars,
+        'booked_car_days': sum(per_day),
+        'utilization': _percent(sum(per_day), cars * len(per_day)),
+        'days': [
+            {'date': (start + timedelta(days=i)).isoformat(), 'booked': booked, 'utilization': _percent(booked, cars)}
+            for i, booked in enumerate(per_day)
+        ],
+    }
+
+
+def car_utilization(car_id, start, end):
+    """Booked days of one car in [start, end] and their share of the range."""
+    bits = dict(db.session.query(CarOccupancy.month, CarOccupancy.days).filter(
+        CarOccupancy.car_id == car_id,
+        CarOccupancy.month.between(month_start(start), month_start(end)),
+    ))
+    booked = sum(bin(bits.get(month, 0) & mask).count('1') for month, mask in range_masks(start, end))
+    days = (end - start).days + 1
+    return {
+        'car_id': car_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'booked_days': booked,
+        'utilization': _percent(booked, days),
+    }
+
+
+def heatmap(month):
+    """Daily utilization of every category (and the whole fleet) in `month`."""
+    end = month_end(month)
+    cars = dict(db.session.query(Car.category, func.count(Car.id)).group_by(Car.category))
+    per_day = booked_per_day(month, end, by=Car.category)
+    days = [month.replace(day=day) for day in range(1, end.day + 1)]
+    fleet = [sum(counts[i] for counts in per_day.values()) for i in range(len(days))]
+    rows = [{'label': 'All cars', 'cars': sum(cars.values()), 'booked': fleet}]
+    for category in sorted(cars, key=lambda c: c or ''):
+        rows.append({
+            'label': (category or 'Uncategorized').capitalize(),
+            'cars': cars[category],
+            'booked': per_day[category] if category in per_day else [0] * len(days),
+        })
+    for row in rows:
+        row['percent'] = [_percent(booked, row['cars']) for booked in row['booked']]
+    return {'month': month, 'days': days, 'rows': rows}
+
+
+def rebuild(chunk_size=CAR_CHUNK, echo=None):
+    """Recompute every bitmap from Booking, one chunk of cars per transaction.
+
+    Each chunk's rows are upserted and its stale rows deleted together, so
+    readers see either the old or the new bitmaps of a car while the rebuild
+    runs, never an empty table.
+    """
+    car_ids = sorted(
+        set(db.session.execute(select(Booking.car_id).distinct()).scalars())
+        | set(db.session.execute(select(CarOccupancy.car_id).distinct()).scalars())
+    )
+    db.session.commit()
+    written = 0
+    for chunk in _chunks(car_ids, chunk_size):
+        connection = db.session.connection()
+        rows = [
+            {'month': month, 'car_id': car_id, 'days': days}
+            for car_id, intervals in _intervals(connection, chunk).items()
+            for month, days in bitmaps(intervals).items()
+            if days
+        ]
+        fresh = {(row['month'], row['car_id']) for row in rows}
+        existing = connection.execute(
+            select(CarOccupancy.month, CarOccupancy.car_id).where(CarOccupancy.car_id.in_(chunk))
+        )
+        _write(connection, rows, [key for key in map(tuple, existing) if key not in fresh])
+        db.session.commit()
+        written += len(chunk)
+        if echo:
+            echo(f'{written} of {len(car_ids)} cars')
+    return len(car_ids)
+
+
+occupancy_cli = AppGroup('occupancy', help='Fleet occupancy bitmaps.')
+
+
+@occupancy_cli.command('rebuild')
+@click.option('--chunk-size', default=CAR_CHUNK, show_default=True, help='Cars per transaction.')
+def rebuild_command(chunk_size):
+    """Backfill the occupancy bitmaps from all bookings."""
+    db.create_all()
+    total = rebuild(chunk_size=chunk_size, echo=click.echo)
+    click.echo(f'Rebuilt occupancy for {total} cars.')
+
+
+app.cli.add_command(occupancy_cli)
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+
+import catalog_version
+from app import app
+
+
+class PageCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=512, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+page_cache = PageCache(
+    maxsize=app.config.get('PAGE_CACHE_SIZE', 512),
+    ttl=app.config.get('PAGE_CACHE_TTL', 60),
+)
+
+
+@catalog_version.on_change
+def _evict_stale_pages(version):
+    # Every entry is keyed on an older version now and can never be hit again
+    page_cache.clear()
+
+
+def _cache_key():
+    # Blank parameters (e.g. ?category=&sort=) render the same page as omitting them
+    args = sorted((k, v) for k, v in request.args.items(multi=True) if v != '')
+    # Views behind conditional() also key on their ETag, i.e. the data in the database
+    return (request.endpoint, request.path, tuple(args), catalog_version.current_version(), g.get('_etag'))
+
+
+def cache_page(view):
+    """Serve anonymous GETs of a catalog page from the rendered-page cache."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if (not current_app.config.get('PAGE_CACHE_ENABLED', True)
+                or request.method != 'GET'
+                or current_user.is_authenticated
+                or session.get('_flashes')):
+            return view(*args, **kwargs)
+
+        key = _cache_key()
+        cached = page_cache.get(key)
+        if cached is not None:
+            body, mimetype = cached
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.headers['X-Page-Cache'] = 'HIT'
+            response.vary.add('Cookie')
+            return response
+
+        response = make_response(view(*args, **kwargs))
+        # Pages that flashed a message or set a cookie are specific to this visitor
+        if (response.status_code == 200 and not session.modified
+                and 'Set-Cookie' not in response.headers):
+            page_cache.set(key, (response.get_data(), response.mimetype))
+        response.headers['X-Page-Cache'] = 'MISS'
+        response.vary.add('Cookie')
+        return response
+    return wrapper
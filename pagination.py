@@ -0,0 +1,123 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query plus opaque cursors to its neighbours."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(values):
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, width):
+    """Decode a cursor produced by encode_cursor; returns None if it is malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != width:
+        return None
+    return values
+
+
+def _after_clause(columns, descending, values):
+    # Expanded row-value comparison, e.g. for (a asc, b asc) after (x, y):
+    # a > x OR (a = x AND b > y). Portable across SQLite and PostgreSQL.
+    alternatives = []
+    for i, (column, desc, value) in enumerate(zip(columns, descending, values)):
+        equal_prefix = [c == v for c, v in zip(columns[:i], values[:i])]
+        step = column < value if desc else column > value
+        alternatives.append(and_(*equal_prefix, step))
+    return or_(*alternatives)
+
+
+def _row_key(item, keys):
+    return [key(item) if callable(key) else getattr(item, key) for key in keys]
+
+
+def keyset_paginate(query, order_by, after=None, before=None, per_page=20, keys=None):
+    """Paginate `query` on a unique, non-null ordering without OFFSET or COUNT.
+
+    `order_by` is a list of (column, descending) pairs ending in a unique column
+    (normally the primary key). `keys` optionally gives, for each column, the
+    attribute name or callable that reads the value back from a result row; by
+    default the mapped attribute names are used. Pass the
+    `next_cursor` of a page as `after`, or its `prev_cursor` as `before`.
+    Every page costs one indexed range scan of `per_page + 1` rows.
+    """
+    columns = [column for column, _ in order_by]
+    descending = [bool(desc) for _, desc in order_by]
+    keys = keys or [column.key for column in columns]
+
+    after_values = decode_cursor(after, len(columns))
+    before_values = decode_cursor(before, len(columns)) if after_values is None else None
+
+    if before_values is not None:
+        # Walk backwards: flip every direction, then restore page order
+        flipped = [not desc for desc in descending]
+        query = query.filter(_after_clause(columns, flipped, before_values))
+        query = query.order_by(*[c.desc() if d else c.asc() for c, d in zip(columns, flipped)])
+        rows = query.limit(per_page + 1).all()
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = len(rows) > per_page, True
+    else:
+        if after_values is not None:
+            query = query.filter(_after_clause(columns, descending, after_values))
+        query = query.order_by(*[c.desc() if d else c.asc() for c, d in zip(columns, descending)])
+        rows = query.limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_prev, has_next = after_values is not None, len(rows) > per_page
+
+    next_cursor = prev_cursor = None
+    if items and has_next:
+        next_cursor = encode_cursor(_row_key(items[-1], keys))
+    if items and has_prev:
+        prev_cursor = encode_cursor(_row_key(items[0], keys))
+    return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
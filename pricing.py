@@ -0,0 +1,188 @@
+"""Booking prices and availability quotes, one at a time or in bulk.
+
+``booking_total`` is the only place a booking's price is computed; the
+booking service uses it when booking, rescheduling and moving, so quotes
+and charges always agree.
+
+``quote_many`` prices any number of (car_id, start, end) requests with two
+queries, however many cars they name: the cars' rates, then the cars'
+bookings that overlap one of the requested date windows. Long id lists are
+bound as a single JSON array (SQLite) or array (PostgreSQL) parameter
+rather than one parameter per id. Each request is then checked against its
+car's bookings sorted by start with a running maximum of the end dates, so
+a conflict check is a binary search instead of a query.
+"""
+import json
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import Integer, bindparam, column, func, or_, select, true
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app import db
+from availability import as_datetime, overlap_clause
+from models import Booking, Car
+
+# Ids bound one parameter each in IN (...); longer lists go in one array parameter
+MAX_IN_LIST = 500
+# Distinct date windows matched individually; more are covered by their overall span
+MAX_WINDOWS = 50
+
+
+class QuoteRequestError(ValueError):
+    """Malformed quote request (reported as 400)."""
+
+
+def booking_days(start_date, end_date):
+    return (as_datetime(end_date) - as_datetime(start_date)).days
+
+
+def booking_total(daily_rate, start_date, end_date):
+    """Price of renting at `daily_rate` from `start_date` to `end_date`."""
+    return round(booking_days(start_date, end_date) * daily_rate, 2)
+
+
+class _CarBookings:
+    """A car's bookings sorted by start, with the running maximum end date."""
+
+    def __init__(self, intervals):
+        intervals.sort()
+        self.starts = [start for start, _ in intervals]
+        self.max_ends = []
+        latest = None
+        for _, end in intervals:
+            latest = end if latest is None or end > latest else latest
+            self.max_ends.append(latest)
+
+    def overlaps(self, start_date, end_date):
+        # Bookings starting on or before end_date; one of them overlaps if the
+        # latest of their end dates reaches start_date (inclusive ranges)
+        count = bisect_right(self.starts, end_date)
+        return count > 0 and self.max_ends[count - 1] >= start_date
+
+
+def _id_filter(id_column, ids):
+    """Criteria for `id_column` in `ids` using a fixed number of bound parameters."""
+    ids = sorted(ids)
+    if len(ids) <= MAX_IN_LIST:
+        return id_column.in_(ids)
+    dialect = db.session.get_bind(mapper=Car.__mapper__).dialect.name
+    if dialect == 'sqlite':
+        return id_column.in_(select(column('value')).select_from(func.json_each(json.dumps(ids))))
+    if dialect == 'postgresql':
+        return id_column == func.any(bindparam('quote_ids', ids, type_=ARRAY(Integer)))
+    # Elsewhere read every row; callers keep only the ids they asked for
+    return true()
+
+
+def _window_filter(windows):
+    """Bookings overlapping any of the (start, end) windows."""
+    if len(windows) > MAX_WINDOWS:
+        windows = [(min(s for s, _ in windows), max(e for _, e in windows))]
+    return or_(*[overlap_clause(start, end) for start, end in sorted(windows)])
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return as_datetime(value)
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d')
+    except ValueError:
+        raise QuoteRequestError(f'invalid date {value!r}, expected YYYY-MM-DD') from None
+
+
+def quote_many(requests):
+    """Quote every (car_id, start_date, end_date) in `requests`.
+
+    Returns one dict per request, in order, with the days, rate, total and
+    whether the car can be booked for those dates (and if not, why).
+    """
+    requests = [(car_id, parse_date(start), parse_date(end)) for car_id, start, end in requests]
+    car_ids = {car_id for car_id, _, _ in requests}
+    windows = {(s, e) for _, s, e in requests if s < e}
+
+    cars = {}
+    if car_ids:
+        for car_id, daily_rate, is_available in db.session.execute(
+                select(Car.id, Car.daily_rate, Car.is_available).where(_id_filter(Car.id, car_ids))):
+            if car_id in car_ids:
+                cars[car_id] = (daily_rate, is_available)
+
+    intervals = defaultdict(list)
+    if windows and cars:
+        for car_id, start, end in db.session.execute(
+                select(Booking.car_id, Booking.start_date, Booking.end_date).where(
+                    _id_filter(Booking.car_id, cars), _window_filter(list(windows)),
+                )):
+            if car_id in cars:
+                intervals[car_id].append((start, end))
+    bookings = {car_id: _CarBookings(intervals[car_id]) for car_id in cars}
+
+    quotes = []
+    for car_id, start, end in requests:
+        quote = {'car_id': car_id, 'start_date': start.date().isoformat(), 'end_date': end.date().isoformat()}
+        if car_id not in cars:
+            quote.update(available=False, reason='unknown car')
+        elif start >= end:
+            quote.update(available=False, reason='end date must be after start date')
+        else:
+            daily_rate, is_available = cars[car_id]
+            quote.update(
+                days=booking_days(start, end),
+                daily_rate=daily_rate,
+                total=booking_total(daily_rate, start, end),
+                available=bool(is_available) and not bookings[car_id].overlaps(start, end),
+            )
+            if not is_available:
+                quote['reason'] = 'car not available'
+            elif not quote['available']:
+                quote['reason'] = 'already booked'
+        quotes.append(quote)
+    return quotes
+
+
+def _field(item, name):
+    if not isinstance(item, dict) or name not in item:
+        raise QuoteRequestError(f'every entry needs "{name}"')
+    return item[name]
+
+
+def parse_quote_request(payload, max_items):
+    """Turn a JSON quote request into (car_id, start, end) tuples.
+
+    Either ``{"items": [{"car_id": 1, "start": "2025-07-01", "end": "2025-07-04"}, ...]}``
+    or ``{"ranges": [{"start": ..., "end": ...}, ...], "car_ids": [...]}`` for
+    every listed car (all available cars when car_ids is left out) over every range.
+    """
+    if not isinstance(payload, dict) or ('items' in payload) == ('ranges' in payload):
+        raise QuoteRequestError('send a JSON object with either "items" or "ranges"')
+    if 'items' in payload:
+        items = payload['items']
+        if not isinstance(items, list) or len(items) > max_items:
+            raise QuoteRequestError(f'"items" must be a list of at most {max_items} entries')
+        requests = [(_field(i, 'car_id'), parse_date(_field(i, 'start')), parse_date(_field(i, 'end'))) for i in items]
+    else:
+        ranges = payload['ranges']
+        if not isinstance(ranges, list):
+            raise QuoteRequestError('"ranges" must be a list')
+        ranges = [(parse_date(_field(r, 'start')), parse_date(_field(r, 'end'))) for r in ranges]
+        car_ids = payload.get('car_ids')
+        if car_ids is None:
+            # One car past what the limit allows is enough to refuse the request
+            car_ids = db.session.execute(
+                select(Car.id).where(Car.is_available.is_(True)).order_by(Car.id)
+                .limit(max_items // max(len(ranges), 1) + 1)
+            ).scalars().all()
+        elif not isinstance(car_ids, list):
+            raise QuoteRequestError('"car_ids" must be a list')
+        if len(ranges) * len(car_ids) > max_items:
+            raise QuoteRequestError(f'more quotes requested than the limit of {max_items}')
+        requests = [(car_id, start, end) for start, end in ranges for car_id in car_ids]
+    for car_id, _, _ in requests:
+        if isinstance(car_id, bool) or not isinstance(car_id, int):
+            raise QuoteRequestError(f'invalid car_id {car_id!r}')
+    return requests
+
@@ -0,0 +1,207 @@
+"""On-demand cProfile of single requests.
+
+A request is profiled when
+
+* an admin adds ``?_profile=1`` to the URL,
+* it carries an ``X-Profile-Token`` header made by ``flask profiler token``
+  (signed with SECRET_KEY, valid for PROFILE_TOKEN_MAX_AGE seconds), or
+* it is picked by PROFILE_SAMPLE_RATE (a fraction of all traffic, default 0).
+
+The whole request, hooks included, runs under cProfile. Its time is split into
+DB (SQL statements), template rendering (minus the SQL run from templates) and
+the Python rest, which also go into the Server-Timing header. The pstats dump
+(open with snakeviz, flameprof or gprof2dot) and a JSON summary are saved in
+PROFILE_DIR, which keeps only the newest PROFILE_KEEP dumps.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+from datetime import datetime
+
+import click
+from flask import g, request
+from flask.cli import AppGroup
+from flask_login import current_user
+from itsdangerous import BadSignature, TimestampSigner
+from jinja2 import Template
+
+from sql_instrumentation import current_sql_stats
+
+TOKEN_HEADER = 'X-Profile-Token'
+QUERY_FLAG = '_profile'
+_SALT = 'travora-profiler'
+
+profiler_cli = AppGroup('profiler', help='Request profiling.')
+
+
+class TimedTemplate(Template):
+    """Jinja template that reports its render time to a profiled request."""
+
+    def render(self, *args, **kwargs):
+        timing = g.get('_profile_timing')
+        if timing is None:
+            return super().render(*args, **kwargs)
+        stats = current_sql_stats()
+        db_before = stats.total_ms if stats else 0.0
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            timing['template_ms'] += (time.perf_counter() - started) * 1000.0
+            # Lazy loads in templates are DB time, not rendering time
+            timing['template_db_ms'] += (stats.total_ms if stats else 0.0) - db_before
+
+
+def _signer(app):
+    return TimestampSigner(app.config['SECRET_KEY'], salt=_SALT)
+
+
+def make_token(app):
+    return _signer(app).sign('profile').decode()
+
+
+def _valid_token(app, token):
+    try:
+        _signer(app).unsign(token, max_age=app.config['PROFILE_TOKEN_MAX_AGE'])
+    except BadSignature:
+        return False
+    return True
+
+
+def _wants_profile(app):
+    if request.endpoint == 'static':
+        return False
+    token = request.headers.get(TOKEN_HEADER)
+    if token and _valid_token(app, token):
+        return True
+    if QUERY_FLAG in request.args and current_user.is_authenticated and current_user.is_admin:
+        return True
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def _top_functions(profile, limit=20):
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': f'{os.path.basename(filename)}:{line}({name})' if line else name,
+            'calls': calls,
+            'tottime_ms': round(tottime * 1000.0, 2),
+            'cumtime_ms': round(cumtime * 1000.0, 2),
+        })
+    rows.sort(key=lambda row: row['cumtime_ms'], reverse=True)
+    return rows[:limit]
+
+
+def _save(app, profile, summary):
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    stamp = summary['at'].replace(':', '').replace('-', '')
+    name = f"{stamp}-{os.getpid()}-{summary['endpoint'] or 'unmatched'}"
+    profile.dump_stats(os.path.join(directory, name + '.prof'))
+    with open(os.path.join(directory, name + '.json'), 'w') as f:
+        json.dump(dict(summary, name=name, top=_top_functions(profile)), f)
+    _trim(directory, app.config['PROFILE_KEEP'])
+    return name
+
+
+def _trim(directory, keep):
+    # Names start with a timestamp, so sorting them sorts by age
+    names = sorted(n[:-len('.json')] for n in os.listdir(directory) if n.endswith('.json'))
+    for name in names[:max(len(names) - keep, 0)]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(app):
+    """Summaries of the saved dumps, newest first."""
+    directory = app.config['PROFILE_DIR']
+    if not os.path.isdir(directory):
+        return []
+    summaries = []
+    for filename in sorted(os.listdir(directory), reverse=True):
+        if filename.endswith('.json'):
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    summaries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return summaries
+
+
+def init_profiler(app):
+    """Profile requests that ask for it and register `flask profiler`."""
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+    app.config.setdefault('PROFILE_KEEP', 50)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_TOKEN_MAX_AGE', 3600)
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def _start_profile():
+        if not _wants_profile(app):
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler already owns this thread
+            return
+        g._profile = profile
+        g._profile_started = time.perf_counter()
+        g._profile_timing = {'template_ms': 0.0, 'template_db_ms': 0.0}
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+        profile.disable()
+        total_ms = (time.perf_counter() - g.pop('_profile_started')) * 1000.0
+        timing = g.pop('_profile_timing')
+        stats = current_sql_stats()
+        db_ms = stats.total_ms if stats else 0.0
+        template_ms = max(timing['template_ms'] - timing['template_db_ms'], 0.0)
+        summary = {
+            'at': datetime.utcnow().isoformat(timespec='microseconds'),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'db_ms': round(db_ms, 1),
+            'statements': stats.count if stats else 0,
+            'template_ms': round(template_ms, 1),
+            'python_ms': round(max(total_ms - db_ms - template_ms, 0.0), 1),
+        }
+        name = _save(app, profile, summary)
+        response.headers['X-Profile'] = name
+        response.headers.add(
+            'Server-Timing', f"tpl;dur={summary['template_ms']:.1f}, py;dur={summary['python_ms']:.1f}",
+        )
+        return response
+
+    @app.teardown_request
+    def _stop_profile(exc):
+        # after_request is skipped when the request fails outright
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            profile.disable()
+
+    app.cli.add_command(profiler_cli)
+
+
+@profiler_cli.command('token')
+def token_command():
+    """Print a token for the X-Profile-Token header."""
+    from flask import current_app
+
+    click.echo(make_token(current_app))
+    click.echo(f"Valid for {current_app.config['PROFILE_TOKEN_MAX_AGE']} seconds.", err=True)
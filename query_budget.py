@@ -0,0 +1,97 @@
+"""Guard routes against N+1 regressions by counting SQL statements per request.
+
+Routes declare their budget with the ``query_budget`` decorator:
+
+    @app.route('/my-bookings')
+    @login_required
+    @query_budget(3)
+    def my_bookings(): ...
+
+and a test or benchmark drives them through the Flask test client:
+
+    check_route_budget(client, '/my-bookings')   # raises QueryBudgetExceeded
+"""
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Counts statements executed on any engine by the current thread."""
+
+    def __init__(self):
+        self.statements = []
+        self._thread_id = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread_id:
+            self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+
+def _format_failure(label, budget, statements):
+    lines = [f'{label} ran {len(statements)} SQL statements (budget {budget}):']
+    lines.extend(f'  {i + 1}. {" ".join(s.split())}' for i, s in enumerate(statements))
+    return '\n'.join(lines)
+
+
+@contextmanager
+def assert_max_queries(budget, label='block'):
+    counter = QueryCounter()
+    with counter:
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(_format_failure(label, budget, counter.statements))
+
+
+def query_budget(max_statements):
+    """Declare the maximum number of SQL statements a view may run per request."""
+    def decorator(view):
+        # functools.wraps in outer decorators (e.g. login_required) copies this
+        view.query_budget = max_statements
+        return view
+    return decorator
+
+
+def budget_for(app, path, method='GET'):
+    """Return the declared budget of the view serving `path`, or None."""
+    adapter = app.url_map.bind('localhost')
+    endpoint, _ = adapter.match(urlsplit(path).path, method=method)
+    return getattr(app.view_functions[endpoint], 'query_budget', None)
+
+
+def check_route_budget(client, path, budget=None, method='GET', **request_kwargs):
+    """Request `path` and fail if it runs more statements than its budget.
+
+    The budget defaults to the one declared on the view with ``query_budget``.
+    Returns the response so callers can make further assertions.
+    """
+    if budget is None:
+        budget = budget_for(client.application, path, method)
+    if budget is None:
+        raise ValueError(f'No query budget declared for {path}')
+    counter = QueryCounter()
+    with counter:
+        response = client.open(path, method=method, **request_kwargs)
+    if counter.count > budget:
+        raise QueryBudgetExceeded(_format_failure(f'{method} {path}', budget, counter.statements))
+    return response
@@ -1,25 +1,62 @@
-from flask import render_template, redirect, url_for, flash, request, abort
+from flask import render_template, redirect, url_for, flash, request, abort, send_from_directory, Response, stream_with_context, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import app, db, login_manager
-from models import User, Car, Booking, CarImage, Wallet, Payment
-from datetime import datetime
+from models import User, Car, Booking, CarImage, Wallet
+from datetime import datetime, timedelta
 from forms import LoginForm, RegistrationForm, CarForm, BookingForm, EditBookingForm, BookingModificationForm
-from sqlalchemy import func
+from availability import free_cars_clause
+from pagination import keyset_paginate
+from query_budget import query_budget
+from db_config import read_only
+from sql_instrumentation import slow_requests
+from profiler import QUERY_FLAG, list_profiles
+from page_cache import cache_page
+from conditional import car_state, catalog_state, conditional
+import admin_exports
+import car_search
+import facets
+import occupancy
+import pricing
+from exports import iter_lines
+from user_cache import user_cache
+import analytics
+import booking_service
+from booking_service import BookingNotFound, InsufficientFunds, SlotUnavailable
+from assets import IMMUTABLE_MAX_AGE
+from image_derivatives import DERIVED_DIR, schedule_derivatives
+from image_store import BLOB_DIR, store_upload, release_unreferenced
+from sqlalchemy.orm import joinedload, lazyload
+import hmac
 import os
-import uuid
 from werkzeug.utils import secure_filename
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Cached detached snapshot; admin user edits invalidate it. Deactivated
+    # users are logged out on their next request.
+    user = user_cache.load(int(user_id))
+    return user if user is not None and user.is_active else None
 
 # Home route
 @app.route('/')
+@read_only
+@cache_page
 def home():
     cars = Car.query.filter_by(is_available=True).all()
     return render_template('home.html', cars=cars)
 
+# Uploaded images when UPLOAD_FOLDER is outside the static folder (see image_store.upload_url)
+@app.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    response = send_from_directory(os.path.abspath(app.config['UPLOAD_FOLDER']), filename)
+    if filename.startswith((BLOB_DIR + '/', DERIVED_DIR + '/')):
+        # Named after their content, so they never change
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
 # Authentication routes
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -54,12 +91,11 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user and check_password_hash(user.password, form.password.data):
+            if not user.is_active:
+                flash('This account has been deactivated.', 'danger')
+                return render_template('login.html', form=form)
+            # Wallets are opened at registration, or on the first wallet payment
             login_user(user)
-            # Ensure wallet exists; top up if missing
-            wallet = Wallet.query.filter_by(user_id=user.id).first()
-            if wallet is None:
-                db.session.add(Wallet(user_id=user.id, balance=500.0))
-                db.session.commit()
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('home'))
         else:
@@ -75,39 +111,135 @@ def logout():
 
 # Car routes
 @app.route('/cars')
+@read_only
+@conditional(catalog_state)
+@cache_page
+# Cars, their images and (on a facet cache miss) the facet counts, plus the
+# logged-in user on a user-cache miss and the once-per-process FTS probe
+@query_budget(5)
 def cars():
+    q = request.args.get('q', '').strip()
     category = request.args.get('category', '')
+    year = request.args.get('year', '')
+    price = request.args.get('price', '')
     sort = request.args.get('sort', '')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 9, type=int)
+    start = request.args.get('start', '')
+    end = request.args.get('end', '')
+    per_page = min(max(request.args.get('per_page', 9, type=int), 1), 60)
 
     query = Car.query
 
     if category:
         query = query.filter_by(category=category)
-
-    if sort == 'price_low':
-        query = query.order_by(Car.daily_rate.asc())
+    # Year and price buckets as offered by the facets; unknown keys are ignored
+    year_filter = facets.bucket_filter(Car.year, facets.YEAR_BUCKETS, year)
+    if year_filter is None:
+        year = ''
+    else:
+        query = query.filter(year_filter)
+    price_filter = facets.bucket_filter(Car.daily_rate, facets.PRICE_BUCKETS, price)
+    if price_filter is None:
+        price = ''
+    else:
+        query = query.filter(price_filter)
+
+    # Date-range availability: only cars with no overlapping booking
+    start_date = end_date = None
+    if start or end:
+        try:
+            start_date = datetime.strptime(start, '%Y-%m-%d')
+            end_date = datetime.strptime(end, '%Y-%m-%d')
+        except ValueError:
+            start_date = end_date = None
+        if start_date is None or start_date >= end_date:
+            flash('Please choose a valid date range (end date after start date).', 'warning')
+            start = end = ''
+            start_date = end_date = None
+        else:
+            query = query.filter(Car.is_available.is_(True), free_cars_clause(start_date, end_date))
+
+    # Full-text search; ranked by relevance unless a sort was chosen
+    query, rank = car_search.apply_search(query, q)
+    keys = None
+
+    # Keyset ordering always ends in the primary key so cursors are unique
+    if rank is not None and not sort:
+        query = query.add_columns(rank.label('search_rank'))
+        order_by = [(rank, False), (Car.id, False)]
+        keys = [lambda row: row.search_rank, lambda row: row.Car.id]
+    elif sort == 'price_low':
+        order_by = [(Car.daily_rate, False), (Car.id, False)]
     elif sort == 'price_high':
-        query = query.order_by(Car.daily_rate.desc())
+        order_by = [(Car.daily_rate, True), (Car.id, True)]
     else:
-        query = query.order_by(Car.id.desc())
+        order_by = [(Car.id, True)]
 
     # Optimize: eager load images for primary display
     from sqlalchemy.orm import selectinload
     query = query.options(selectinload(Car.images))
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    cars_items = pagination.items
+    pagination = keyset_paginate(
+        query, order_by,
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=per_page, keys=keys,
+    )
+    cars_items = [row.Car for row in pagination.items] if keys else pagination.items
+    # Cached per catalog version, so most pages run no extra query
+    facet_counts = facets.facet_counts(q, start_date, end_date, {'category': category, 'year': year, 'price': price})
 
     return render_template(
         'cars.html',
         cars=cars_items,
+        facets=facet_counts,
+        q=q,
         category=category,
+        year=year,
+        price=price,
         sort=sort,
+        start=start,
+        end=end,
         pagination=pagination,
     )
 
+# Autocomplete for the catalog search box
+@app.route('/cars/suggest')
+@read_only
+@query_budget(2)
+def cars_suggest():
+    return jsonify(suggestions=car_search.suggest(request.args.get('q', '')))
+
+def _quote_limit():
+    """Quotes per request: partners (API key) and admins may ask for many, others for a few.
+
+    Returns None for a wrong key, which is refused rather than downgraded.
+    """
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        key = auth[len('Bearer '):].strip()
+        if any(hmac.compare_digest(key.encode(), k.strip().encode()) for k in app.config['QUOTE_API_KEYS']):
+            return app.config['QUOTE_MAX_ITEMS']
+        return None
+    if current_user.is_authenticated and current_user.is_admin:
+        return app.config['QUOTE_MAX_ITEMS']
+    return app.config['QUOTE_ANONYMOUS_MAX_ITEMS']
+
+# Bulk price and availability quotes for partner integrations (see pricing.py)
+@app.route('/api/quotes', methods=['POST'])
+@read_only
+@query_budget(4)
+def api_quotes():
+    limit = _quote_limit()
+    if limit is None:
+        return jsonify(error='invalid API key'), 401
+    try:
+        requests = pricing.parse_quote_request(request.get_json(silent=True), limit)
+    except pricing.QuoteRequestError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(quotes=pricing.quote_many(requests))
+
 @app.route('/car/<int:car_id>')
+@read_only
+@conditional(car_state)
+@cache_page
 def car_detail(car_id):
     car = Car.query.get_or_404(car_id)
     form = BookingForm()
@@ -132,52 +264,17 @@ def book_car(car_id):
             flash('End date must be after start date.', 'danger')
             return render_template('car_detail.html', car=car, form=form)
         
-        # Check if car is available for these dates
-        conflicting_bookings = Booking.query.filter(
-            Booking.car_id == car_id,
-            Booking.end_date >= start_date,
-            Booking.start_date <= end_date
-        ).all()
-        
-        if conflicting_bookings:
+        # Claims the slot and debits the wallet atomically (see booking_service.py)
+        try:
+            booking = booking_service.create_booking(
+                current_user.id, car, start_date, end_date, form.payment_method.data,
+            )
+        except SlotUnavailable:
             flash('Car is not available for the selected dates.', 'danger')
             return render_template('car_detail.html', car=car, form=form)
-        
-        # Calculate total cost
-        days = (end_date - start_date).days
-        total_cost = days * car.daily_rate
-
-        # Wallet/payment handling (test only)
-        method = form.payment_method.data
-        wallet = Wallet.query.filter_by(user_id=current_user.id).with_for_update().first()
-        if wallet is None:
-            wallet = Wallet(user_id=current_user.id, balance=500.0)
-            db.session.add(wallet)
-            db.session.flush()
-        if method == 'TEST_WALLET':
-            if wallet.balance < total_cost:
-                flash('Insufficient test wallet balance. Please choose a different date range or method.', 'danger')
-                return render_template('car_detail.html', car=car, form=form)
-            wallet.balance -= total_cost
-
-        # Create booking and payment record
-        booking = Booking(
-            user_id=current_user.id,
-            car_id=car.id,
-            start_date=start_date,
-            end_date=end_date,
-            total_cost=total_cost
-        )
-        db.session.add(booking)
-        db.session.flush()
-        db.session.add(Payment(
-            booking_id=booking.id,
-            user_id=current_user.id,
-            amount=total_cost,
-            method=method,
-            status='succeeded'
-        ))
-        db.session.commit()
+        except InsufficientFunds:
+            flash('Insufficient test wallet balance. Please choose a different date range or method.', 'danger')
+            return render_template('car_detail.html', car=car, form=form)
         
         flash('Your booking has been confirmed!', 'success')
         return redirect(url_for('booking_confirmation', booking_id=booking.id))
@@ -195,9 +292,17 @@ def booking_confirmation(booking_id):
 
 @app.route('/my-bookings')
 @login_required
+@query_budget(3)
 def my_bookings():
-    bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.created_at.desc()).all()
-    return render_template('my_bookings.html', bookings=bookings)
+    # Eager load each row's car in the same SELECT (the template reads booking.car)
+    pagination = keyset_paginate(
+        Booking.query.filter_by(user_id=current_user.id)
+        .options(joinedload(Booking.car).options(lazyload(Car.images))),
+        [(Booking.created_at, True), (Booking.id, True)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=20,
+    )
+    return render_template('my_bookings.html', bookings=pagination.items, pagination=pagination)
 
 # Edit booking
 @app.route('/booking/<int:booking_id>/edit', methods=['GET', 'POST'])
@@ -219,60 +324,18 @@ def edit_booking(booking_id):
             flash('End date must be after start date.', 'danger')
             return render_template('booking_edit.html', booking=booking, car=car, form=form)
 
-        # Check conflicts excluding current booking
-        conflicting = Booking.query.filter(
-            Booking.car_id == booking.car_id,
-            Booking.id != booking.id,
-            Booking.end_date >= start_date,
-            Booking.start_date <= end_date
-        ).all()
-        if conflicting:
+        try:
+            booking_service.reschedule_booking(
+                booking.id, current_user.id, start_date, end_date, form.payment_method.data, car.daily_rate,
+            )
+        except SlotUnavailable:
             flash('Car is not available for the selected dates.', 'danger')
             return render_template('booking_edit.html', booking=booking, car=car, form=form)
-
-        # Compute cost delta
-        new_days = (end_date - start_date).days
-        new_total = new_days * car.daily_rate
-        delta = new_total - booking.total_cost
-
-        method = form.payment_method.data
-        wallet = Wallet.query.filter_by(user_id=current_user.id).with_for_update().first()
-        if wallet is None:
-            wallet = Wallet(user_id=current_user.id, balance=500.0)
-            db.session.add(wallet)
-            db.session.flush()
-
-        if delta > 0:
-            if method == 'TEST_WALLET':
-                if wallet.balance < delta:
-                    flash('Insufficient test wallet balance for the change.', 'danger')
-                    return render_template('booking_edit.html', booking=booking, car=car, form=form)
-                wallet.balance -= delta
-            db.session.flush()
-            db.session.add(Payment(
-                booking_id=booking.id,
-                user_id=current_user.id,
-                amount=delta,
-                method=method,
-                status='succeeded'
-            ))
-        elif delta < 0:
-            # Refund to wallet for simplicity
-            wallet.balance += (-delta)
-            db.session.flush()
-            db.session.add(Payment(
-                booking_id=booking.id,
-                user_id=current_user.id,
-                amount=delta,  # negative indicates refund
-                method='TEST_WALLET',
-                status='succeeded'
-            ))
-
-        # Update booking
-        booking.start_date = start_date
-        booking.end_date = end_date
-        booking.total_cost = new_total
-        db.session.commit()
+        except InsufficientFunds:
+            flash('Insufficient test wallet balance for the change.', 'danger')
+            return render_template('booking_edit.html', booking=booking, car=car, form=form)
+        except BookingNotFound:
+            abort(404)
 
         flash('Booking updated successfully.', 'success')
         return redirect(url_for('my_bookings'))
@@ -288,30 +351,23 @@ def cancel_booking(booking_id):
     booking = Booking.query.get_or_404(booking_id)
     if booking.user_id != current_user.id and not current_user.is_admin:
         abort(403)
-    # Simple full refund policy to test wallet
-    wallet = Wallet.query.filter_by(user_id=booking.user_id).with_for_update().first()
-    if wallet is None:
-        wallet = Wallet(user_id=booking.user_id, balance=0.0)
-        db.session.add(wallet)
-        db.session.flush()
-    wallet.balance += booking.total_cost
-    db.session.add(Payment(
-        booking_id=booking.id,
-        user_id=booking.user_id,
-        amount=-booking.total_cost,
-        method='TEST_WALLET',
-        status='succeeded'
-    ))
-    db.session.delete(booking)
-    db.session.commit()
+    # Simple full refund policy to test wallet, refunded at most once
+    booking_service.cancel_booking(booking.id)
     flash('Booking cancelled and refunded to your test wallet.', 'success')
     return redirect(url_for('my_bookings'))
 
 @app.route('/history')
 @login_required
+@query_budget(3)
 def history():
-    bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.created_at.desc()).all()
-    return render_template('history.html', bookings=bookings, now=datetime.now())
+    pagination = keyset_paginate(
+        Booking.query.filter_by(user_id=current_user.id)
+        .options(joinedload(Booking.car).options(lazyload(Car.images))),
+        [(Booking.created_at, True), (Booking.id, True)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=20,
+    )
+    return render_template('history.html', bookings=pagination.items, pagination=pagination, now=datetime.now())
 
 # Admin routes
 @app.route('/admin')
@@ -328,8 +384,37 @@ def admin_cars():
     if not current_user.is_admin:
         abort(403)
     
-    cars = Car.query.all()
-    return render_template('admin/cars.html', cars=cars)
+    pagination = keyset_paginate(
+        Car.query, [(Car.id, False)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=50,
+    )
+    return render_template('admin/cars.html', cars=pagination.items, pagination=pagination)
+
+def _save_uploaded_images(car, uploaded_files, first_is_primary):
+    """Store allowed uploads in the content-addressed blob store and add CarImage rows."""
+    allowed_exts = app.config.get('ALLOWED_IMAGE_EXTENSIONS', set())
+
+    images = []
+    for file_storage in uploaded_files:
+        if not file_storage or file_storage.filename == '':
+            continue
+        filename = secure_filename(file_storage.filename)
+        ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        if allowed_exts and ext not in allowed_exts:
+            continue
+        # Identical bytes resolve to the existing blob (and its derivatives)
+        blob = store_upload(file_storage, ext)
+        image = CarImage(
+            car_id=car.id,
+            file_path=blob.file_path,
+            content_hash=blob.sha256,
+            derivatives=blob.derivatives,
+            is_primary=first_is_primary and not images,
+        )
+        db.session.add(image)
+        images.append(image)
+    return images
 
 @app.route('/admin/car/new', methods=['GET', 'POST'])
 @login_required
@@ -353,33 +438,11 @@ def admin_new_car():
         db.session.add(car)
         db.session.flush()
 
-        # Handle uploaded images
-        upload_folder = app.config.get('UPLOAD_FOLDER', os.path.join('static', 'uploads'))
-        allowed_exts = app.config.get('ALLOWED_IMAGE_EXTENSIONS', set())
-        os.makedirs(upload_folder, exist_ok=True)
-
-        uploaded_files = request.files.getlist('images')
-        saved_any = False
-        for index, file_storage in enumerate(uploaded_files):
-            if not file_storage or file_storage.filename == '':
-                continue
-            filename = secure_filename(file_storage.filename)
-            ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-            if allowed_exts and ext not in allowed_exts:
-                continue
-            unique_name = f"{uuid.uuid4().hex}_{filename}"
-            disk_path = os.path.join(upload_folder, unique_name)
-            file_storage.save(disk_path)
-            relative_path = os.path.join('static', 'uploads', unique_name)
-            is_primary = index == 0
-            db.session.add(CarImage(car_id=car.id, file_path=relative_path, is_primary=is_primary))
-            saved_any = True
-
-        # If no uploads but image_url provided, keep as legacy primary
-        if saved_any:
-            pass
+        # Handle uploaded images; the first upload becomes the primary image
+        new_images = _save_uploaded_images(car, request.files.getlist('images'), first_is_primary=True)
 
         db.session.commit()
+        schedule_derivatives(new_images)
 
         flash('Car has been added to inventory!', 'success')
         return redirect(url_for('admin_cars'))
@@ -405,27 +468,15 @@ def admin_edit_car(car_id):
         car.image_url = form.image_url.data
         car.is_available = form.is_available.data
 
-        # Handle uploaded images (append to gallery)
-        upload_folder = app.config.get('UPLOAD_FOLDER', os.path.join('static', 'uploads'))
-        allowed_exts = app.config.get('ALLOWED_IMAGE_EXTENSIONS', set())
-        os.makedirs(upload_folder, exist_ok=True)
-        uploaded_files = request.files.getlist('images')
-        for file_storage in uploaded_files:
-            if not file_storage or file_storage.filename == '':
-                continue
-            filename = secure_filename(file_storage.filename)
-            ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-            if allowed_exts and ext not in allowed_exts:
-                continue
-            unique_name = f"{uuid.uuid4().hex}_{filename}"
-            disk_path = os.path.join(upload_folder, unique_name)
-            file_storage.save(disk_path)
-            relative_path = os.path.join('static', 'uploads', unique_name)
-            # If car has no primary image yet, mark first added as primary
-            is_primary = not any(img.is_primary for img in car.images)
-            db.session.add(CarImage(car_id=car.id, file_path=relative_path, is_primary=is_primary))
-        
+        # Handle uploaded images (append to gallery); if the car has no
+        # primary image yet, the first added one becomes primary
+        new_images = _save_uploaded_images(
+            car, request.files.getlist('images'),
+            first_is_primary=not any(img.is_primary for img in car.images),
+        )
+
         db.session.commit()
+        schedule_derivatives(new_images)
         
         flash('Car has been updated!', 'success')
         return redirect(url_for('admin_cars'))
@@ -449,20 +500,54 @@ def admin_delete_car(car_id):
         abort(403)
     
     car = Car.query.get_or_404(car_id)
+    image_hashes = {img.content_hash for img in car.images if img.content_hash}
     db.session.delete(car)
     db.session.commit()
+    # Remove stored files no other car still uses
+    release_unreferenced(image_hashes)
     
     flash('Car has been deleted!', 'success')
     return redirect(url_for('admin_cars'))
 
 @app.route('/admin/bookings')
 @login_required
+@query_budget(3)
 def admin_bookings():
     if not current_user.is_admin:
         abort(403)
     
-    bookings = Booking.query.order_by(Booking.created_at.desc()).all()
-    return render_template('admin/bookings.html', bookings=bookings)
+    pagination = keyset_paginate(
+        Booking.query.options(
+            joinedload(Booking.car).options(lazyload(Car.images)),
+            joinedload(Booking.user),
+        ),
+        [(Booking.created_at, True), (Booking.id, True)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=50,
+    )
+    return render_template('admin/bookings.html', bookings=pagination.items, pagination=pagination)
+
+# Streaming report downloads, e.g. /admin/export/payments.csv?from=2024-01-01&to=2024-03-31
+@app.route('/admin/export/<name>.<fmt>')
+@login_required
+@read_only
+def admin_export(name, fmt):
+    if not current_user.is_admin:
+        abort(403)
+    if fmt not in admin_exports.MIMETYPES:
+        abort(404)
+    try:
+        stmt, key, fields = admin_exports.build_export(name, request.args)
+    except admin_exports.ExportError as e:
+        abort(400, description=str(e))
+
+    rows = admin_exports.iter_batched(stmt, key, batch_size=app.config['EXPORT_BATCH_SIZE'])
+    filename = f"{name}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(iter_lines(rows, fields, fmt)),
+        mimetype=admin_exports.MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
 
 # Cancel booking route (admin only)
 @app.route('/admin/booking/<int:booking_id>/cancel', methods=['POST'])
@@ -489,20 +574,14 @@ def admin_modify_booking(booking_id):
     form = BookingModificationForm()
 
     if form.validate_on_submit():
-        # Ensure car is available for the new dates
-        conflicting_bookings = Booking.query.filter(
-            Booking.car_id == booking.car_id,
-            Booking.end_date >= form.start_date.data,
-            Booking.start_date <= form.end_date.data
-        ).all()
-
-        if conflicting_bookings:
+        # Ensure car is available for the new dates (ignoring this booking itself)
+        try:
+            booking_service.move_booking(booking.id, form.start_date.data, form.end_date.data)
+        except SlotUnavailable:
             flash('Car is not available for the selected dates.', 'danger')
+        except BookingNotFound:
+            abort(404)
         else:
-            booking.start_date = form.start_date.data
-            booking.end_date = form.end_date.data
-            booking.total_cost = (booking.end_date - booking.start_date).days * booking.car.daily_rate
-            db.session.commit()
             flash('Booking has been updated.', 'success')
             return redirect(url_for('admin_bookings'))
 
@@ -515,22 +594,110 @@ def admin_modify_booking(booking_id):
 
 @app.route('/admin/analytics')
 @login_required
+@read_only
 def admin_analytics():
     if not current_user.is_admin:
         abort(403)
 
-    # Bookings per month
-    bookings_per_month = db.session.query(
-        func.strftime('%Y-%m', Booking.start_date).label('month'),
-        func.count(Booking.id).label('bookings_count')
-    ).group_by('month').all()
+    # Both read only the incrementally maintained rollup table
+    return render_template(
+        'admin/analytics.html',
+        bookings_per_month=analytics.bookings_per_month(),
+        popular_cars=analytics.popular_cars(),
+    )
 
-    # Popular cars (most booked)
-    popular_cars = db.session.query(
-        Car.make, Car.model, func.count(Booking.id).label('booking_count')
-    ).join(Booking, Booking.car_id == Car.id).group_by(Car.id).order_by(func.count(Booking.id).desc()).limit(5).all()
+# Fleet utilization heatmap, one month at a time (?month=YYYY-MM)
+@app.route('/admin/occupancy')
+@login_required
+@read_only
+def admin_occupancy():
+    if not current_user.is_admin:
+        abort(403)
+
+    try:
+        month = datetime.strptime(request.args['month'], '%Y-%m').date() if request.args.get('month') else None
+    except ValueError:
+        abort(400)
+    month = month or occupancy.month_start(datetime.utcnow().date())
+    return render_template(
+        'admin/occupancy.html',
+        heatmap=occupancy.heatmap(month),
+        previous_month=occupancy.month_start(month - timedelta(days=1)),
+        next_month=occupancy.month_end(month) + timedelta(days=1),
+    )
+
+# Utilization of the fleet, a category or one car, e.g. ?start=2025-07-01&end=2025-07-31&category=suv
+@app.route('/api/occupancy/utilization')
+@login_required
+@read_only
+@query_budget(3)
+def api_utilization():
+    if not current_user.is_admin:
+        abort(403)
 
-    return render_template('admin/analytics.html', bookings_per_month=bookings_per_month, popular_cars=popular_cars)
+    try:
+        start, end = occupancy.parse_range(request.args, default_days=30)
+    except occupancy.OccupancyRangeError as e:
+        return jsonify(error=str(e)), 400
+    car_id = request.args.get('car_id', type=int)
+    if car_id is not None:
+        return jsonify(occupancy.car_utilization(car_id, start, end))
+    return jsonify(occupancy.utilization(start, end, category=request.args.get('category') or None))
+
+# Available cars with no booking in the range (default: the next seven days), paged by ?after=<id>
+@app.route('/api/occupancy/idle')
+@login_required
+@read_only
+@query_budget(3)
+def api_idle_cars():
+    if not current_user.is_admin:
+        abort(403)
+
+    try:
+        start, end = occupancy.parse_range(request.args)
+    except occupancy.OccupancyRangeError as e:
+        return jsonify(error=str(e)), 400
+    category = request.args.get('category') or None
+    limit = min(max(request.args.get('limit', occupancy.IDLE_PAGE_SIZE, type=int), 0), occupancy.MAX_IDLE_PAGE_SIZE)
+    car_ids = occupancy.idle_cars(start, end, category=category, after=request.args.get('after', type=int), limit=limit)
+    return jsonify(
+        start=start.isoformat(), end=end.isoformat(), count=occupancy.idle_count(start, end, category=category),
+        car_ids=car_ids, next_after=car_ids[-1] if limit and len(car_ids) == limit else None,
+    )
+
+@app.route('/admin/slow-requests')
+@login_required
+def admin_slow_requests():
+    if not current_user.is_admin:
+        abort(403)
+
+    return render_template(
+        'admin/slow_requests.html',
+        slow_requests=slow_requests(),
+        threshold_ms=app.config['SLOW_REQUEST_MS'],
+    )
+
+@app.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    if not current_user.is_admin:
+        abort(403)
+
+    return render_template(
+        'admin/profiles.html',
+        profiles=list_profiles(app),
+        query_flag=QUERY_FLAG,
+        keep=app.config['PROFILE_KEEP'],
+    )
+
+@app.route('/admin/profiles/<name>.prof')
+@login_required
+def admin_profile_download(name):
+    if not current_user.is_admin:
+        abort(403)
+
+    # send_from_directory rejects names that would leave the directory
+    return send_from_directory(os.path.abspath(app.config['PROFILE_DIR']), name + '.prof', as_attachment=True)
 
 # routes.py
 
@@ -541,8 +708,12 @@ def admin_users():
     if not current_user.is_admin:
         abort(403)
 
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    pagination = keyset_paginate(
+        User.query, [(User.id, False)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=50,
+    )
+    return render_template('admin/users.html', users=pagination.items, pagination=pagination)
 
 # Deactivate/Activate user
 @app.route('/admin/user/<int:user_id>/toggle', methods=['POST'])
@@ -552,10 +723,11 @@ def admin_toggle_user(user_id):
         abort(403)
 
     user = User.query.get_or_404(user_id)
-    user.is_active = not user.is_active
+    user.active = not user.active
     db.session.commit()
+    user_cache.invalidate(user.id)
 
-    flash(f'User {"activated" if user.is_active else "deactivated"} successfully!', 'success')
+    flash(f'User {"activated" if user.active else "deactivated"} successfully!', 'success')
     return redirect(url_for('admin_users'))
 
 # Delete user
@@ -568,6 +740,7 @@ def admin_delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
 
     flash('User has been deleted.', 'success')
     return redirect(url_for('admin_users'))
@@ -598,6 +771,7 @@ def admin_edit_user(user_id):
         user.phone = request.form.get('phone')
         user.is_admin = 'is_admin' in request.form  # Toggle admin status based on checkbox
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('User information updated!', 'success')
         return redirect(url_for('admin_users'))
 
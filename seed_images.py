@@ -1,12 +1,23 @@
+import argparse
 import os
+import random
+import tempfile
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import quote_plus
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from app import app, db
+import image_store
+from image_derivatives import schedule_derivatives
 from models import Car, CarImage
 
+CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
 
 def ensure_directories() -> None:
     uploads_dir = os.path.join('static', 'uploads')
@@ -30,37 +41,137 @@ def build_stock_image_url(car: Car) -> str:
     return f"https://source.unsplash.com/featured/1280x720/?{quote_plus(keywords)}&sig={uuid.uuid4().hex}"
 
 
-def download_image(url: str, dest_path: str) -> bool:
-    try:
-        resp = requests.get(url, timeout=20)
-        resp.raise_for_status()
-        with open(dest_path, 'wb') as f:
-            f.write(resp.content)
-        return True
-    except Exception:
-        return False
-
-
-def seed_car_images(max_images_per_car: int = 3) -> None:
-    uploads_dir = os.path.join('static', 'uploads')
-    cars = Car.query.all()
-    for car in cars:
-        # Skip if gallery already exists
-        if car.images and len(car.images) >= 1:
-            continue
-
-        # If legacy image_url exists, keep it for now and just add one stock image as primary
-        num_to_add = max_images_per_car
-        for idx in range(num_to_add):
-            url = build_stock_image_url(car)
-            unique_name = f"{uuid.uuid4().hex}.jpg"
-            disk_path = os.path.join(uploads_dir, unique_name)
-            ok = download_image(url, disk_path)
-            if not ok:
+def build_session(pool_size: int = 8) -> requests.Session:
+    # One shared session so downloads reuse keep-alive connections
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _fetch(url: str, write, session: requests.Session = None,
+           retries: int = 3, backoff: float = 0.5, timeout: float = 20):
+    """GET `url` and pass its body chunks to `write`; returns write's result, or None.
+
+    `write` must clean up after itself if the stream breaks part way. Connection
+    errors and 429/5xx responses are retried with exponential backoff.
+    """
+    http = session or requests
+    for attempt in range(retries + 1):
+        try:
+            with http.get(url, timeout=timeout, stream=True) as resp:
+                if resp.status_code in RETRY_STATUSES and attempt < retries:
+                    raise requests.HTTPError(f'retryable status {resp.status_code}', response=resp)
+                resp.raise_for_status()
+                return write(resp.iter_content(chunk_size=CHUNK_SIZE))
+        except requests.RequestException as exc:
+            status = getattr(exc.response, 'status_code', None)
+            if attempt >= retries or (status is not None and status not in RETRY_STATUSES):
+                return None
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+        except OSError:
+            return None
+    return None
+
+
+def download_image(url: str, dest_path: str, session: requests.Session = None,
+                   retries: int = 3, backoff: float = 0.5, timeout: float = 20) -> int:
+    """Stream `url` to `dest_path`; returns the bytes written, or 0 on failure.
+
+    The body is written in chunks to a temp file beside the destination and
+    renamed into place, so readers never see a partial image.
+    """
+    dest_dir = os.path.dirname(dest_path) or '.'
+
+    def write(chunks):
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix='.part')
+        try:
+            written = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, dest_path)
+            return written
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return _fetch(url, write, session, retries, backoff, timeout) or 0
+
+
+def download_to_store(url: str, ext: str = 'jpg', session: requests.Session = None,
+                      retries: int = 3, backoff: float = 0.5, timeout: float = 20):
+    """Stream `url` into the content-addressed image store.
+
+    Returns (sha256, file_path, size) for image_store.register_blob, or None
+    on failure. Touches no database, so it runs on the download threads.
+    """
+    return _fetch(url, lambda chunks: image_store.write_blob(chunks, ext),
+                  session, retries, backoff, timeout)
+
+
+def seed_car_images(max_images_per_car: int = 3, workers: int = 8, batch_size: int = 200,
+                    url_builder=build_stock_image_url, session: requests.Session = None) -> dict:
+    """Download stock images for every car without a gallery.
+
+    Downloads run on a bounded thread pool sharing one pooled session and land
+    in the same content-addressed store as uploads (see image_store.py).
+    CarImage rows are added through the session, so blob reference counts
+    are kept, and committed in batches; derivatives are scheduled after each
+    commit. Returns throughput statistics.
+    """
+    session = session or build_session(workers)
+
+    # Skip cars whose gallery already exists
+    cars = Car.query.filter(~Car.images.any()).all()
+    jobs = [(car.id, url_builder(car)) for car in cars for _ in range(max_images_per_car)]
+
+    stats = {'cars': len(cars), 'requested': len(jobs), 'downloaded': 0, 'failed': 0, 'bytes': 0}
+    has_primary = set()
+    pending = []
+    started = time.perf_counter()
+
+    def flush():
+        if pending:
+            db.session.add_all(pending)
+            db.session.commit()
+            schedule_derivatives(pending)
+            pending.clear()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(download_to_store, url, 'jpg', session): car_id
+            for car_id, url in jobs
+        }
+        # Results are handled on this thread only, so the DB session is never shared
+        for future in as_completed(futures):
+            car_id = futures[future]
+            stored = future.result()
+            if not stored:
+                stats['failed'] += 1
                 continue
-            relative_path = 'static/uploads/' + unique_name
-            db.session.add(CarImage(car_id=car.id, file_path=relative_path, is_primary=(idx == 0)))
-        db.session.commit()
+            stats['downloaded'] += 1
+            stats['bytes'] += stored[2]
+            blob = image_store.register_blob(*stored)
+            pending.append(CarImage(
+                car_id=car_id,
+                file_path=blob.file_path,
+                content_hash=blob.sha256,
+                derivatives=blob.derivatives,
+                is_primary=car_id not in has_primary,
+            ))
+            has_primary.add(car_id)
+            if len(pending) >= batch_size:
+                flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 2)
+    stats['images_per_second'] = round(stats['downloaded'] / elapsed, 2) if elapsed else 0.0
+    stats['mb_per_second'] = round(stats['bytes'] / (1024 * 1024) / elapsed, 2) if elapsed else 0.0
+    return stats
 
 
 def seed_hero_background() -> None:
@@ -72,10 +183,18 @@ def seed_hero_background() -> None:
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download stock images for cars without a gallery.')
+    parser.add_argument('--per-car', type=int, default=3, help='images to download per car')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent downloads')
+    parser.add_argument('--batch-size', type=int, default=200, help='CarImage rows per commit')
+    args = parser.parse_args()
+
     ensure_directories()
     with app.app_context():
-        seed_car_images()
+        stats = seed_car_images(args.per_car, workers=args.workers, batch_size=args.batch_size)
     seed_hero_background()
-    print('Seeding complete.')
-
-
+    print(
+        f"Seeding complete: {stats['downloaded']}/{stats['requested']} images for {stats['cars']} cars "
+        f"in {stats['seconds']}s ({stats['images_per_second']} img/s, {stats['mb_per_second']} MB/s, "
+        f"{stats['failed']} failed)."
+    )
@@ -0,0 +1,141 @@
+import heapq
+import logging
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from logging_setup import log_to_file
+
+slow_query_logger = logging.getLogger('travora.slow_queries')
+
+# Most recent slow requests, newest last (shown on the admin page)
+recent_slow_requests = deque(maxlen=50)
+
+
+class RequestSQLStats:
+    """SQL work done while serving one request."""
+
+    def __init__(self, keep_slowest):
+        self.count = 0
+        self.total_ms = 0.0
+        self.keep_slowest = keep_slowest
+        self._slowest = []  # min-heap of (duration_ms, seq, statement, params)
+
+    def record(self, statement, parameters, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        entry = (duration_ms, self.count, statement, parameters)
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif duration_ms > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        return [
+            {'ms': round(ms, 2), 'statement': ' '.join(statement.split()), 'params': _short_repr(params)}
+            for ms, _, statement, params in sorted(self._slowest, reverse=True)
+        ]
+
+
+def _short_repr(value, limit=200):
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def current_sql_stats():
+    """Return the RequestSQLStats of the active request, if any."""
+    if has_app_context():
+        return g.get('_sql_stats')
+    return None
+
+
+def slow_requests():
+    """Recently recorded slow requests, newest first."""
+    return list(reversed(recent_slow_requests))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context rather than the connection: a
+    # statement that raises never reaches _after_cursor_execute, and its start
+    # time is then discarded with the context instead of lingering in a pool
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_start', None)
+    if started is None:
+        return
+    stats = current_sql_stats()
+    if stats is not None:
+        stats.record(statement, parameters, (time.perf_counter() - started) * 1000.0)
+
+
+def _configure_slow_log(app):
+    # Written as JSON lines by the background log writer, not by the request thread
+    log_to_file(slow_query_logger.name, app.config['SLOW_QUERY_LOG'])
+    slow_query_logger.setLevel(logging.INFO)
+
+
+def init_sql_instrumentation(app):
+    """Record per-request SQL counts and timings on every engine.
+
+    Adds a Server-Timing header to each response and logs requests slower
+    than SLOW_REQUEST_MS (with their slowest statements) to SLOW_QUERY_LOG.
+    """
+    app.config.setdefault('SLOW_REQUEST_MS', 500)
+    app.config.setdefault('SLOW_QUERY_LOG', 'slow_queries.log')
+    app.config.setdefault('SLOW_QUERY_TOP', 5)
+    app.config.setdefault('SLOW_REQUEST_HISTORY', 50)
+
+    global recent_slow_requests
+    recent_slow_requests = deque(maxlen=app.config['SLOW_REQUEST_HISTORY'])
+    _configure_slow_log(app)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _start_sql_stats():
+        g._request_started = time.perf_counter()
+        g._sql_stats = RequestSQLStats(app.config['SLOW_QUERY_TOP'])
+
+    @app.after_request
+    def _finish_sql_stats(response):
+        stats = g.pop('_sql_stats', None)
+        started = g.pop('_request_started', None)
+        if stats is None or started is None:
+            return response
+        total_ms = (time.perf_counter() - started) * 1000.0
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries", app;dur={total_ms:.1f}',
+        )
+        if total_ms >= app.config['SLOW_REQUEST_MS']:
+            _record_slow_request(stats, total_ms, response.status_code)
+        return response
+
+
+def _record_slow_request(stats, total_ms, status_code):
+    entry = {
+        'at': datetime.utcnow(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': status_code,
+        'total_ms': round(total_ms, 1),
+        'db_ms': round(stats.total_ms, 1),
+        'statements': stats.count,
+        'slowest': stats.slowest,
+    }
+    recent_slow_requests.append(entry)
+    slow_query_logger.info(
+        'Slow request %s %s took %.1f ms (%d statements, %.1f ms in the database)',
+        entry['method'], entry['path'], entry['total_ms'], entry['statements'], entry['db_ms'],
+        extra={k: v for k, v in entry.items() if k != 'at'},
+    )
@@ -0,0 +1,63 @@
+"""Shared fixtures: the app on a throwaway SQLite database with a small dataset."""
+import itertools
+import os
+import tempfile
+
+import pytest
+
+# Before the app is imported: keep logs out of the working tree
+_scratch = tempfile.mkdtemp(prefix='travora-tests-')
+os.environ.setdefault('LOG_FILE', os.path.join(_scratch, 'app.log'))
+os.environ.setdefault('LOG_CONSOLE', '0')
+os.environ.setdefault('SLOW_QUERY_LOG', os.path.join(_scratch, 'slow_queries.log'))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from benchmarks import configure
+    from benchmarks.datagen import generate
+
+    app = configure(os.path.join(_scratch, 'test.db'))
+    app.config['UPLOAD_FOLDER'] = os.path.join(_scratch, 'uploads')
+    with app.app_context():
+        generate(users=20, cars=40, images_per_car=1, bookings_per_car=6, echo=lambda *args: None)
+    return app
+
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+_serial = itertools.count(1)
+
+
+def add_user(balance=1000.0, **fields):
+    """A new customer with a funded wallet; returns its id. Needs an app context."""
+    from app import db
+    from models import User, Wallet
+
+    n = next(_serial)
+    user = User(name=f'Test User {n}', email=f'test-user-{n}@example.com', phone=f'555{n:07d}',
+                password='unused', **fields)
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Wallet(user_id=user.id, balance=balance))
+    db.session.commit()
+    return user.id
+
+
+def add_car(**fields):
+    """A new available car without bookings; returns its id. Needs an app context."""
+    from app import db
+    from models import Car
+
+    values = {'make': 'Testmake', 'model': f'Model {next(_serial)}', 'year': 2022,
+              'category': 'sedan', 'daily_rate': 50.0}
+    values.update(fields)
+    car = Car(**values)
+    db.session.add(car)
+    db.session.commit()
+    return car.id
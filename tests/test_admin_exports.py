@@ -0,0 +1,40 @@
+"""Admin report exports."""
+import csv
+import io
+from datetime import datetime, timedelta
+
+from conftest import add_car, add_user, login
+
+
+def _admin_id():
+    from models import User
+
+    return User.query.filter_by(is_admin=True).first().id
+
+
+def test_payments_of_cancelled_bookings_are_exported(app):
+    import booking_service
+    from app import db
+    from models import Car, Wallet
+
+    with app.app_context():
+        user_id = add_user(balance=1000.0)
+        car = db.session.get(Car, add_car(daily_rate=100.0))
+        start = datetime(2031, 5, 1)
+        booking = booking_service.create_booking(user_id, car, start, start + timedelta(days=2), 'TEST_WALLET')
+        booking_id, cost = booking.id, booking.total_cost
+        booking_service.cancel_booking(booking_id)
+        balance = Wallet.query.filter_by(user_id=user_id).one().balance
+        admin = _admin_id()
+
+    client = login(app.test_client(), admin)
+    response = client.get(f'/admin/export/payments.csv?user_id={user_id}')
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+    assert sorted(float(row['amount']) for row in rows) == [-cost, cost]
+    assert {row['booking_id'] for row in rows} == {str(booking_id)}
+    # The booking is gone, so the car is unknown
+    assert {row['car_id'] for row in rows} == {''}
+    # Charges and refunds reconcile with the wallet
+    assert 1000.0 - sum(float(row['amount']) for row in rows) == balance
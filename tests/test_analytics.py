@@ -0,0 +1,80 @@
+"""Booking rollups: kept by the flush listener, recomputed in place by rebuild."""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from conftest import add_car, add_user
+
+
+def _rollups(car_id=None):
+    from models import BookingRollup
+
+    query = BookingRollup.query
+    if car_id is not None:
+        query = query.filter_by(car_id=car_id)
+    return {
+        (row.car_id, row.day): (row.bookings, row.booked_days, round(row.revenue, 2))
+        for row in query
+        if row.bookings or row.booked_days or row.revenue
+    }
+
+
+def _from_bookings():
+    from models import Booking
+
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for booking in Booking.query:
+        total = totals[(booking.car_id, booking.start_date.date())]
+        total[0] += 1
+        total[1] += (booking.end_date - booking.start_date).days
+        total[2] += booking.total_cost
+    return {key: (b, d, round(r, 2)) for key, (b, d, r) in totals.items()}
+
+
+def test_listener_follows_create_reschedule_and_cancel(app):
+    import booking_service
+    from app import db
+    from models import Car
+
+    with app.app_context():
+        user_id = add_user(balance=5000.0)
+        car_id = add_car(daily_rate=100.0)
+        car = db.session.get(Car, car_id)
+        start = datetime(2031, 6, 1)
+
+        booking = booking_service.create_booking(user_id, car, start, start + timedelta(days=2), 'TEST_WALLET')
+        first_cost = booking.total_cost
+        assert _rollups(car_id) == {(car_id, date(2031, 6, 1)): (1, 2, first_cost)}
+
+        moved = datetime(2031, 6, 10)
+        booking = booking_service.reschedule_booking(
+            booking.id, user_id, moved, moved + timedelta(days=4), 'TEST_WALLET', car.daily_rate,
+        )
+        assert _rollups(car_id) == {(car_id, date(2031, 6, 10)): (1, 4, booking.total_cost)}
+
+        booking_service.cancel_booking(booking.id)
+        assert _rollups(car_id) == {}
+
+
+def test_rebuild_replaces_rollups_in_place(app):
+    import analytics
+    from app import db
+    from models import BookingRollup
+
+    with app.app_context():
+        expected = _from_bookings()
+        assert _rollups() == expected
+        # A wrong total and a row for a car without bookings
+        wrong_car, wrong_day = min(expected)
+        BookingRollup.query.filter_by(car_id=wrong_car, day=wrong_day).update({'bookings': 99})
+        db.session.add(BookingRollup(car_id=10 ** 6, day=date(2001, 1, 1), bookings=1, booked_days=1, revenue=1.0))
+        db.session.commit()
+
+        seen = []
+        scanned = analytics.rebuild_rollups(chunk_size=7, echo=lambda message: seen.append(set(_rollups())))
+
+        assert len(seen) > 1
+        # The table is never emptied: every booked car-day keeps its row
+        assert all(set(expected) <= keys for keys in seen)
+        assert _rollups() == expected
+        assert scanned == sum(b for b, _, _ in expected.values())
+        assert BookingRollup.query.filter_by(car_id=10 ** 6).count() == 0
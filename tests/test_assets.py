@@ -0,0 +1,70 @@
+"""`flask assets build` output: fingerprinted URLs and precompressed variants."""
+import gzip
+import json
+import os
+
+import pytest
+from flask import Flask, url_for
+
+import assets
+
+CSS = b'body { color: #123456; }\n' * 200
+
+
+@pytest.fixture
+def static_app(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'site.css').write_bytes(CSS)
+    (static / 'img').mkdir()
+    (static / 'img' / 'logo.png').write_bytes(b'\x89PNG' + bytes(range(256)))
+    (static / 'uploads').mkdir()
+    (static / 'uploads' / 'user.css').write_bytes(CSS)
+
+    manifest = assets.build(str(static))
+    app = Flask('static_app', static_folder=str(static))
+    assets.init_assets(app)
+    return app, manifest
+
+
+def test_build_fingerprints_and_compresses(static_app):
+    app, manifest = static_app
+    css = manifest['css/site.css']
+
+    assert css == assets.DIST_DIR + '/' + assets.fingerprint('css/site.css', CSS)
+    assert set(manifest) == {'css/site.css', 'img/logo.png'}
+    dist = os.path.join(app.static_folder, css)
+    with open(dist, 'rb') as f:
+        assert f.read() == CSS
+    with open(dist + '.gz', 'rb') as f:
+        assert gzip.decompress(f.read()) == CSS
+    # Binary formats are not precompressed
+    assert not os.path.exists(os.path.join(app.static_folder, manifest['img/logo.png'] + '.gz'))
+    with open(os.path.join(app.static_folder, assets.DIST_DIR, assets.MANIFEST_NAME)) as f:
+        assert json.load(f) == manifest
+    # Rebuilding unchanged sources gives the same names
+    assert assets.build(app.static_folder) == manifest
+
+
+def test_static_urls_and_encoding_negotiation(static_app):
+    app, manifest = static_app
+    with app.test_request_context():
+        url = url_for('static', filename='css/site.css')
+        assert url == '/static/' + manifest['css/site.css']
+        assert url_for('static', filename='missing.js') == '/static/missing.js'
+    client = app.test_client()
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.data) == CSS
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert 'immutable' in response.headers['Cache-Control']
+    assert f'max-age={assets.IMMUTABLE_MAX_AGE}' in response.headers['Cache-Control']
+
+    response = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers and response.data == CSS
+
+    # The unhashed original is still served, but may change, so it is not immutable
+    response = client.get('/static/css/site.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.data == CSS and 'immutable' not in response.headers.get('Cache-Control', '')
@@ -0,0 +1,95 @@
+"""Booking conflict checks: inclusive ranges, the database check and the interval index."""
+from datetime import date, datetime
+
+import pytest
+
+from conftest import add_car, add_user
+
+# One booking of the car, 10-15 June inclusive
+BOOKED = (datetime(2032, 6, 10), datetime(2032, 6, 15))
+CASES = [
+    ((date(2032, 6, 1), date(2032, 6, 9)), False),
+    ((date(2032, 6, 1), date(2032, 6, 10)), True),   # ends on the first booked day
+    ((date(2032, 6, 15), date(2032, 6, 20)), True),  # starts on the last booked day
+    ((date(2032, 6, 16), date(2032, 6, 20)), False),
+    ((date(2032, 6, 11), date(2032, 6, 12)), True),  # inside
+    ((date(2032, 6, 1), date(2032, 6, 30)), True),   # around
+    ((datetime(2032, 6, 15, 12), date(2032, 6, 16)), False),  # after the end instant
+]
+
+
+@pytest.fixture(scope='module')
+def booked_car(app):
+    from app import db
+    from models import Booking
+
+    with app.app_context():
+        car_id = add_car()
+        booking = Booking(user_id=add_user(), car_id=car_id, start_date=BOOKED[0], end_date=BOOKED[1], total_cost=300.0)
+        db.session.add(booking)
+        db.session.commit()
+        return car_id, booking.id
+
+
+@pytest.mark.parametrize('dates, expected', CASES)
+def test_database_and_index_agree_on_boundaries(app, booked_car, dates, expected):
+    from availability import AvailabilityIndex, CarIntervals, has_conflict_in_db
+
+    car_id, booking_id = booked_car
+    intervals = CarIntervals()
+    intervals.add(booking_id, *BOOKED)
+    with app.app_context():
+        index = AvailabilityIndex()
+        assert has_conflict_in_db(car_id, *dates) is expected
+        assert index.has_conflict(car_id, *dates) is expected
+        assert intervals.overlaps(*dates) is expected
+        # A booking never conflicts with itself when it is being moved
+        assert has_conflict_in_db(car_id, *dates, exclude_booking_id=booking_id) is False
+        assert index.has_conflict(car_id, *dates, exclude_booking_id=booking_id) is False
+
+
+def test_long_booking_is_not_hidden_by_a_shorter_neighbour(app):
+    from availability import CarIntervals
+
+    intervals = CarIntervals()
+    intervals.add(1, datetime(2032, 1, 1), datetime(2032, 1, 31))
+    intervals.add(2, datetime(2032, 1, 5), datetime(2032, 1, 6))
+    assert intervals.overlaps(date(2032, 1, 20), date(2032, 1, 21))
+    intervals.remove(1)
+    assert not intervals.overlaps(date(2032, 1, 20), date(2032, 1, 21))
+
+
+def test_index_follows_commits_and_ignores_rollbacks(app, monkeypatch):
+    from app import db
+    from availability import availability_index, has_conflict
+    from models import Booking
+
+    monkeypatch.setitem(app.config, 'AVAILABILITY_INDEX', True)
+    availability_index.clear()
+    window = (date(2032, 8, 1), date(2032, 8, 3))
+    try:
+        with app.app_context():
+            car_id, user_id = add_car(), add_user()
+            assert not has_conflict(car_id, *window)
+
+            db.session.add(Booking(user_id=user_id, car_id=car_id, start_date=datetime(2032, 8, 2),
+                                   end_date=datetime(2032, 8, 4), total_cost=100.0))
+            db.session.flush()
+            db.session.rollback()
+            assert not has_conflict(car_id, *window)
+
+            booking = Booking(user_id=user_id, car_id=car_id, start_date=datetime(2032, 8, 2),
+                              end_date=datetime(2032, 8, 4), total_cost=100.0)
+            db.session.add(booking)
+            db.session.commit()
+            assert has_conflict(car_id, *window)
+
+            booking.start_date, booking.end_date = datetime(2032, 9, 1), datetime(2032, 9, 2)
+            db.session.commit()
+            assert not has_conflict(car_id, *window)
+
+            db.session.delete(booking)
+            db.session.commit()
+            assert not has_conflict(car_id, date(2032, 9, 1), date(2032, 9, 1))
+    finally:
+        availability_index.clear()
@@ -0,0 +1,49 @@
+"""Concurrent booking, rescheduling and cancelling keeps the booking invariants.
+
+A small-scale run of benchmarks/stress_booking.py: threads contend for a
+few cars over a short window, with and without the in-memory availability
+index.
+"""
+import threading
+from collections import Counter
+
+import pytest
+
+from benchmarks import stress_booking
+
+THREADS = 6
+REQUESTS = 25
+CARS = 3
+WINDOW_DAYS = 8
+
+
+@pytest.mark.parametrize('use_index', [False, True], ids=['database', 'index'])
+def test_no_double_bookings_or_negative_balances(app, monkeypatch, use_index):
+    from availability import availability_index
+
+    monkeypatch.setitem(app.config, 'AVAILABILITY_INDEX', use_index)
+    monkeypatch.setitem(app.config, 'PAGE_CACHE_ENABLED', False)
+    availability_index.clear()
+    prefix = f'concurrency-{"index" if use_index else "db"}-'
+    emails, car_ids = stress_booking._setup(app, THREADS, CARS, prefix=prefix)
+
+    outcomes, lock = Counter(), threading.Lock()
+    threads = [
+        threading.Thread(target=stress_booking._worker, args=(
+            app, email, car_ids, REQUESTS, WINDOW_DAYS, i, outcomes, lock,
+        ))
+        for i, email in enumerate(emails)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        availability_index.clear()
+
+    assert sum(outcomes.values()) == THREADS * REQUESTS
+    assert not [key for key in outcomes if key[1].startswith('status')], outcomes
+    # The window is short enough that requests really contend for slots
+    assert outcomes[('book', 'ok')] and outcomes[('book', 'rejected')], outcomes
+    assert stress_booking.check_invariants(app, emails=emails, car_ids=car_ids) == []
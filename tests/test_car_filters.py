@@ -0,0 +1,49 @@
+"""Date-range availability filter on /cars."""
+import re
+from datetime import datetime
+
+from conftest import add_car, add_user
+from query_budget import QueryCounter
+
+CATEGORY = 'datefilter'
+
+
+def _listed(client, query):
+    response = client.get(f'/cars?category={CATEGORY}&per_page=60&{query}')
+    assert response.status_code == 200
+    return {int(car_id) for car_id in re.findall(r'href="/car/(\d+)"', response.get_data(as_text=True))}
+
+
+def test_only_cars_free_for_the_whole_range_are_listed(app):
+    from app import db
+    from models import Booking
+
+    with app.app_context():
+        user_id = add_user()
+        booked, touching, adjacent, free = (add_car(category=CATEGORY) for _ in range(4))
+        hidden = add_car(category=CATEGORY, is_available=False)
+        for car_id, start, end in (
+            (booked, datetime(2033, 3, 12), datetime(2033, 3, 14)),
+            # Ends on the first requested day: ranges are inclusive
+            (touching, datetime(2033, 3, 1), datetime(2033, 3, 10)),
+            (adjacent, datetime(2033, 3, 1), datetime(2033, 3, 9)),
+            (adjacent, datetime(2033, 3, 16), datetime(2033, 3, 20)),
+        ):
+            db.session.add(Booking(user_id=user_id, car_id=car_id, start_date=start, end_date=end, total_cost=1.0))
+        db.session.commit()
+
+    client = app.test_client()
+    assert _listed(client, '') == {booked, touching, adjacent, free, hidden}
+    with QueryCounter() as counter:
+        assert _listed(client, 'start=2033-03-10&end=2033-03-15') == {adjacent, free}
+    # Correlated anti-joins (listing and facet counts), never a check per car
+    booking_checks = [s for s in counter.statements if 'FROM booking' in s]
+    assert booking_checks and all('NOT (EXISTS' in s and 'booking.car_id = car.id' in s for s in booking_checks)
+    assert counter.count <= 5
+    assert _listed(client, 'start=2033-04-01&end=2033-04-05') == {booked, touching, adjacent, free}
+
+
+def test_invalid_range_is_ignored_with_a_warning(app):
+    response = app.test_client().get(f'/cars?category={CATEGORY}&start=2033-03-15&end=2033-03-10')
+    assert response.status_code == 200
+    assert 'Please choose a valid date range' in response.get_data(as_text=True)
@@ -0,0 +1,53 @@
+"""Responsive image markup falls back to the original while derivatives are missing."""
+import os
+
+PARTIAL = {
+    'hero': {'width': 1600, 'jpeg': 'static/uploads/derived/x-hero.jpg',
+             'webp': 'static/uploads/derived/x-hero.webp'},
+    'thumb': {'width': 320, 'jpeg': 'static/uploads/derived/x-thumb.jpg'},
+}
+
+
+def _image(app, derivatives):
+    from models import CarImage
+
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'blobs', 'ab', 'abcdef.jpg')
+    return CarImage(car_id=1, file_path=path, derivatives=derivatives)
+
+
+def test_srcset_and_derivative_url_fallbacks(app):
+    with app.test_request_context():
+        original = '/uploads/blobs/ab/abcdef.jpg'
+
+        bare = _image(app, None)
+        assert bare.srcset() == bare.srcset('webp') == ''
+        assert bare.derivative_url('card') == original
+
+        # Only some sizes encoded, and thumb only as JPEG
+        partial = _image(app, PARTIAL)
+        assert partial.srcset('jpeg') == (
+            '/static/uploads/derived/x-thumb.jpg 320w, /static/uploads/derived/x-hero.jpg 1600w'
+        )
+        assert partial.srcset('webp') == '/static/uploads/derived/x-hero.webp 1600w'
+        assert partial.derivative_url('thumb') == '/static/uploads/derived/x-thumb.jpg'
+        assert partial.derivative_url('thumb', 'webp') == original
+        assert partial.derivative_url('card') == original
+
+
+def test_image_tag_falls_back_to_the_original(app):
+    from flask import get_template_attribute
+
+    with app.test_request_context():
+        image_tag = get_template_attribute('_car_image.html', 'image_tag')
+
+        html = str(image_tag(_image(app, None), _image(app, None).file_path, 'Car'))
+        assert 'src="/uploads/blobs/ab/abcdef.jpg"' in html
+        assert 'srcset' not in html and '<picture>' not in html
+
+        # The default card size is not encoded yet
+        html = str(image_tag(_image(app, PARTIAL), None, 'Car'))
+        assert 'src="/uploads/blobs/ab/abcdef.jpg"' in html
+        assert 'srcset="/static/uploads/derived/x-hero.webp 1600w"' in html
+
+        html = str(image_tag(None, None, 'Car'))
+        assert 'car-placeholder' in html
@@ -0,0 +1,73 @@
+"""FTS5 car search: bm25 ranking, trigger-maintained index and autocomplete."""
+import re
+
+from conftest import add_car
+
+
+def _search(q):
+    import car_search
+    from models import Car
+
+    query, rank = car_search.apply_search(Car.query, q)
+    order = [rank, Car.id] if rank is not None else [Car.id]
+    return [car.id for car in query.order_by(*order)]
+
+
+def test_ranking_and_trigger_sync(app):
+    import car_search
+    from app import db
+    from models import Car
+
+    with app.app_context():
+        assert car_search.fts_enabled()
+        in_description = add_car(model='Basic', description='Trim inspired by the Zephyrion roadster')
+        in_make = add_car(make='Zephyrion', model='Quill')
+
+        # A make match outranks a mention in the description
+        assert _search('zephyrion') == [in_make, in_description]
+        assert _search('zeph qui') == [in_make]
+
+        car = db.session.get(Car, in_description)
+        car.description = 'Plain trim'
+        db.session.commit()
+        assert _search('zephyrion') == [in_make]
+
+        # Core updates (e.g. the fleet upsert) go through the triggers too
+        db.session.execute(db.update(Car).where(Car.id == in_make).values(model='Quasar'))
+        db.session.commit()
+        assert _search('quill') == [] and _search('zeph quas') == [in_make]
+
+        db.session.delete(db.session.get(Car, in_make))
+        db.session.commit()
+        assert _search('zephyrion') == [] and _search('quasar') == []
+
+
+def test_like_fallback_matches_the_same_cars(app, monkeypatch):
+    import car_search
+
+    with app.app_context():
+        ids = {add_car(make='Vortexa', model='Ember'), add_car(model='Vortexa Edition')}
+        ranked = _search('vorte')
+        monkeypatch.setattr(car_search, 'fts_enabled', lambda: False)
+        assert set(_search('vorte')) == set(ranked) == ids
+
+
+def test_suggest_and_ranked_listing(app):
+    import car_search
+
+    with app.app_context():
+        quill = [add_car(make='Xanthor', model='Quill') for _ in range(2)]
+        add_car(make='Xanthor', model='Ray')
+        add_car(model='Other', description='Xanthor fans love it')
+
+        # Most common first; descriptions never complete
+        assert car_search.suggest('xan') == ['Xanthor Quill', 'Xanthor Ray']
+        assert car_search.suggest('xanthor ra') == ['Xanthor Ray']
+        assert car_search.suggest('x') == car_search.suggest('xanthor r') == []
+        ranked = _search('xanthor quill')
+    assert ranked == quill
+
+    client = app.test_client()
+    assert client.get('/cars/suggest?q=xant').get_json() == {'suggestions': ['Xanthor Quill', 'Xanthor Ray']}
+    html = client.get('/cars?q=xanthor+quill').get_data(as_text=True)
+    assert [int(car_id) for car_id in re.findall(r'href="/car/(\d+)"', html)] == quill
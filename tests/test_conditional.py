@@ -0,0 +1,72 @@
+"""ETag revalidation of the car and catalog pages."""
+from datetime import datetime
+
+from conftest import add_car, add_user, login
+
+
+def _revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+def test_car_page_is_304_until_the_car_changes(app):
+    from models import User
+
+    with app.app_context():
+        car_id = add_car(model='Etagged')
+        admin_id = User.query.filter_by(is_admin=True).first().id
+    url = f'/car/{car_id}'
+    client = app.test_client()
+
+    first = client.get(url)
+    etag = first.headers['ETag'].strip('"')
+    assert first.status_code == 200 and 'no-cache' in first.headers['Cache-Control']
+    unchanged = _revalidate(client, url, etag)
+    assert unchanged.status_code == 304 and unchanged.data == b''
+    assert unchanged.headers['ETag'] == first.headers['ETag']
+
+    admin = login(app.test_client(), admin_id)
+    response = admin.post(f'/admin/car/{car_id}/edit', data={
+        'make': 'Testmake', 'model': 'Edited', 'year': 2022, 'category': 'sedan',
+        'daily_rate': 55, 'description': '', 'image_url': '', 'is_available': 'y',
+    })
+    assert response.status_code == 302
+
+    edited = _revalidate(client, url, etag)
+    assert edited.status_code == 200 and 'Edited' in edited.get_data(as_text=True)
+    assert edited.headers['ETag'] != first.headers['ETag']
+    assert _revalidate(client, url, edited.headers['ETag'].strip('"')).status_code == 304
+
+
+def test_image_change_moves_the_car_etag(app):
+    from app import db
+    from models import CarImage
+
+    with app.app_context():
+        car_id = add_car()
+    url = f'/car/{car_id}'
+    client = app.test_client()
+    etag = client.get(url).headers['ETag'].strip('"')
+
+    with app.app_context():
+        db.session.add(CarImage(car_id=car_id, file_path='static/img/car-placeholder.jpg', is_primary=True))
+        db.session.commit()
+    assert _revalidate(client, url, etag).status_code == 200
+
+
+def test_catalog_etag_follows_bookings_and_visitor(app):
+    from app import db
+    from models import Booking
+
+    with app.app_context():
+        user_id, car_id = add_user(), add_car()
+    client = app.test_client()
+    etag = client.get('/cars').headers['ETag'].strip('"')
+    assert _revalidate(client, '/cars', etag).status_code == 304
+    # Another visitor never gets a 304 for someone else's copy
+    assert _revalidate(login(app.test_client(), user_id), '/cars', etag).status_code == 200
+
+    with app.app_context():
+        db.session.add(Booking(user_id=user_id, car_id=car_id, start_date=datetime(2033, 1, 3),
+                               end_date=datetime(2033, 1, 5), total_cost=150.0))
+        db.session.commit()
+    assert _revalidate(client, '/cars', etag).status_code == 200
@@ -0,0 +1,67 @@
+"""Every facet count equals the length of the list that clicking it shows."""
+import re
+from datetime import datetime
+from urllib.parse import urlencode
+
+from conftest import add_car, add_user
+
+TOKEN = 'facetfixture'
+WINDOW = ('2033-04-09', '2033-04-11')
+SELECTIONS = [
+    {},
+    {'category': 'suv'},
+    {'year': '2020-2022'},
+    {'category': 'sedan', 'price': '50-80'},
+    {'category': 'economy', 'year': '2023-up', 'price': '120-up'},
+]
+
+
+def _setup():
+    from app import db
+    from models import Booking
+
+    specs = [
+        ('sedan', 2014, 30), ('sedan', 2018, 60), ('sedan', 2021, 60), ('sedan', 2024, 100),
+        ('suv', 2021, 100), ('suv', 2024, 150), ('suv', 2018, 60),
+        ('economy', 2024, 30), ('economy', 2021, 45), ('economy', 2024, 150),
+    ]
+    ids = [add_car(category=c, year=y, daily_rate=r, description=f'{TOKEN} car') for c, y, r in specs]
+    add_car(category='suv', year=2024, daily_rate=150, description=f'{TOKEN} retired', is_available=False)
+    user_id = add_user()
+    for car_id in (ids[2], ids[4]):
+        db.session.add(Booking(user_id=user_id, car_id=car_id, start_date=datetime(2033, 4, 10),
+                               end_date=datetime(2033, 4, 12), total_cost=100.0))
+    db.session.commit()
+
+
+def _listed(client, selected, window):
+    params = dict(q=TOKEN, per_page=60, **selected)
+    if window:
+        params.update(start=window[0], end=window[1])
+    html = client.get('/cars?' + urlencode(params)).get_data(as_text=True)
+    return len(set(re.findall(r'href="/car/(\d+)"', html)))
+
+
+def test_facet_counts_match_the_filtered_list(app):
+    import facets
+
+    with app.app_context():
+        _setup()
+    client = app.test_client()
+
+    for window in (None, WINDOW):
+        dates = (None, None) if window is None else tuple(datetime.strptime(d, '%Y-%m-%d') for d in window)
+        for selected in SELECTIONS:
+            with app.app_context():
+                counts = facets.facet_counts(TOKEN, *dates, selected)
+            assert counts['total'] == _listed(client, selected, window), (window, selected)
+            if not selected:
+                # Eleven cars, one retired and two booked in the window
+                assert counts['total'] == (11 if window is None else 8)
+            if window:
+                assert counts['free'] == counts['total']
+            assert counts['free'] + counts['unavailable'] == _listed(client, selected, None)
+            for dimension in facets.DIMENSIONS:
+                for key, _, count in counts[dimension]:
+                    clicked = dict(selected, **{dimension: key})
+                    assert count == _listed(client, clicked, window), (window, clicked)
@@ -0,0 +1,63 @@
+"""Fleet import/export round trips."""
+import io
+import json
+
+from exports import iter_lines, read_rows
+
+
+def _row(fleet_id, **fields):
+    row = {'fleet_id': fleet_id, 'make': 'Fleetmake', 'model': 'Roundtrip', 'year': 2021,
+           'category': 'SUV', 'daily_rate': 70.0, 'images': f'static/img/{fleet_id}-1.jpg|static/img/{fleet_id}-2.jpg'}
+    row.update(fields)
+    return row
+
+
+def _by_fleet_id(prefix):
+    from models import Car
+
+    return {car.fleet_id: car for car in Car.query.filter(Car.fleet_id.like(prefix + '%'))}
+
+
+def test_export_import_round_trip_upserts_by_fleet_id(app):
+    import fleet_cli
+    from app import db
+
+    with app.app_context():
+        messages = []
+        stats = fleet_cli.import_cars(
+            [_row('RT-1'), _row('RT-2', make=''), _row('RT-3', year='new')],
+            echo=lambda message, **kwargs: messages.append(message),
+        )
+        assert stats == {'rows': 3, 'cars': 1, 'images': 2, 'skipped': 2}
+        assert [m.split(':')[0] for m in messages if 'skipped' in m] == ['row 2', 'row 3']
+
+        for fmt in ('csv', 'jsonl'):
+            exported = [car for car in fleet_cli.iter_cars() if (car['fleet_id'] or '').startswith('RT-')]
+            text = ''.join(iter_lines(exported, fleet_cli.CAR_EXPORT_FIELDS, fmt))
+            rows = list(read_rows(io.StringIO(text), fmt))
+            for row in rows:
+                row['daily_rate'] = float(row['daily_rate']) + 5
+            stats = fleet_cli.import_cars(rows)
+            assert stats['cars'] == 1 and stats['images'] == 0 and stats['skipped'] == 0
+
+        db.session.expire_all()
+        cars = _by_fleet_id('RT-')
+        assert list(cars) == ['RT-1']
+        car = cars['RT-1']
+        assert car.daily_rate == 80.0 and car.category == 'suv'
+        assert sorted(image.file_path for image in car.images) == ['static/img/RT-1-1.jpg', 'static/img/RT-1-2.jpg']
+        assert sum(image.is_primary for image in car.images) == 1
+
+
+def test_malformed_jsonl_line_is_skipped(app, tmp_path):
+    lines = [json.dumps(_row('JL-1')), '{"fleet_id": "JL-2", "make": ', '', json.dumps(_row('JL-3')), '[1, 2]']
+    path = tmp_path / 'cars.jsonl'
+    path.write_text('\n'.join(lines) + '\n')
+
+    result = app.test_cli_runner().invoke(args=['fleet', 'import', str(path), '--chunk-size', '1'])
+
+    assert result.exit_code == 0, result.output
+    assert 'line 2: invalid JSON' in result.output
+    assert 'Imported 2 cars and 4 new image references from 4 rows (2 skipped).' in result.output
+    with app.app_context():
+        assert sorted(_by_fleet_id('JL-')) == ['JL-1', 'JL-3']
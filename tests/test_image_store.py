@@ -0,0 +1,82 @@
+"""Content-addressed image storage: dedup, reference counts, release, URLs."""
+import io
+import os
+
+from werkzeug.datastructures import FileStorage
+
+from conftest import add_car
+
+
+def _upload(data):
+    return FileStorage(stream=io.BytesIO(data), filename='car.jpg')
+
+
+def test_identical_uploads_share_one_blob(app):
+    import image_store
+    from app import db
+
+    data = os.urandom(300_000)
+    with app.app_context():
+        first = image_store.store_upload(_upload(data), 'jpg')
+        second = image_store.store_upload(_upload(data), 'jpg')
+        db.session.commit()
+
+        assert first.sha256 == second.sha256
+        assert first.file_path == second.file_path
+        assert first.ref_count == 0
+        blob_dir = os.path.join(app.config['UPLOAD_FOLDER'], image_store.BLOB_DIR)
+        # Stored inside the configured folder, with no temp files left over
+        assert os.path.abspath(first.file_path).startswith(os.path.abspath(blob_dir) + os.sep)
+        with open(first.file_path, 'rb') as f:
+            assert f.read() == data
+        assert [name for name in os.listdir(blob_dir) if name.endswith('.part')] == []
+
+
+def test_ref_count_follows_car_images_and_release(app):
+    import image_store
+    from app import db
+    from models import Car, CarImage, ImageBlob
+
+    with app.app_context():
+        blob = image_store.store_upload(_upload(os.urandom(1000)), 'png')
+        sha256, path = blob.sha256, blob.file_path
+        car_ids = [add_car(), add_car()]
+        db.session.add_all([
+            CarImage(car_id=car_id, file_path=path, content_hash=sha256) for car_id in car_ids
+        ])
+        db.session.commit()
+        assert db.session.get(ImageBlob, sha256, populate_existing=True).ref_count == 2
+
+        db.session.delete(db.session.get(Car, car_ids[0]))
+        db.session.commit()
+        assert db.session.get(ImageBlob, sha256, populate_existing=True).ref_count == 1
+        # Still referenced: kept
+        assert image_store.release_unreferenced([sha256]) == 0
+        assert os.path.exists(path)
+
+        db.session.delete(db.session.get(Car, car_ids[1]))
+        db.session.commit()
+        assert db.session.get(ImageBlob, sha256, populate_existing=True).ref_count == 0
+        assert image_store.release_unreferenced([sha256]) == 1
+        assert db.session.get(ImageBlob, sha256) is None
+        assert not os.path.exists(path)
+
+
+def test_upload_urls(app):
+    import image_store
+
+    with app.app_context():
+        blob = image_store.store_upload(_upload(b'served bytes'), 'jpg')
+        path = blob.file_path
+        with app.test_request_context():
+            url = image_store.upload_url(path)
+            assert url == f'/uploads/blobs/{blob.sha256[:2]}/{blob.sha256}.jpg'
+            # The default folder, legacy paths and external URLs
+            assert image_store.upload_url('static/uploads/abc.jpg') == '/static/uploads/abc.jpg'
+            assert image_store.upload_url('https://example.com/a.jpg') == 'https://example.com/a.jpg'
+
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.get_data() == b'served bytes'
+    assert 'immutable' in response.headers['Cache-Control']
+    response.close()
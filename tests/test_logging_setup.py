@@ -0,0 +1,27 @@
+"""Debug sampling spares loggers explicitly turned to DEBUG."""
+import logging
+
+from logging_setup import DebugSampler, _debug_overrides, _parse_levels
+
+
+def _record(name, level):
+    return logging.LogRecord(name, level, __file__, 1, 'message', None, None)
+
+
+def test_explicit_debug_loggers_are_not_sampled():
+    exempt = _debug_overrides(_parse_levels('sqlalchemy.engine=INFO, travora.pricing=debug'))
+    assert exempt == ['travora.pricing']
+    sampler = DebugSampler(0.0, exempt=exempt)
+
+    assert sampler.filter(_record('travora.pricing', logging.DEBUG))
+    assert sampler.filter(_record('travora.pricing.quotes', logging.DEBUG))
+    # Loggers that only inherit a DEBUG level are still sampled
+    assert not sampler.filter(_record('travora', logging.DEBUG))
+    assert not sampler.filter(_record('travora.pricingx', logging.DEBUG))
+    assert sampler.filter(_record('travora', logging.INFO))
+
+
+def test_sample_rate_applies_to_other_debug_records():
+    sampler = DebugSampler(1.0)
+    assert sampler.filter(_record('anything', logging.DEBUG))
+    assert not DebugSampler(0.0).filter(_record('anything', logging.DEBUG))
@@ -0,0 +1,59 @@
+"""Prometheus metrics merged across worker processes."""
+import os
+
+import metrics
+
+
+def _snapshot(key, started, requests, pool=None, pid=None):
+    return {
+        'pid': pid or os.getpid(), 'key': key, 'started': started,
+        'requests': [['cars', 'GET', '200', requests]],
+        'latency': [['cars', 'GET', [requests] + [0] * len(metrics.LATENCY_BUCKETS), 0.01 * requests, requests]],
+        'cache': {'page': [requests, 1]},
+        'pool': pool or {},
+    }
+
+
+def test_reused_pid_keeps_the_dead_workers_counters(tmp_path):
+    directory = str(tmp_path)
+    pid = os.getpid()
+    # A worker that exited, and its replacement that was given the same pid
+    metrics._write_snapshot(directory, _snapshot(f'{pid}-old', 100.0, 7, {'checkedout': 3}))
+    metrics._write_snapshot(directory, _snapshot(f'{pid}-new', 200.0, 2, {'checkedout': 1}))
+
+    merged = metrics.merge(metrics._load_snapshots(directory))
+
+    assert sorted(os.listdir(directory)) == [f'{pid}-new.json', f'{pid}-old.json']
+    assert merged['requests'][('cars', 'GET', '200')] == 9
+    assert merged['latency'][('cars', 'GET')][2] == 9
+    assert merged['cache']['page'] == [9, 2]
+    # Only the live process's pool gauges are reported
+    assert merged['pools'] == {pid: {'checkedout': 1}}
+
+
+def test_exited_processes_keep_counters_but_drop_pool_gauges():
+    # Pid far above any real pid_max: no such process
+    merged = metrics.merge([
+        _snapshot('live', 1.0, 4, {'checkedout': 2}),
+        _snapshot('gone', 1.0, 5, {'checkedout': 9}, pid=2 ** 30),
+    ])
+
+    assert merged['requests'][('cars', 'GET', '200')] == 9
+    assert list(merged['pools']) == [os.getpid()]
+
+
+def test_metrics_endpoint_merges_processes(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_DIR', str(tmp_path))
+    metrics._write_snapshot(str(tmp_path), _snapshot('other-worker', 1.0, 1000, pid=2 ** 30))
+    client = app.test_client()
+    client.get('/cars')
+
+    text = client.get('/metrics').get_data(as_text=True)
+
+    count = next(line for line in text.splitlines()
+                 if line.startswith('travora_http_requests_total{endpoint="cars",method="GET",status="200"}'))
+    assert int(count.rsplit(' ', 1)[1]) > 1000
+    for cache in ('page', 'facet', 'user'):
+        assert f'travora_cache_hits_total{{cache="{cache}"}}' in text
+    # This process wrote its own file next to the other worker's
+    assert len(os.listdir(tmp_path)) == 2
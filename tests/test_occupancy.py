@@ -0,0 +1,60 @@
+"""Occupancy bitmaps: kept by the flush listener, replaced in place by rebuild."""
+from datetime import date, datetime
+
+from conftest import add_car, add_user
+
+
+def _rows(car_id=None):
+    from models import CarOccupancy
+
+    query = CarOccupancy.query if car_id is None else CarOccupancy.query.filter_by(car_id=car_id)
+    return {(row.month, row.car_id): row.days for row in query}
+
+
+def test_listener_clears_old_months_of_an_expired_booking(app):
+    from app import db
+    from models import Booking
+
+    with app.app_context():
+        car_id, user_id = add_car(), add_user()
+        booking = Booking(user_id=user_id, car_id=car_id, start_date=datetime(2033, 8, 2),
+                          end_date=datetime(2033, 8, 4), total_cost=100.0)
+        db.session.add(booking)
+        db.session.commit()
+        assert _rows(car_id) == {(date(2033, 8, 1), car_id): 0b1110}
+
+        # The commit expired the booking; the old dates are not in memory
+        booking.start_date, booking.end_date = datetime(2033, 9, 1), datetime(2033, 9, 2)
+        db.session.commit()
+        assert _rows(car_id) == {(date(2033, 9, 1), car_id): 0b11}
+
+        db.session.delete(booking)
+        db.session.commit()
+        assert _rows(car_id) == {}
+
+
+
+def test_rebuild_never_empties_the_table(app):
+    import occupancy
+    from app import db
+    from models import Car, CarOccupancy
+
+    with app.app_context():
+        expected = _rows()
+        assert expected
+        # A wrong bitmap and a row for a car without bookings
+        wrong_key = min(expected)
+        stale_key = (date(2001, 1, 1), db.session.query(db.func.max(Car.id)).scalar() + 1000)
+        db.session.query(CarOccupancy).filter_by(month=wrong_key[0], car_id=wrong_key[1]).update(
+            {'days': expected[wrong_key] ^ 1}
+        )
+        db.session.add(CarOccupancy(month=stale_key[0], car_id=stale_key[1], days=1))
+        db.session.commit()
+
+        seen = []
+        occupancy.rebuild(chunk_size=7, echo=lambda message: seen.append(set(_rows())))
+
+        assert len(seen) > 1
+        # Every chunk boundary still has a row for every booked car-month
+        assert all(set(expected) <= keys for keys in seen)
+        assert _rows() == expected
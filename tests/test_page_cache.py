@@ -0,0 +1,47 @@
+"""Rendered catalog pages are dropped as soon as the catalog version moves."""
+from conftest import add_car, login
+
+
+def test_catalog_commit_invalidates_cached_pages(app):
+    import catalog_version
+    from app import db
+    from models import Car
+    from page_cache import page_cache
+
+    with app.app_context():
+        car_id = add_car(model='Cached')
+    client = app.test_client()
+
+    first = client.get(f'/car/{car_id}')
+    assert first.headers['X-Page-Cache'] == 'MISS' and 'Cached' in first.get_data(as_text=True)
+    assert client.get(f'/car/{car_id}').headers['X-Page-Cache'] == 'HIT'
+    version = catalog_version.current_version()
+
+    # A rolled back edit leaves the version and the cache alone
+    with app.app_context():
+        db.session.get(Car, car_id).model = 'Discarded'
+        db.session.flush()
+        db.session.rollback()
+    assert catalog_version.current_version() == version
+    assert client.get(f'/car/{car_id}').headers['X-Page-Cache'] == 'HIT'
+
+    with app.app_context():
+        db.session.get(Car, car_id).model = 'Renamed'
+        db.session.commit()
+    assert catalog_version.current_version() == version + 1
+    assert len(page_cache) == 0
+
+    response = client.get(f'/car/{car_id}')
+    body = response.get_data(as_text=True)
+    assert response.headers['X-Page-Cache'] == 'MISS'
+    assert 'Renamed' in body and 'Cached' not in body
+    assert client.get(f'/car/{car_id}').headers['X-Page-Cache'] == 'HIT'
+
+
+def test_signed_in_visitors_bypass_the_cache(app):
+    from models import User
+
+    with app.app_context():
+        user_id = User.query.filter_by(is_admin=False).first().id
+    client = login(app.test_client(), user_id)
+    assert 'X-Page-Cache' not in client.get('/cars').headers
@@ -0,0 +1,62 @@
+"""Keyset cursors walk forward and back without gaps or repeats, ties included."""
+from datetime import datetime
+
+from conftest import add_car, add_user, login
+
+TIED_CREATED_AT = datetime(2031, 2, 1, 12, 0)
+
+
+def _user_bookings():
+    from app import db
+    from models import Booking
+
+    user_id, car_id = add_user(), add_car()
+    # Five bookings share created_at, so only the id separates them
+    stamps = [datetime(2031, 2, 2)] + [TIED_CREATED_AT] * 5 + [datetime(2031, 1, 31)]
+    for n, created_at in enumerate(stamps):
+        db.session.add(Booking(user_id=user_id, car_id=car_id, start_date=datetime(2032, 3, 1 + 2 * n),
+                               end_date=datetime(2032, 3, 2 + 2 * n), total_cost=50.0, created_at=created_at))
+    db.session.commit()
+    query = Booking.query.filter_by(user_id=user_id)
+    expected = [b.id for b in query.order_by(Booking.created_at.desc(), Booking.id.desc())]
+    return user_id, query, expected
+
+
+def test_cursors_walk_forward_and_back_over_ties(app):
+    from models import Booking
+    from pagination import keyset_paginate
+
+    order_by = [(Booking.created_at, True), (Booking.id, True)]
+    with app.app_context():
+        _, query, expected = _user_bookings()
+
+        pages, cursor = [], None
+        while True:
+            page = keyset_paginate(query, order_by, after=cursor, per_page=3)
+            pages.append(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        assert [[b.id for b in page] for page in pages] == [expected[0:3], expected[3:6], expected[6:7]]
+        assert not pages[0].has_prev and all(page.has_prev for page in pages[1:])
+
+        # Back from the last page lands on the same pages
+        back = [pages[-1]]
+        while back[-1].has_prev:
+            back.append(keyset_paginate(query, order_by, before=back[-1].prev_cursor, per_page=3))
+        assert [[b.id for b in page] for page in reversed(back)] == [[b.id for b in page] for page in pages]
+        assert not back[-1].has_prev and back[-1].has_next
+
+
+def test_malformed_cursor_starts_from_the_first_page(app):
+    from models import Booking
+    from pagination import encode_cursor, keyset_paginate
+
+    order_by = [(Booking.created_at, True), (Booking.id, True)]
+    with app.app_context():
+        user_id, query, expected = _user_bookings()
+        for cursor in ('not base64!', encode_cursor([1]), encode_cursor(['x', 'y', 'z'])):
+            page = keyset_paginate(query, order_by, after=cursor, per_page=3)
+            assert [b.id for b in page] == expected[:3] and not page.has_prev
+    assert login(app.test_client(), user_id).get('/my-bookings?after=not-a-cursor').status_code == 200
+
@@ -0,0 +1,104 @@
+"""quote_many agrees with booking_total and the per-car availability check."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_user
+
+CARS = 520
+
+
+@pytest.fixture(scope='module')
+def fleet(app):
+    from app import db
+    from models import Booking, Car
+    from pricing import MAX_IN_LIST
+
+    with app.app_context():
+        cars = [
+            Car(make='Quote', model=f'Q{n}', year=2022, category='quotefixture',
+                daily_rate=round(33.33 + n * 0.17, 2), is_available=n % 50 != 49)
+            for n in range(CARS)
+        ]
+        db.session.add_all(cars)
+        db.session.commit()
+        ids = [car.id for car in cars]
+        assert len(ids) > MAX_IN_LIST
+
+        user_id = add_user()
+        bookings = [(ids[n], datetime(2033, 5, 10), datetime(2033, 5, 12)) for n in range(0, CARS, 7)]
+        # One long booking that covers many of the requested windows
+        bookings.append((ids[3], datetime(2033, 5, 1), datetime(2033, 6, 30)))
+        db.session.add_all([
+            Booking(user_id=user_id, car_id=car_id, start_date=start, end_date=end, total_cost=1.0)
+            for car_id, start, end in bookings
+        ])
+        db.session.commit()
+
+    yield ids
+
+    # Other modules share the database; leave the catalog as it was
+    with app.app_context():
+        for row in Booking.query.filter(Booking.car_id.in_(ids)).all() + Car.query.filter(Car.id.in_(ids)).all():
+            db.session.delete(row)
+        db.session.commit()
+
+
+def _windows(count):
+    first = datetime(2033, 5, 1)
+    return [(first + timedelta(days=k % 30), first + timedelta(days=k % 30 + 1 + k % 7)) for k in range(count)]
+
+
+def _check(requests):
+    from app import db
+    from availability import has_conflict_in_db
+    from models import Car
+    from pricing import booking_total, quote_many
+    from query_budget import QueryCounter
+
+    with QueryCounter() as counter:
+        quotes = quote_many(requests)
+    # Rates, then overlapping bookings, whatever the number of cars and windows
+    assert counter.count == 2
+
+    assert len(quotes) == len(requests)
+    for (car_id, start, end), quote in zip(requests, quotes):
+        car = db.session.get(Car, car_id)
+        if car is None:
+            assert quote == {'car_id': car_id, 'start_date': start.date().isoformat(),
+                             'end_date': end.date().isoformat(), 'available': False, 'reason': 'unknown car'}
+            continue
+        if start >= end:
+            assert not quote['available'] and 'total' not in quote
+            continue
+        assert quote['total'] == booking_total(car.daily_rate, start, end)
+        assert quote['available'] == (car.is_available and not has_conflict_in_db(car_id, start, end)), quote
+    return quotes
+
+
+def test_quotes_above_the_id_and_window_limits(app, fleet):
+    from pricing import MAX_WINDOWS
+
+    windows = _windows(MAX_WINDOWS + 10)
+    assert len(set(windows)) == len(windows) > MAX_WINDOWS
+    with app.app_context():
+        requests = [(car_id, *windows[n % 3]) for n, car_id in enumerate(fleet)]
+        requests += [(fleet[k % len(fleet)], *window) for k, window in enumerate(windows)]
+        requests += [(fleet[n], *window) for n in (3, 7, 49) for window in windows]
+        quotes = _check(requests)
+    # The fixture really exercises both outcomes
+    assert {quote['available'] for quote in quotes} == {True, False}
+
+
+def test_quotes_within_the_limits_and_edge_cases(app, fleet):
+    with app.app_context():
+        # Windows touching the 10-12 May bookings on either side, and one just clear
+        requests = [(fleet[7], datetime(2033, 5, d), datetime(2033, 5, d + 2)) for d in (6, 8, 12, 13)]
+        requests += [
+            (fleet[0], datetime(2033, 5, 12), datetime(2033, 5, 12)),
+            (fleet[0], datetime(2033, 5, 14), datetime(2033, 5, 13)),
+            (max(fleet) + 1000, datetime(2033, 5, 1), datetime(2033, 5, 2)),
+        ]
+        quotes = _check(requests)
+    assert [quote['available'] for quote in quotes[:4]] == [True, False, False, True]
+    assert quotes[4]['reason'] == quotes[5]['reason'] == 'end date must be after start date'
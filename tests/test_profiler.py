@@ -0,0 +1,61 @@
+"""Profiled requests leave a pstats dump and summary; only the newest are kept."""
+import json
+import os
+import pstats
+
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture
+def profile_dir(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'PROFILE_KEEP', 2)
+    return tmp_path
+
+
+def _admin(app):
+    from models import User
+
+    with app.app_context():
+        return login(app.test_client(), User.query.filter_by(is_admin=True).first().id)
+
+
+def test_profiled_request_dumps_stats_and_summary(app, profile_dir):
+    response = _admin(app).get('/cars?_profile=1')
+    name = response.headers['X-Profile']
+
+    assert 'tpl;dur=' in response.headers['Server-Timing']
+    assert pstats.Stats(str(profile_dir / f'{name}.prof')).total_calls > 0
+    summary = json.loads((profile_dir / f'{name}.json').read_text())
+    assert summary['endpoint'] == 'cars' and summary['status'] == 200
+    assert summary['statements'] > 0 and summary['top']
+    assert summary['total_ms'] >= summary['db_ms']
+
+
+def test_only_requested_or_tokened_requests_are_profiled(app, profile_dir):
+    from models import User
+    from profiler import TOKEN_HEADER, make_token
+
+    with app.app_context():
+        customer = User.query.filter_by(is_admin=False).first().id
+    assert 'X-Profile' not in login(app.test_client(), customer).get('/cars?_profile=1').headers
+    assert 'X-Profile' not in app.test_client().get('/cars', headers={TOKEN_HEADER: 'forged'}).headers
+
+    response = app.test_client().get('/cars', headers={TOKEN_HEADER: make_token(app)})
+    assert os.path.exists(profile_dir / f"{response.headers['X-Profile']}.prof")
+
+
+def test_dump_directory_keeps_the_newest(app, profile_dir):
+    from profiler import list_profiles
+
+    client = _admin(app)
+    names = [client.get(f'/cars?_profile=1&n={n}').headers['X-Profile'] for n in range(4)]
+
+    assert sorted(os.listdir(profile_dir)) == sorted(f'{name}{suffix}' for name in names[-2:]
+                                                     for suffix in ('.json', '.prof'))
+    assert [summary['name'] for summary in list_profiles(app)] == [names[3], names[2]]
+    response = client.get(f'/admin/profiles/{names[-1]}.prof')
+    assert response.status_code == 200 and response.data
+    assert client.get(f'/admin/profiles/{names[0]}.prof').status_code == 404
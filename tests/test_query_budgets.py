@@ -0,0 +1,75 @@
+"""Every route declaring @query_budget stays within it, measured cold.
+
+Caches are emptied before each request, so the counts are the worst case
+a route can hit: page, facet and user cache misses and the FTS probe.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import login
+from query_budget import check_route_budget
+
+_start = date.today() + timedelta(days=30)
+WINDOW = f'start={_start.isoformat()}&end={(_start + timedelta(days=4)).isoformat()}'
+QUOTE = {'items': [{'car_id': 1, 'start': _start.isoformat(), 'end': (_start + timedelta(days=3)).isoformat()}]}
+FLEET_QUOTE = {'ranges': [{'start': _start.isoformat(), 'end': (_start + timedelta(days=3)).isoformat()}]}
+
+# (endpoint, role, method, path, JSON body)
+CASES = [
+    ('cars', 'anon', 'GET', '/cars', None),
+    ('cars', 'anon', 'GET', '/cars?q=toyota', None),
+    ('cars', 'anon', 'GET', f'/cars?{WINDOW}', None),
+    ('cars', 'user', 'GET', f'/cars?q=toyota&{WINDOW}&category=suv&year=2020-2022&price=50-80', None),
+    ('cars', 'user', 'GET', '/cars?sort=price_low&per_page=20', None),
+    ('cars_suggest', 'anon', 'GET', '/cars/suggest?q=toy', None),
+    ('api_quotes', 'anon', 'POST', '/api/quotes', QUOTE),
+    ('api_quotes', 'admin', 'POST', '/api/quotes', FLEET_QUOTE),
+    ('my_bookings', 'user', 'GET', '/my-bookings', None),
+    ('history', 'user', 'GET', '/history', None),
+    ('admin_bookings', 'admin', 'GET', '/admin/bookings', None),
+    ('api_utilization', 'admin', 'GET', '/api/occupancy/utilization', None),
+    ('api_utilization', 'admin', 'GET', '/api/occupancy/utilization?car_id=1', None),
+    ('api_idle_cars', 'admin', 'GET', f'/api/occupancy/idle?{WINDOW}&limit=10', None),
+]
+
+
+@pytest.fixture(scope='module')
+def users(app):
+    from models import Booking, User
+
+    with app.app_context():
+        admin = User.query.filter_by(is_admin=True).first()
+        # A customer with bookings, so the lists have rows to render
+        customer = User.query.join(Booking, Booking.user_id == User.id).filter(User.is_admin.is_(False)).first()
+        return {'admin': admin.id, 'user': customer.id}
+
+
+def _empty_caches():
+    import car_search
+    import facets
+    from page_cache import page_cache
+    from user_cache import user_cache
+
+    page_cache.clear()
+    facets.facet_cache.clear()
+    user_cache.invalidate()
+    car_search._fts_ready.clear()
+
+
+def test_every_budgeted_route_is_checked(app):
+    budgeted = {
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if getattr(app.view_functions[rule.endpoint], 'query_budget', None) is not None
+    }
+    assert budgeted <= {case[0] for case in CASES}
+
+
+@pytest.mark.parametrize('endpoint, role, method, path, body', CASES, ids=[f'{c[0]}:{c[3]}' for c in CASES])
+def test_route_within_query_budget(app, users, endpoint, role, method, path, body):
+    client = app.test_client()
+    if role != 'anon':
+        login(client, users[role])
+    _empty_caches()
+    response = check_route_budget(client, path, method=method, json=body)
+    assert response.status_code == 200, response.get_data(as_text=True)[:500]
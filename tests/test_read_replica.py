@@ -0,0 +1,86 @@
+"""@read_only views read from the replica bind; every write goes to the primary."""
+import sqlite3
+
+import pytest
+from flask import g
+
+from conftest import add_car, add_user, login
+
+
+def _query(path, sql, *params):
+    with sqlite3.connect(path) as connection:
+        return connection.execute(sql, params).fetchall()
+
+
+@pytest.fixture
+def replica(app, tmp_path, monkeypatch):
+    from flask_sqlalchemy import get_state
+
+    from app import db
+    from db_config import REPLICA_BIND
+
+    with app.app_context():
+        primary = db.engine.url.database
+    path = str(tmp_path / 'replica.db')
+    source, target = sqlite3.connect(primary), sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_BINDS', {REPLICA_BIND: f'sqlite:///{path}'})
+    monkeypatch.setitem(app.config, 'PAGE_CACHE_ENABLED', False)
+    yield primary, path
+    with app.app_context():
+        db.get_engine(app, bind=REPLICA_BIND).dispose()
+    get_state(app).connectors.pop(REPLICA_BIND, None)
+
+
+def _insert_car(path, car_id, model):
+    # A row the replica has that the primary does not (or no longer) have
+    _query(path, "INSERT INTO car (id, make, model, year, category, daily_rate, is_available, updated_at) "
+                 "VALUES (?, 'Testmake', ?, 2020, 'sedan', 50, 1, '2030-01-01 00:00:00')", car_id, model)
+
+
+def test_read_only_get_is_served_by_the_replica(app, replica):
+    _, path = replica
+    with app.app_context():
+        car_id = add_car(model='OnPrimary')
+        # Exists on the primary only
+        user_id = add_user()
+    _insert_car(path, car_id, 'OnReplica')
+
+    body = app.test_client().get(f'/car/{car_id}').get_data(as_text=True)
+    assert 'OnReplica' in body and 'OnPrimary' not in body
+
+    # Views without @read_only stay on the primary, where the new user exists
+    assert login(app.test_client(), user_id).get('/my-bookings').status_code == 200
+
+
+def test_writes_during_a_read_only_request_go_to_the_primary(app, replica):
+    from app import db
+    from models import Car
+
+    primary, path = replica
+    with app.test_request_context('/cars'):
+        g._db_read_only = True
+        db.session.add(Car(make='Routed', model='Write', year=2024, category='sedan', daily_rate=10.0))
+        db.session.commit()
+        db.session.remove()
+
+    assert _query(primary, "SELECT count(*) FROM car WHERE make = 'Routed'") == [(1,)]
+    assert _query(path, "SELECT count(*) FROM car WHERE make = 'Routed'") == [(0,)]
+
+
+def test_admin_post_writes_to_the_primary(app, replica):
+    from models import User
+
+    primary, path = replica
+    with app.app_context():
+        car_id = add_car(model='Doomed')
+        admin_id = User.query.filter_by(is_admin=True).first().id
+    _insert_car(path, car_id, 'Doomed')
+
+    client = login(app.test_client(), admin_id)
+    assert client.post(f'/admin/car/{car_id}/delete').status_code == 302
+    assert _query(primary, 'SELECT count(*) FROM car WHERE id = ?', car_id) == [(0,)]
+    assert _query(path, 'SELECT count(*) FROM car WHERE id = ?', car_id) == [(1,)]
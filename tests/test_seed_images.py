@@ -0,0 +1,151 @@
+"""seed_images.py against a local http.server: retries, atomic writes, blob store."""
+import io
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import seed_images
+
+IMAGE = b'\xff\xd8' + os.urandom(200_000) + b'\xff\xd9'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.hits[self.path] += 1
+        plan = server.plans.get(self.path)
+        action = plan.pop(0) if plan else 200
+        body = server.files.get(self.path)
+        if body is None:
+            action = 404
+        if action == 'truncate':
+            # Promise the whole body, send half of it and hang up
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        if action != 200:
+            self.send_error(action)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.files, httpd.plans, httpd.hits = {}, {}, Counter()
+    httpd.url = f'http://127.0.0.1:{httpd.server_port}'
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _leftovers(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.part')]
+
+
+def test_download_retries_503(server, tmp_path):
+    server.files['/car.jpg'] = IMAGE
+    server.plans['/car.jpg'] = [503, 503]
+    dest = tmp_path / 'car.jpg'
+
+    written = seed_images.download_image(f'{server.url}/car.jpg', str(dest), backoff=0)
+
+    assert written == len(IMAGE)
+    assert dest.read_bytes() == IMAGE
+    assert server.hits['/car.jpg'] == 3
+    assert _leftovers(tmp_path) == []
+
+
+def test_download_gives_up_after_retries(server, tmp_path):
+    server.files['/car.jpg'] = IMAGE
+    server.plans['/car.jpg'] = [503] * 5
+    dest = tmp_path / 'car.jpg'
+
+    assert seed_images.download_image(f'{server.url}/car.jpg', str(dest), retries=2, backoff=0) == 0
+    assert server.hits['/car.jpg'] == 3
+    assert not dest.exists()
+    assert _leftovers(tmp_path) == []
+
+
+def test_download_does_not_retry_404(server, tmp_path):
+    dest = tmp_path / 'missing.jpg'
+
+    assert seed_images.download_image(f'{server.url}/missing.jpg', str(dest), backoff=0) == 0
+    assert server.hits['/missing.jpg'] == 1
+    assert not dest.exists()
+
+
+def test_interrupted_download_never_replaces_destination(server, tmp_path):
+    server.files['/car.jpg'] = IMAGE
+    server.plans['/car.jpg'] = ['truncate'] * 5
+    dest = tmp_path / 'car.jpg'
+    dest.write_bytes(b'previous image')
+
+    assert seed_images.download_image(f'{server.url}/car.jpg', str(dest), retries=1, backoff=0) == 0
+    assert server.hits['/car.jpg'] == 2
+    assert dest.read_bytes() == b'previous image'
+    assert _leftovers(tmp_path) == []
+
+
+def test_interrupted_download_then_complete(server, tmp_path):
+    server.files['/car.jpg'] = IMAGE
+    server.plans['/car.jpg'] = ['truncate']
+    dest = tmp_path / 'car.jpg'
+
+    assert seed_images.download_image(f'{server.url}/car.jpg', str(dest), backoff=0) == len(IMAGE)
+    assert dest.read_bytes() == IMAGE
+    assert _leftovers(tmp_path) == []
+
+
+def test_seed_car_images_uses_blob_store(app, server):
+    image_module = pytest.importorskip('PIL.Image')
+    from app import db
+    from models import Car, CarImage, ImageBlob
+
+    buffer = io.BytesIO()
+    image_module.new('RGB', (1280, 720), (40, 90, 160)).save(buffer, 'JPEG')
+    server.files['/stock.jpg'] = buffer.getvalue()
+    server.plans['/stock.jpg'] = [503]
+
+    with app.app_context():
+        cars = [
+            Car(make='Seed', model=f'Test {n}', year=2022, category='sedan', daily_rate=40.0)
+            for n in range(2)
+        ]
+        db.session.add_all(cars)
+        db.session.commit()
+        car_ids = [car.id for car in cars]
+
+        stats = seed_images.seed_car_images(
+            max_images_per_car=2, workers=2, batch_size=3,
+            url_builder=lambda car: f'{server.url}/stock.jpg',
+        )
+
+        # Other tests may leave cars without images; they are seeded too
+        assert stats['downloaded'] >= 4 and stats['failed'] == 0
+        images = CarImage.query.filter(CarImage.car_id.in_(car_ids)).all()
+        assert len(images) == 4
+        blob = db.session.get(ImageBlob, images[0].content_hash)
+        # Identical bytes are stored once and counted per referencing row
+        assert len({image.content_hash for image in images}) == 1
+        assert blob.ref_count == CarImage.query.filter_by(content_hash=blob.sha256).count() >= 4
+        assert os.path.exists(blob.file_path)
+        assert all(image.file_path == blob.file_path for image in images)
+        assert sorted(image.car_id for image in images if image.is_primary) == sorted(car_ids)
+        assert blob.derivatives and all(image.derivatives for image in images)
+        assert _leftovers(os.path.join(app.config['UPLOAD_FOLDER'], 'blobs')) == []
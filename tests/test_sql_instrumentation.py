@@ -0,0 +1,29 @@
+"""Per-request SQL statistics."""
+import pytest
+from flask import g
+from sqlalchemy.exc import OperationalError
+
+from sql_instrumentation import RequestSQLStats
+
+
+def test_failed_statements_do_not_leak_timings(app):
+    from app import db
+
+    with app.app_context(), db.engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('SELECT * FROM no_such_table')
+        g._sql_stats = stats = RequestSQLStats(keep_slowest=5)
+
+        connection.exec_driver_sql('SELECT 1').all()
+
+        assert stats.count == 1
+        assert 0 <= stats.total_ms < 1000
+        assert not connection.info.get('query_start_time')
+
+
+def test_requests_report_their_sql_in_server_timing(app):
+    response = app.test_client().get('/cars')
+
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=') and 'queries"' in timing
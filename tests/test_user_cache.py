@@ -0,0 +1,30 @@
+"""Deactivating a user takes effect through the cached user loader."""
+from conftest import login
+
+
+def test_deactivated_user_is_logged_out(app):
+    from models import Booking, User
+    from user_cache import user_cache
+
+    with app.app_context():
+        admin = User.query.filter_by(is_admin=True).first().id
+        customer = User.query.join(Booking, Booking.user_id == User.id).filter(User.is_admin.is_(False)).first().id
+
+    user_client = login(app.test_client(), customer)
+    assert user_client.get('/my-bookings').status_code == 200
+    # The snapshot is now cached; the toggle must invalidate it
+    assert user_cache.load(customer).is_active
+
+    admin_client = login(app.test_client(), admin)
+    assert admin_client.post(f'/admin/user/{customer}/toggle').status_code == 302
+    try:
+        response = user_client.get('/my-bookings')
+        assert response.status_code == 302 and '/login' in response.location
+        with app.app_context():
+            assert User.query.get(customer).active is False
+    finally:
+        admin_client.post(f'/admin/user/{customer}/toggle')
+
+    with app.app_context():
+        assert User.query.get(customer).active is True
+    assert login(app.test_client(), customer).get('/my-bookings').status_code == 200
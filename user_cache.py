@@ -0,0 +1,82 @@
+"""In-process cache behind Flask-Login's user loader.
+
+Every authenticated request used to load the full User row. The loader now
+returns a detached UserSnapshot (id, name, email, is_admin, active) kept in a small
+TTL/LRU cache, so most requests run no user query at all. Admin views that
+change, deactivate or delete a user call invalidate(); other processes see the change
+once their entry expires (USER_CACHE_TTL seconds).
+"""
+import threading
+
+from flask_login import UserMixin
+
+from app import app, db
+from models import User
+from page_cache import PageCache
+
+SNAPSHOT_FIELDS = ('id', 'name', 'email', 'is_admin', 'active')
+
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of the User fields requests and templates use."""
+
+    def __init__(self, id, name, email, is_admin, active=True):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.is_admin = bool(is_admin)
+        self.active = active is not False
+
+    @property
+    def is_active(self):
+        return self.active
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.email}>'
+
+
+class UserCache:
+    def __init__(self, maxsize, ttl):
+        self._entries = PageCache(maxsize=maxsize, ttl=ttl)
+        # Bumped by every invalidation, so a load that raced one is not stored
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        if not app.config.get('USER_CACHE_ENABLED', True):
+            return self._fetch(user_id)
+        snapshot = self._entries.get(user_id)
+        if snapshot is not None:
+            return snapshot
+        generation = self._generation
+        snapshot = self._fetch(user_id)
+        if snapshot is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries.set(user_id, snapshot)
+        return snapshot
+
+    def _fetch(self, user_id):
+        row = db.session.query(*[getattr(User, name) for name in SNAPSHOT_FIELDS]).filter(
+            User.id == user_id
+        ).first()
+        return UserSnapshot(*row) if row is not None else None
+
+    def invalidate(self, user_id=None):
+        """Forget one user (or everybody when `user_id` is None)."""
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.delete(user_id)
+
+    @property
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self._entries.hits, 'misses': self._entries.misses}
+
+
+user_cache = UserCache(
+    maxsize=app.config.get('USER_CACHE_SIZE', 4096),
+    ttl=app.config.get('USER_CACHE_TTL', 30),
+)